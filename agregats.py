@@ -0,0 +1,171 @@
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+from schemas import en_nombres, colonne_dates
+from stockage import COLONNE_ID
+
+# =========================================================
+# AGRÉGATS QUOTIDIENS / HEBDOMADAIRES DES AGENDAS
+# =========================================================
+# Les graphiques et le rapport PDF n'ont besoin que de moyennes et de totaux par jour :
+# au lieu de regrouper toutes les lignes brutes à chaque affichage, chaque (onglet, patient)
+# garde une petite table d'agrégats (une ligne par jour et par groupe), construite une fois
+# puis complétée à chaque ajout (save_data / save_rows) sans relecture.
+#
+# On garde, par colonne : nombre de valeurs, somme, min et max. Ces quatre valeurs se combinent
+# exactement (une moyenne sur une semaine ou un mois = somme des sommes / somme des nombres).
+
+# Onglet -> colonnes numériques agrégées et colonnes de regroupement (en plus du jour)
+AGREGATS = {
+    "Sommeil": {"colonnes": ["Efficacité", "Forme", "Qualité", "Latence", "Eveil"], "par": []},
+    "Activites": {"colonnes": ["Plaisir (0-10)", "Maîtrise (0-10)", "Satisfaction (0-10)"], "par": ["Activité"]},
+    "Humeur": {"colonnes": ["Humeur Globale (0-10)"], "par": []},
+    "Addictions": {"colonnes": ["Intensité", "Quantité"], "par": ["Substance", "Type"]},
+    "Compulsions": {"colonnes": ["Répétitions", "Durée (min)"], "par": []},
+}
+
+# Statistique gardée -> façon de combiner deux agrégats du même jour
+STATS = {"nb": "sum", "somme": "sum", "min": "min", "max": "max"}
+_NOMS_PANDAS = {"count": "nb", "sum": "somme", "min": "min", "max": "max"}
+
+def _stat(colonne, stat):
+    return f"{colonne}_{stat}"
+
+def agreger(nom_onglet, records):
+    """Lignes brutes (dicts ou DataFrame) -> agrégats par (Jour, groupes...), une colonne par (colonne, statistique)."""
+    config = AGREGATS[nom_onglet]
+    cles = ["Jour"] + config["par"]
+    df = pd.DataFrame(records).reset_index(drop=True)
+    if df.empty or "Date" not in df.columns:
+        return pd.DataFrame(columns=cles + [_stat(c, s) for c in config["colonnes"] for s in STATS]).set_index(cles)
+
+    valeurs = pd.DataFrame({"Jour": colonne_dates(df["Date"]).dt.normalize()})
+    for groupe in config["par"]:
+        valeurs[groupe] = df[groupe].astype(str) if groupe in df.columns else ""
+    for colonne in config["colonnes"]:
+        valeurs[colonne] = en_nombres(df[colonne]).astype(float) if colonne in df.columns else float("nan")
+
+    groupes = valeurs.dropna(subset=["Jour"]).groupby(cles, observed=True)[config["colonnes"]]
+    resultat = groupes.agg(["count", "sum", "min", "max"])
+    resultat.columns = [_stat(c, _NOMS_PANDAS[s]) for c, s in resultat.columns]
+    return resultat
+
+def combiner(*agregats):
+    """Réunit des agrégats (même onglet) : les lignes d'un même jour / groupe sont fusionnées."""
+    non_vides = [a for a in agregats if not a.empty]
+    if len(non_vides) <= 1:
+        return (non_vides or agregats)[0]
+    tous = pd.concat(non_vides)
+    regles = {colonne: STATS[colonne.rsplit("_", 1)[1]] for colonne in tous.columns}
+    return tous.groupby(level=list(range(tous.index.nlevels)), observed=True).agg(regles)
+
+def avec_moyennes(agregats, colonnes):
+    """Ajoute la moyenne de chaque colonne (nom de la colonne d'origine) et remet les clés en colonnes."""
+    df = agregats.reset_index()
+    for colonne in colonnes:
+        nb = df[_stat(colonne, "nb")]
+        df[colonne] = (df[_stat(colonne, "somme")] / nb.where(nb > 0)).astype(float)
+    return df
+
+def resumer(df_jours, par, colonnes):
+    """
+    Regroupe des lignes de jours_patient (ex: une période) par les colonnes par (liste, vide = total).
+    Les moyennes sont recalculées à partir des sommes et des nombres : pas de moyenne de moyennes.
+    """
+    stats = [_stat(c, s) for c in colonnes for s in STATS]
+    if df_jours.empty:
+        return pd.DataFrame(columns=list(par) + stats + list(colonnes))
+    regles = {colonne: STATS[colonne.rsplit("_", 1)[1]] for colonne in stats}
+    groupes = df_jours.groupby(list(par), observed=True).agg(regles) if par else pd.DataFrame([df_jours.agg(regles)])
+    return avec_moyennes(groupes, colonnes).drop(columns="index", errors="ignore")
+
+# =========================================================
+# TABLES EN MÉMOIRE
+# =========================================================
+# (onglet, patient) -> {"agregats": DataFrame indexé par (Jour, groupes), "ids": ID_Ligne déjà comptées,
+#                       "jours": DataFrame prêt (ou None), "version": entrée du cache des lectures d'origine}
+# Une table suit l'entrée du cache des lectures dont elle vient (CacheLectures.version) : quand
+# l'entrée est relue (durée de vie, écriture d'un autre processus), la table est reconstruite.
+# Les moins récemment consultées sont oubliées au-delà de TAILLE_MAX.
+TAILLE_MAX = 500
+_TABLES = OrderedDict()
+_GENERATIONS = {}  # onglet -> compteur, incrémenté à chaque écriture (garde-fou des constructions en cours)
+_VERROU = threading.Lock()
+
+def _cle(nom_onglet, patient_id):
+    return (nom_onglet, str(patient_id).strip())
+
+def _table(nom_onglet, patient_id):
+    from connect_db import get_read_cache, load_patient_rows
+
+    cle = _cle(nom_onglet, patient_id)
+    cache = get_read_cache()
+    version = cache.version(nom_onglet, patient_id)
+    with _VERROU:
+        table = _TABLES.get(cle)
+        generation = _GENERATIONS.get(nom_onglet, 0)
+        if table is not None and version is not None and table["version"] == version:
+            _TABLES.move_to_end(cle)
+            return table
+
+    lignes = load_patient_rows(nom_onglet, patient_id)
+    table = {
+        "agregats": agreger(nom_onglet, lignes), "ids": {str(l.get(COLONNE_ID, "")) for l in lignes},
+        "jours": None, "version": cache.version(nom_onglet, patient_id),
+    }
+    with _VERROU:
+        # Une écriture pendant la lecture (ou des lignes absentes du cache) : la table est servie mais pas gardée
+        if table["version"] is not None and _GENERATIONS.get(nom_onglet, 0) == generation:
+            _TABLES[cle] = table
+            _TABLES.move_to_end(cle)
+            while len(_TABLES) > TAILLE_MAX:
+                _TABLES.popitem(last=False)
+    return table
+
+def jours_patient(nom_onglet, patient_id):
+    """
+    Agrégats quotidiens d'un patient : Jour, groupes éventuels, et pour chaque colonne agrégée
+    sa moyenne (même nom que la colonne brute) et colonne_nb / _somme / _min / _max. Trié par jour.
+    """
+    table = _table(nom_onglet, patient_id)
+    if table["jours"] is None:
+        jours = avec_moyennes(table["agregats"], AGREGATS[nom_onglet]["colonnes"])
+        table["jours"] = jours.sort_values("Jour", kind="stable").reset_index(drop=True)
+    return table["jours"]
+
+def semaines_patient(nom_onglet, patient_id):
+    """Mêmes agrégats, par semaine (colonne Semaine : lundi de la semaine)."""
+    config = AGREGATS[nom_onglet]
+    jours = jours_patient(nom_onglet, patient_id)
+    if jours.empty:
+        return jours.rename(columns={"Jour": "Semaine"})
+    jours = jours.assign(Semaine=jours["Jour"] - pd.to_timedelta(jours["Jour"].dt.weekday, unit="D"))
+    return resumer(jours, ["Semaine"] + config["par"], config["colonnes"]).sort_values("Semaine", kind="stable")
+
+def ajouter(nom_onglet, records):
+    """Lignes ajoutées à l'onglet : fusionnées dans les tables déjà construites de leurs patients."""
+    par_patient = {}
+    for record in records:
+        par_patient.setdefault(_cle(nom_onglet, record.get("Patient", "")), []).append(record)
+    with _VERROU:
+        _GENERATIONS[nom_onglet] = _GENERATIONS.get(nom_onglet, 0) + 1
+        for cle, lignes in par_patient.items():
+            table = _TABLES.get(cle)
+            if table is None:
+                continue
+            # Une table construite juste après l'écriture contient déjà ces lignes : pas de double compte
+            nouvelles = [l for l in lignes if str(l.get(COLONNE_ID, "")) not in table["ids"]]
+            if nouvelles:
+                _TABLES[cle] = {
+                    "agregats": combiner(table["agregats"], agreger(nom_onglet, nouvelles)),
+                    "ids": table["ids"] | {str(l.get(COLONNE_ID, "")) for l in nouvelles}, "jours": None,
+                    "version": table["version"],  # Le cache des lectures a corrigé son entrée sur place
+                }
+
+def invalider(nom_onglet):
+    """Autre écriture (suppression, modification) : les tables de l'onglet seront reconstruites."""
+    with _VERROU:
+        _GENERATIONS[nom_onglet] = _GENERATIONS.get(nom_onglet, 0) + 1
+        for cle in [c for c in _TABLES if c[0] == nom_onglet]:
+            del _TABLES[cle]
@@ -0,0 +1,450 @@
+import itertools
+import threading
+import time
+
+from cache_partage import partageable
+from planificateur import PRIORITE_FOND, PRIORITE_LECTURE
+from stockage import COLONNE_ID
+
+# =========================================================
+# CACHE DES LECTURES PARTAGÉ ENTRE LES SESSIONS
+# =========================================================
+
+class AppelsEnCours:
+    """
+    Regroupe les lectures identiques lancées en même temps (20 patients qui se connectent,
+    thérapeute et patient sur le même dossier) : pour chaque clé, un seul appel part vers
+    le stockage, les autres threads attendent son résultat (ou son erreur).
+    """
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._en_cours = {}  # clé -> {"fini": Event, "resultat", "erreur"}
+        self.regroupes = 0
+
+    def reserver(self, cles):
+        """Retourne (clés à charger soi-même, {clé: appel en cours à attendre})."""
+        a_charger, a_attendre = [], {}
+        with self._verrou:
+            for cle in cles:
+                if cle in self._en_cours:
+                    a_attendre[cle] = self._en_cours[cle]
+                    self.regroupes += 1
+                else:
+                    self._en_cours[cle] = {"fini": threading.Event(), "resultat": None, "erreur": None}
+                    a_charger.append(cle)
+        return a_charger, a_attendre
+
+    def terminer(self, resultats, erreur=None):
+        """resultats : {clé: valeur} des clés réservées ; réveille les threads qui attendent."""
+        with self._verrou:
+            appels = [(self._en_cours.pop(cle), valeur) for cle, valeur in resultats.items() if cle in self._en_cours]
+        for appel, valeur in appels:
+            appel["resultat"], appel["erreur"] = valeur, erreur
+            appel["fini"].set()
+
+    @staticmethod
+    def attendre(appel):
+        appel["fini"].wait()
+        if appel["erreur"] is not None:
+            raise appel["erreur"]
+        return appel["resultat"]
+
+class CacheLectures:
+    """
+    Garde en mémoire (un cache par processus, commun à toutes les sessions) les lignes lues,
+    par (onglet, patient) ; patient None = l'onglet entier.
+
+    Les fonctions d'écriture de connect_db corrigent le cache au moment où elles écrivent :
+    une ligne ajoutée est ajoutée aux entrées concernées, une ligne supprimée / modifiée par ID
+    y est retirée / remplacée, les autres écritures effacent les entrées de l'onglet.
+    La durée de vie peut donc être longue : elle ne sert plus qu'aux modifications faites
+    ailleurs (autre processus, correction à la main dans Google Sheets).
+
+    Chaque écriture incrémente la génération de l'onglet : une lecture commencée avant
+    n'installe pas son résultat (il ne contient peut-être pas l'écriture).
+
+    Rafraîchissement en arrière-plan : un thread relit, peu avant leur expiration, les entrées
+    consultées récemment (priorité « fond » du planificateur). Une entrée expirée mais consultée
+    récemment est servie telle quelle pendant qu'elle est relue : personne n'attend Google
+    pour des données qu'il regardait il y a quelques minutes.
+
+    Plusieurs processus (optionnel) : avec un magasin partagé (voir cache_partage.py), une entrée
+    lue par un processus est déposée dans le magasin et reprise par les autres au lieu d'être
+    retéléchargée ; chaque écriture incrémente la génération commune de l'onglet, ce qui périme
+    les copies des autres processus (celles du processus qui écrit sont corrigées puis redéposées).
+    """
+    DUREE_VIE = 3600  # secondes
+    TAILLE_MAX = 5000  # entrées (onglet, patient)
+    FENETRE_RECENTE = 900   # secondes : une entrée consultée depuis moins longtemps est gardée à jour
+    PEREMPTION_MAX = 86400  # secondes : au-delà, une entrée n'est plus servie périmée
+    INTERVALLE = 15         # secondes entre deux passages du thread de rafraîchissement
+    LOT_RAFRAICHISSEMENT = 20  # entrées relues au plus par passage
+
+    def __init__(self, duree_vie=None, rafraichir=True, partage=None):
+        self.duree_vie = float(duree_vie or self.DUREE_VIE)
+        # Relecture un peu avant l'expiration : 1/5 de la durée de vie, une minute au plus
+        self.avance = min(60.0, self.duree_vie / 5)
+        self.rafraichir = rafraichir
+        self.partage = partage
+        self._verrou = threading.Lock()
+        # (onglet, patient) -> {"lignes", "lu_le", "utilise_le", "charger", "df", "gen_partagee"}
+        self._entrees = {}
+        self._generations = {}  # onglet -> compteur d'écritures
+        self._numeros = itertools.count(1)  # Numéro de chaque entrée installée (voir version)
+        self._compteurs = {
+            "trouves": 0, "manques": 0, "servis_perimes": 0, "rafraichis": 0,
+            "corrections": 0, "effacements": 0, "depuis_partage": 0,
+        }
+        self._reveil = threading.Event()
+        self._rafraichisseur = None
+        self._appels = AppelsEnCours()
+
+    @staticmethod
+    def _patient(patient_id):
+        return None if patient_id is None else str(patient_id).strip()
+
+    def _valide(self, entree):
+        return entree is not None and time.time() - entree["lu_le"] < self.duree_vie
+
+    def _servable_perimee(self, entree):
+        """Expirée, mais consultée récemment et pas trop vieille : servie pendant sa relecture."""
+        maintenant = time.time()
+        return (
+            self.rafraichir and entree is not None
+            and maintenant - entree["utilise_le"] < self.FENETRE_RECENTE
+            and maintenant - entree["lu_le"] < self.PEREMPTION_MAX
+        )
+
+    def _installer(self, nom_onglet, patient, lignes, generation, charger, utilise_le=None, lu_le=None, gen_partagee=None):
+        if self._generations.get(nom_onglet, 0) != generation:
+            return False  # Écriture pendant la lecture : résultat peut-être déjà périmé
+        cle = (nom_onglet, patient)
+        if cle not in self._entrees and len(self._entrees) >= self.TAILLE_MAX:
+            del self._entrees[next(iter(self._entrees))]
+        maintenant = time.time()
+        self._entrees[cle] = {
+            "lignes": list(lignes), "lu_le": lu_le or maintenant, "utilise_le": utilise_le or maintenant,
+            "charger": charger, "df": None, "gen_partagee": gen_partagee, "numero": next(self._numeros),
+        }
+        if self.rafraichir and self._rafraichisseur is None:
+            self._rafraichisseur = threading.Thread(target=self._boucle, daemon=True)
+            self._rafraichisseur.start()
+        return True
+
+    # --- Magasin partagé ---
+    # Ses erreurs (fichier verrouillé trop longtemps, serveur arrêté) ne bloquent jamais une lecture :
+    # le cache se comporte alors comme s'il était seul.
+
+    def _generations_partagees(self, noms_onglets):
+        """{onglet: génération commune}, {} sans magasin (ou s'il ne répond pas)."""
+        if self.partage is None:
+            return {}
+        try:
+            return self.partage.generations(noms_onglets)
+        except Exception:
+            return {}
+
+    def _a_jour(self, nom_onglet, entree, generations):
+        """L'entrée locale tient compte de toutes les écritures connues du magasin partagé."""
+        return nom_onglet not in generations or entree["gen_partagee"] == generations[nom_onglet]
+
+    def _depuis_partage(self, noms_onglets, patient, generations, age_max):
+        """{onglet: (lu_le, lignes)} déposés par un autre processus, de la bonne génération et assez récents."""
+        noms = [n for n in noms_onglets if n in generations and partageable(n)]
+        if not noms:
+            return {}
+        try:
+            trouves = self.partage.lire(noms, patient)
+        except Exception:
+            return {}
+        maintenant = time.time()
+        return {
+            nom: (lu_le, lignes) for nom, (generation, lu_le, lignes) in trouves.items()
+            if generation == generations[nom] and maintenant - lu_le < age_max
+        }
+
+    def _deposer(self, nom_onglet, patient, generations, lu_le, lignes):
+        if nom_onglet not in generations or not partageable(nom_onglet):
+            return
+        try:
+            self.partage.ecrire(nom_onglet, patient, generations[nom_onglet], lu_le, lignes)
+        except Exception:
+            pass
+
+    # --- Lecture ---
+
+    def lire(self, nom_onglet, patient_id, charger):
+        """
+        Lignes de (onglet, patient) depuis le cache, ou charger() s'il ne les a pas.
+        charger(priorite=...) : le thread de rafraîchissement le rappelle avec PRIORITE_FOND.
+        """
+        return self.lire_plusieurs(
+            [nom_onglet], patient_id, lambda noms, priorite=PRIORITE_LECTURE: {nom_onglet: charger(priorite=priorite)}
+        )[nom_onglet]
+
+    def lire_plusieurs(self, noms_onglets, patient_id, charger):
+        """
+        {onglet: lignes} ; charger(onglets manquants, priorite=...) -> {onglet: lignes} n'est appelé que
+        pour les onglets absents du cache (et du magasin partagé), en un seul appel.
+        """
+        patient = self._patient(patient_id)
+        partagees = self._generations_partagees(noms_onglets)
+        resultat, manquants, perimees = {}, [], False
+        with self._verrou:
+            maintenant = time.time()
+            for nom in noms_onglets:
+                entree = self._entrees.get((nom, patient))
+                if entree is not None and not self._a_jour(nom, entree, partagees):
+                    entree = None  # Écriture faite par un autre processus
+                if self._valide(entree) or self._servable_perimee(entree):
+                    if not self._valide(entree):
+                        perimees = True
+                        self._compteurs["servis_perimes"] += 1
+                    else:
+                        self._compteurs["trouves"] += 1
+                    entree["utilise_le"] = maintenant
+                    resultat[nom] = list(entree["lignes"])
+                else:
+                    manquants.append(nom)
+            generations = {nom: self._generations.get(nom, 0) for nom in manquants}
+        if perimees:
+            self._reveil.set()  # Relecture tout de suite, en arrière-plan
+        if not manquants:
+            return resultat
+
+        # Déjà lus par un autre processus ?
+        deposes = self._depuis_partage(manquants, patient, partagees, self.duree_vie)
+        if deposes:
+            with self._verrou:
+                for nom, (lu_le, lignes) in deposes.items():
+                    self._installer(nom, patient, lignes, generations[nom], charger, lu_le=lu_le, gen_partagee=partagees[nom])
+                    resultat[nom] = list(lignes)
+                    self._compteurs["depuis_partage"] += 1
+            manquants = [nom for nom in manquants if nom not in deposes]
+            if not manquants:
+                return resultat
+
+        # Même onglet, même patient, aucune écriture depuis : on se joint à une lecture déjà partie
+        cles = {(nom, patient, generations[nom]): nom for nom in manquants}
+        a_charger, a_attendre = self._appels.reserver(list(cles))
+        mes_onglets = [cles[cle] for cle in a_charger]
+
+        if mes_onglets:
+            with self._verrou:
+                self._compteurs["manques"] += len(mes_onglets)
+            try:
+                charges = charger(mes_onglets) or {}
+            except Exception as e:
+                self._appels.terminer({cle: None for cle in a_charger}, e)
+                raise
+            lu_le = time.time()
+            with self._verrou:
+                installes = []
+                for nom in mes_onglets:
+                    lignes = charges.get(nom) or []
+                    if self._installer(nom, patient, lignes, generations[nom], charger, lu_le=lu_le, gen_partagee=partagees.get(nom)):
+                        installes.append(nom)
+                    resultat[nom] = list(lignes)
+            self._appels.terminer({cle: resultat[cles[cle]] for cle in a_charger})
+            for nom in installes:
+                self._deposer(nom, patient, partagees, lu_le, resultat[nom])
+
+        for cle, appel in a_attendre.items():
+            resultat[cles[cle]] = list(AppelsEnCours.attendre(appel))
+        return resultat
+
+    def dataframe(self, nom_onglet, patient_id, construire):
+        """
+        DataFrame de (onglet, patient) construit une seule fois à partir des lignes en cache
+        (construire(lignes) -> DataFrame). Retourne une copie, None si l'entrée n'est pas en cache.
+        """
+        cle = (nom_onglet, self._patient(patient_id))
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if not (self._valide(entree) or self._servable_perimee(entree)):
+                return None
+            if entree["df"] is not None:
+                return entree["df"].copy()
+            lignes = list(entree["lignes"])
+        df = construire(lignes)
+        with self._verrou:
+            if self._entrees.get(cle) is entree:  # Pas corrigée entre-temps
+                entree["df"] = df
+        return df.copy()
+
+    def versions(self, noms_onglets, patient_id):
+        """
+        Pour chaque onglet : (compteur d'écritures de l'onglet, numéro de l'entrée du patient ou None).
+        Le numéro change quand l'entrée est relue ou effacée (écriture d'un autre processus comprise),
+        pas quand une écriture de ce processus la corrige sur place ; le compteur, lui, change à chaque
+        écriture de ce processus. Ce qui est calculé à partir de ces lignes peut les garder pour savoir
+        quand se recalculer (agregats.py, dossier patient de l'accueil).
+        """
+        patient = self._patient(patient_id)
+        partagees = self._generations_partagees(noms_onglets)
+        resultat = []
+        with self._verrou:
+            for nom in noms_onglets:
+                entree = self._entrees.get((nom, patient))
+                servie = (
+                    entree is not None and self._a_jour(nom, entree, partagees)
+                    and (self._valide(entree) or self._servable_perimee(entree))
+                )
+                resultat.append((self._generations.get(nom, 0), entree["numero"] if servie else None))
+        return tuple(resultat)
+
+    def version(self, nom_onglet, patient_id):
+        """Numéro de l'entrée (onglet, patient) servie par le cache (voir versions), None si elle n'y est pas."""
+        return self.versions([nom_onglet], patient_id)[0][1]
+
+    # --- Corrections après une écriture ---
+
+    def _entrees_onglet(self, nom_onglet):
+        return [(patient, entree) for (nom, patient), entree in self._entrees.items() if nom == nom_onglet]
+
+    def _ecriture(self, nom_onglet):
+        self._generations[nom_onglet] = self._generations.get(nom_onglet, 0) + 1
+        self._compteurs["corrections"] += 1
+
+    @staticmethod
+    def _du_patient(patient, record):
+        return patient is None or str(record.get("Patient", "")).strip() == patient
+
+    def ajouter(self, nom_onglet, records):
+        """Lignes ajoutées à la fin de l'onglet."""
+        with self._verrou:
+            self._ecriture(nom_onglet)
+            for patient, entree in self._entrees_onglet(nom_onglet):
+                nouvelles = [r for r in records if self._du_patient(patient, r)]
+                if nouvelles:
+                    entree["lignes"].extend(dict(r) for r in nouvelles)
+                    entree["df"] = None
+        self._publier(nom_onglet)
+
+    def supprimer_id(self, nom_onglet, id_ligne):
+        """Ligne supprimée par ID_Ligne."""
+        self.modifier_id(nom_onglet, id_ligne, None)
+
+    def modifier_id(self, nom_onglet, id_ligne, record):
+        """Ligne remplacée sur place (record None : supprimée)."""
+        id_ligne = str(id_ligne)
+        with self._verrou:
+            self._ecriture(nom_onglet)
+            for patient, entree in self._entrees_onglet(nom_onglet):
+                lignes = entree["lignes"]
+                i = next((i for i, r in enumerate(lignes) if str(r.get(COLONNE_ID)) == id_ligne), None)
+                garder = record is not None and self._du_patient(patient, record)
+                if i is not None and garder:
+                    lignes[i] = dict(record)
+                elif i is not None:
+                    del lignes[i]
+                elif garder:
+                    # La ligne arrive dans ce patient (Patient modifié) : sa place est inconnue
+                    del self._entrees[(nom_onglet, patient)]
+                    continue
+                else:
+                    continue
+                entree["df"] = None
+        self._publier(nom_onglet)
+
+    def invalider(self, nom_onglet):
+        """Oublie toutes les entrées de l'onglet (écriture dont l'effet exact n'est pas connu ici)."""
+        with self._verrou:
+            self._ecriture(nom_onglet)
+            for patient, _ in self._entrees_onglet(nom_onglet):
+                del self._entrees[(nom_onglet, patient)]
+            self._compteurs["effacements"] += 1
+        self._publier(nom_onglet)
+
+    def _publier(self, nom_onglet):
+        """Après une écriture : nouvelle génération commune, les entrées corrigées ici sont redéposées."""
+        if self.partage is None:
+            return
+        try:
+            generation = self.partage.incrementer(nom_onglet)
+        except Exception:
+            return
+        a_deposer = []
+        with self._verrou:
+            for patient, entree in self._entrees_onglet(nom_onglet):
+                if entree["gen_partagee"] == generation - 1:
+                    entree["gen_partagee"] = generation
+                    a_deposer.append((patient, entree["lu_le"], list(entree["lignes"])))
+                else:
+                    # Un autre processus a écrit entre-temps : cette copie ne contient pas son écriture
+                    del self._entrees[(nom_onglet, patient)]
+        for patient, lu_le, lignes in a_deposer:
+            self._deposer(nom_onglet, patient, {nom_onglet: generation}, lu_le, lignes)
+
+    # --- Rafraîchissement en arrière-plan ---
+
+    def _a_rafraichir(self):
+        """Entrées consultées récemment qui expirent bientôt (ou déjà), les plus anciennes d'abord."""
+        maintenant = time.time()
+        dues = [
+            (cle, entree) for cle, entree in self._entrees.items()
+            if maintenant - entree["utilise_le"] < self.FENETRE_RECENTE
+            and maintenant - entree["lu_le"] >= self.duree_vie - self.avance
+        ]
+        dues.sort(key=lambda x: x[1]["lu_le"])
+        return dues[:self.LOT_RAFRAICHISSEMENT]
+
+    def _boucle(self):
+        while True:
+            self._reveil.wait(self.INTERVALLE)
+            self._reveil.clear()
+            try:
+                self._rafraichir_dues()
+            except Exception:
+                pass  # Stockage injoignable : les entrées restent servies, nouvel essai au prochain passage
+
+    def _rafraichir_dues(self):
+        with self._verrou:
+            dues = self._a_rafraichir()
+            # Les onglets chargés ensemble (load_many) sont relus ensemble
+            groupes = {}
+            for (nom, patient), entree in dues:
+                groupe = groupes.setdefault((patient, id(entree["charger"])), {"charger": entree["charger"], "noms": []})
+                groupe["noms"].append(nom)
+            generations = {nom: self._generations.get(nom, 0) for (nom, _), _ in dues}
+
+        for (patient, _), groupe in groupes.items():
+            noms = groupe["noms"]
+            partagees = self._generations_partagees(noms)
+            # Un autre processus les a peut-être déjà relues : pas besoin de retélécharger
+            charges = {
+                nom: lignes for nom, (lu_le, lignes) in
+                self._depuis_partage(noms, patient, partagees, self.duree_vie - self.avance).items()
+            }
+            lu_le = time.time()
+            a_charger = [nom for nom in noms if nom not in charges]
+            if a_charger:
+                try:
+                    charges.update(groupe["charger"](a_charger, priorite=PRIORITE_FOND) or {})
+                except Exception:
+                    continue
+            with self._verrou:
+                installes = []
+                for nom in noms:
+                    ancienne = self._entrees.get((nom, patient))
+                    if ancienne is None or nom not in charges:
+                        continue  # Effacée par une écriture entre-temps
+                    if self._installer(
+                        nom, patient, charges[nom] or [], generations[nom], groupe["charger"],
+                        ancienne["utilise_le"], gen_partagee=partagees.get(nom)
+                    ):
+                        installes.append(nom)
+                    self._compteurs["rafraichis"] += 1
+            for nom in installes:
+                if nom in a_charger:
+                    self._deposer(nom, patient, partagees, lu_le, charges[nom] or [])
+
+    def vider(self):
+        with self._verrou:
+            for nom in {nom for nom, _ in self._entrees}:
+                self._ecriture(nom)
+            self._entrees.clear()
+
+    def metriques(self):
+        with self._verrou:
+            return {"entrees": len(self._entrees), **self._compteurs, "regroupes": self._appels.regroupes}
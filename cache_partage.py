@@ -0,0 +1,151 @@
+import json
+import sqlite3
+import threading
+
+from stockage import ONGLETS_SANS_INSTANTANE
+
+# =========================================================
+# CACHE COMMUN À PLUSIEURS PROCESSUS (OPTIONNEL)
+# =========================================================
+# Avec plusieurs processus Streamlit derrière un répartiteur, chacun aurait sa propre copie
+# des onglets et les téléchargerait lui-même. Un magasin partagé (fichier SQLite local,
+# ou serveur Redis) permet au premier processus qui lit un onglet d'en faire profiter les autres.
+#
+# Chaque onglet a une génération commune, incrémentée à chaque écriture (par n'importe quel
+# processus). Une entrée n'est valable que si elle porte la génération courante de son onglet :
+# une écriture faite ailleurs rend donc périmées les copies de tous les processus.
+
+TOUS_PATIENTS = "*"  # Clé d'une entrée « onglet entier »
+
+def _patient(patient):
+    return TOUS_PATIENTS if patient is None else str(patient)
+
+def partageable(nom_onglet):
+    """Identifiants et mots de passe : jamais copiés dans le magasin partagé."""
+    return nom_onglet not in ONGLETS_SANS_INSTANTANE
+
+class MagasinPartageSQLite:
+    """
+    Magasin partagé dans un fichier SQLite (processus d'une même machine).
+    SQLite verrouille le fichier lui-même : les incrémentations de génération sont atomiques.
+    """
+    def __init__(self, chemin="tcc_cache_partage.db"):
+        self.chemin = chemin
+        self.verrou = threading.Lock()
+        self.conn = sqlite3.connect(chemin, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # Un cache : une perte en cas de panne ne coûte qu'une relecture
+        self.conn.execute("CREATE TABLE IF NOT EXISTS generations (onglet TEXT PRIMARY KEY, generation INTEGER NOT NULL)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entrees (onglet TEXT NOT NULL, patient TEXT NOT NULL,"
+            " generation INTEGER NOT NULL, lu_le REAL NOT NULL, lignes TEXT NOT NULL, PRIMARY KEY (onglet, patient))"
+        )
+        self.conn.commit()
+
+    def generations(self, noms_onglets):
+        """{onglet: génération courante} (0 pour un onglet jamais écrit)."""
+        noms = list(noms_onglets)
+        with self.verrou:
+            lignes = self.conn.execute(
+                f"SELECT onglet, generation FROM generations WHERE onglet IN ({','.join('?' * len(noms))})", noms
+            ).fetchall() if noms else []
+        connues = dict(lignes)
+        return {nom: connues.get(nom, 0) for nom in noms}
+
+    def incrementer(self, nom_onglet):
+        """Nouvelle génération de l'onglet (retournée) ; ses entrées plus anciennes sont effacées."""
+        with self.verrou, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")  # Verrou d'écriture sur le fichier : lecture + incrément atomiques
+            self.conn.execute(
+                "INSERT INTO generations (onglet, generation) VALUES (?, 1)"
+                " ON CONFLICT(onglet) DO UPDATE SET generation = generation + 1", (nom_onglet,)
+            )
+            generation = self.conn.execute(
+                "SELECT generation FROM generations WHERE onglet = ?", (nom_onglet,)
+            ).fetchone()[0]
+            self.conn.execute("DELETE FROM entrees WHERE onglet = ? AND generation < ?", (nom_onglet, generation))
+        return generation
+
+    def lire(self, noms_onglets, patient):
+        """{onglet: (génération, lu_le, lignes)} pour les entrées présentes."""
+        noms = list(noms_onglets)
+        if not noms:
+            return {}
+        with self.verrou:
+            lignes = self.conn.execute(
+                f"SELECT onglet, generation, lu_le, lignes FROM entrees"
+                f" WHERE patient = ? AND onglet IN ({','.join('?' * len(noms))})", [_patient(patient), *noms]
+            ).fetchall()
+        return {onglet: (generation, lu_le, json.loads(texte)) for onglet, generation, lu_le, texte in lignes}
+
+    def ecrire(self, nom_onglet, patient, generation, lu_le, lignes):
+        with self.verrou, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entrees (onglet, patient, generation, lu_le, lignes) VALUES (?, ?, ?, ?, ?)",
+                (nom_onglet, _patient(patient), generation, lu_le, json.dumps(lignes, ensure_ascii=False, default=str))
+            )
+
+class MagasinPartageRedis:
+    """
+    Magasin partagé sur un serveur Redis (ou compatible : Valkey, KeyDB...), pour des processus
+    sur plusieurs machines. Nécessite le paquet redis ; sans lui, le magasin n'est pas disponible.
+    """
+    PREFIXE = "tcc:cache:"
+    DUREE_CONSERVATION = 86400  # secondes : les entrées oubliées disparaissent d'elles-mêmes
+
+    def __init__(self, url="redis://localhost:6379/0"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    @staticmethod
+    def disponible():
+        try:
+            import redis  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def _cle_generation(self, nom_onglet):
+        return f"{self.PREFIXE}gen:{nom_onglet}"
+
+    def _cle_entree(self, nom_onglet, patient):
+        return f"{self.PREFIXE}e:{nom_onglet}:{_patient(patient)}"
+
+    def generations(self, noms_onglets):
+        noms = list(noms_onglets)
+        valeurs = self.client.mget([self._cle_generation(n) for n in noms]) if noms else []
+        return {nom: int(v) if v is not None else 0 for nom, v in zip(noms, valeurs)}
+
+    def incrementer(self, nom_onglet):
+        # INCR est atomique ; les entrées des générations précédentes sont simplement ignorées
+        return int(self.client.incr(self._cle_generation(nom_onglet)))
+
+    def lire(self, noms_onglets, patient):
+        noms = list(noms_onglets)
+        valeurs = self.client.mget([self._cle_entree(n, patient) for n in noms]) if noms else []
+        resultat = {}
+        for nom, valeur in zip(noms, valeurs):
+            if valeur is not None:
+                entree = json.loads(valeur)
+                resultat[nom] = (entree["generation"], entree["lu_le"], entree["lignes"])
+        return resultat
+
+    def ecrire(self, nom_onglet, patient, generation, lu_le, lignes):
+        valeur = json.dumps({"generation": generation, "lu_le": lu_le, "lignes": lignes}, ensure_ascii=False, default=str)
+        self.client.set(self._cle_entree(nom_onglet, patient), valeur, ex=self.DUREE_CONSERVATION)
+
+def ouvrir_magasin_partage(adresse):
+    """
+    Magasin partagé décrit par une adresse, None si adresse vide :
+    "redis://hote:6379/0" (serveur Redis) ou "sqlite:///chemin/cache.db" / un simple chemin de fichier.
+    """
+    if not adresse:
+        return None
+    adresse = str(adresse)
+    if adresse.startswith(("redis://", "rediss://", "unix://")):
+        if not MagasinPartageRedis.disponible():
+            raise RuntimeError("Cache partagé Redis demandé, mais le paquet redis n'est pas installé")
+        return MagasinPartageRedis(adresse)
+    if adresse.startswith("sqlite:///"):
+        adresse = adresse[len("sqlite:///"):]
+    return MagasinPartageSQLite(adresse)
@@ -0,0 +1,134 @@
+import re
+import secrets
+import threading
+import time
+
+# =========================================================
+# INDEX DES COMPTES (CODES PATIENTS, THÉRAPEUTES, UTILISATEURS)
+# =========================================================
+# Connexion et identité d'un patient : une recherche dans un dictionnaire,
+# au lieu de relire l'onglet et de normaliser toute la colonne à chaque appel.
+
+def normaliser(valeur):
+    """Codes et identifiants patients : sans espaces autour, en majuscules."""
+    return str(valeur).strip().upper()
+
+def normaliser_strict(valeur):
+    """Identifiants des comptes professionnels : sans espaces autour, casse respectée."""
+    return str(valeur).strip()
+
+# Onglet -> {nom de l'index: (colonnes possibles, la première présente est utilisée ; normalisation)}
+INDEX_COMPTES = {
+    "Codes_Patients": {
+        "code": (("Code",), normaliser),
+        "identifiant": (("Identifiant", "Commentaire"), normaliser),
+    },
+    "Therapeutes": {"identifiant": (("Identifiant",), normaliser_strict)},
+    "Utilisateurs": {"identifiant": (("Identifiant",), normaliser_strict)},
+}
+
+class IndexComptes:
+    """
+    Un dictionnaire par (onglet, index), construit à la première recherche à partir de charger(onglet).
+
+    - connect_db le tient à jour : une ligne ajoutée (creer_compte, nouveau patient) est indexée
+      tout de suite, toute autre écriture sur l'onglet le fait reconstruire.
+    - Un code inconnu provoque au plus une reconstruction par DELAI_RECONSTRUCTION secondes
+      (compte créé depuis un autre processus), pas une par tentative de connexion.
+    - DUREE_VIE : reconstruction de sécurité (modification à la main dans Google Sheets).
+    """
+    DUREE_VIE = 600
+    DELAI_RECONSTRUCTION = 30
+
+    def __init__(self, charger):
+        self.charger = charger
+        self._verrou = threading.Lock()
+        self._onglets = {}  # onglet -> {"index": {nom: {clé: record}}, "construit_le": t}
+
+    @staticmethod
+    def _cle(record, colonnes, normalisation):
+        for colonne in colonnes:
+            if colonne in record:
+                valeur = normalisation(record[colonne])
+                return valeur or None
+        return None
+
+    def _construire(self, nom_onglet):
+        records = self.charger(nom_onglet) or []
+        index = {nom: {} for nom in INDEX_COMPTES[nom_onglet]}
+        for record in records:
+            self._indexer(nom_onglet, index, record)
+        entree = {"index": index, "construit_le": time.time()}
+        with self._verrou:
+            self._onglets[nom_onglet] = entree
+        return entree
+
+    @staticmethod
+    def _indexer(nom_onglet, index, record):
+        for nom, (colonnes, normalisation) in INDEX_COMPTES[nom_onglet].items():
+            cle = IndexComptes._cle(record, colonnes, normalisation)
+            if cle is not None:
+                index[nom].setdefault(cle, record)  # En cas de doublon, la première ligne compte (comme avant)
+
+    def chercher(self, nom_onglet, nom_index, valeur):
+        """Ligne (dict) dont la colonne indexée vaut valeur (après normalisation), None sinon."""
+        colonnes, normalisation = INDEX_COMPTES[nom_onglet][nom_index]
+        cle = normalisation(valeur)
+        with self._verrou:
+            entree = self._onglets.get(nom_onglet)
+        if entree is None or time.time() - entree["construit_le"] > self.DUREE_VIE:
+            entree = self._construire(nom_onglet)
+
+        record = entree["index"][nom_index].get(cle)
+        if record is None and time.time() - entree["construit_le"] > self.DELAI_RECONSTRUCTION:
+            record = self._construire(nom_onglet)["index"][nom_index].get(cle)
+        return dict(record) if record is not None else None
+
+    def ajouter(self, nom_onglet, record):
+        """Ligne ajoutée à l'onglet : indexée sans relecture (si l'index est déjà construit)."""
+        with self._verrou:
+            entree = self._onglets.get(nom_onglet)
+            if entree is not None:
+                self._indexer(nom_onglet, entree["index"], dict(record))
+
+    def cles(self, nom_onglet, nom_index):
+        """Toutes les valeurs (normalisées) de la colonne indexée, pour tester une disponibilité sans relecture."""
+        with self._verrou:
+            entree = self._onglets.get(nom_onglet)
+        if entree is None or time.time() - entree["construit_le"] > self.DUREE_VIE:
+            entree = self._construire(nom_onglet)
+        with self._verrou:
+            return frozenset(entree["index"][nom_index])
+
+    def invalider(self, nom_onglet):
+        with self._verrou:
+            self._onglets.pop(nom_onglet, None)
+
+# =========================================================
+# GÉNÉRATION DE CODES ET DE DOSSIERS
+# =========================================================
+
+CARACTERES_CODE = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # Sans 0/O ni 1/I : lisibles une fois imprimés
+
+def generer_code_securise(prefix="PAT", length=6):
+    """Génère un code aléatoire sécurisé (ex: PAT-X9J2M)"""
+    suffix = ''.join(secrets.choice(CARACTERES_CODE) for _ in range(length))
+    return f"{prefix}-{suffix}"
+
+def nouveaux_codes(nombre, existants, prefix="TCC", length=6):
+    """nombre codes tirés au hasard, tous différents entre eux et absents de existants (valeurs normalisées)."""
+    pris = set(existants)
+    codes = []
+    while len(codes) < nombre:
+        code = generer_code_securise(prefix, length)
+        if normaliser(code) not in pris:
+            pris.add(normaliser(code))
+            codes.append(code)
+    return codes
+
+def nouveaux_dossiers(nombre, existants, prefix="PAT"):
+    """nombre identifiants de dossier libres (PAT-058, PAT-059...), à la suite du plus grand numéro déjà pris."""
+    motif = re.compile(rf"^{re.escape(normaliser(prefix))}-(\d+)$")
+    numeros = [int(m.group(1)) for m in map(motif.match, existants) if m]
+    debut = max(numeros, default=0) + 1
+    return [f"{prefix}-{n:03d}" for n in range(debut, debut + nombre)]
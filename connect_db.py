@@ -3,7 +3,21 @@ import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime
 import json
+import os
+import threading
 import pandas as pd
+from stockage import MoteurGoogleSheets, MoteurSQLite, ENTETES_ONGLETS, en_record, nouvel_id
+from cache_lectures import CacheLectures
+from cache_partage import ouvrir_magasin_partage
+from comptes import IndexComptes, INDEX_COMPTES, normaliser, nouveaux_codes, nouveaux_dossiers
+import agregats
+from instantanes import MagasinInstantanes
+from planificateur import Planificateur, PRIORITE_ECRITURE, PRIORITE_LECTURE
+from ecriture_differee import EcritureDifferee
+from journal import (
+    Journal, OP_AJOUT, OP_SUPPRESSION_ID, OP_MODIFICATION_ID, OP_SUPPRESSION_CRITERES, OP_REMPLACEMENT
+)
+from schemas import appliquer_schema
 
 # =========================================================
 # 1. CONNEXION OPTIMISÉE (CACHE)
@@ -32,44 +46,438 @@ def get_client():
         return None
 
 # =========================================================
-# 2. FONCTIONS DE LECTURE / ECRITURE
+# 2. CHOIX DU MOTEUR DE STOCKAGE
 # =========================================================
 
-def save_data(nom_onglet, donnees_liste):
-    """Ajoute une ligne à la fin de l'onglet spécifié."""
+def _config_stockage():
+    """
+    Lit la configuration du stockage.
+    Priorité : variables d'environnement, puis section [stockage] des secrets.
+    Ex (secrets.toml) :
+        [stockage]
+        moteur = "sqlite"
+        chemin = "tcc_local.db"
+        instantanes = ".cache_tcc"   # dossier des instantanés disque (Google Sheets), "" pour désactiver
+        quota_par_minute = 60        # requêtes Google Sheets autorisées par minute
+        journal = "tcc_journal.jsonl" # journal local des écritures (Google Sheets par défaut), "" pour désactiver
+        ecriture_differee = true     # les écritures ne vont que dans le journal, envoi groupé en arrière-plan
+        cache_duree = 3600           # secondes de vie du cache des lectures (corrigé à chaque écriture)
+        cache_rafraichi = true       # relecture en arrière-plan des entrées consultées récemment
+        cache_partage = "redis://localhost:6379/0"  # cache commun à plusieurs processus (ou "tcc_cache_partage.db")
+    """
+    config = {}
+    try:
+        if "stockage" in st.secrets:
+            config = dict(st.secrets["stockage"])
+    except Exception:
+        pass  # Pas de fichier secrets (exécution locale)
+
+    if os.environ.get("TCC_STOCKAGE"):
+        config["moteur"] = os.environ["TCC_STOCKAGE"]
+    if os.environ.get("TCC_SQLITE_CHEMIN"):
+        config["chemin"] = os.environ["TCC_SQLITE_CHEMIN"]
+    if "TCC_INSTANTANES" in os.environ:
+        config["instantanes"] = os.environ["TCC_INSTANTANES"]
+    if "TCC_JOURNAL" in os.environ:
+        config["journal"] = os.environ["TCC_JOURNAL"]
+    if "TCC_CACHE_PARTAGE" in os.environ:
+        config["cache_partage"] = os.environ["TCC_CACHE_PARTAGE"]
+    if os.environ.get("TCC_CACHE_DUREE"):
+        config["cache_duree"] = os.environ["TCC_CACHE_DUREE"]
+    if os.environ.get("TCC_ECRITURE_DIFFEREE"):
+        config["ecriture_differee"] = os.environ["TCC_ECRITURE_DIFFEREE"]
+    return config
+
+@st.cache_resource(ttl=3600)
+def get_backend():
+    """Retourne le moteur de stockage actif (Google Sheets par défaut)."""
+    config = _config_stockage()
+    if str(config.get("moteur", "sheets")).lower() == "sqlite":
+        return MoteurSQLite(config.get("chemin", "tcc_local.db"))
+
     client = get_client()
-    if not client: return False
-    
+    if not client: return None
+
+    # Instantanés disque : après un redémarrage, les pages s'affichent sans attendre Google
+    dossier = config.get("instantanes", ".cache_tcc")
+    instantanes = MagasinInstantanes(dossier) if dossier and MagasinInstantanes.disponible() else None
+    # Tous les appels passent par un seul planificateur, réglé sur le quota Google
+    planificateur = Planificateur(config.get("quota_par_minute"))
+    return MoteurGoogleSheets(client, instantanes=instantanes, planificateur=planificateur)
+
+def _appeler(backend, priorite, action, idempotent=True):
+    """Exécute action() via le planificateur du moteur (file, quota, nouvel essai sur 429 / 5xx)."""
+    if backend.planificateur is None:
+        return action()
+    return backend.planificateur.executer(action, priorite, idempotent)
+
+@st.cache_resource
+def get_journal():
+    """
+    Journal local des écritures (un par processus), None s'il est désactivé.
+    Activé par défaut avec Google Sheets ; SQLite valide déjà chaque écriture sur le disque.
+    """
+    config = _config_stockage()
+    backend = get_backend()
+    if not backend: return None
+    chemin = config.get("journal", "tcc_journal.jsonl" if backend.nom == "sheets" else "")
+    if not chemin:
+        return None
     try:
-        sheet = client.open("TCC_Base_Donnees")
+        return Journal(
+            backend, chemin,
+            executer=lambda action, idempotent=True: _appeler(backend, PRIORITE_ECRITURE, action, idempotent)
+        )
+    except RuntimeError:
+        return None  # Journal déjà ouvert par un autre processus : écritures directes
+
+@st.cache_resource
+def get_ecriture_differee():
+    """Écriture différée au-dessus du journal (ecriture_differee.py), None si elle n'est pas activée."""
+    journal = get_journal()
+    if not journal:
+        return None
+    if str(_config_stockage().get("ecriture_differee", "")).lower() not in ("1", "true", "oui", "yes"):
+        return None
+    return EcritureDifferee(journal)
+
+@st.cache_resource
+def get_read_cache():
+    """
+    Cache des lectures commun à toutes les sessions du processus,
+    et à tous les processus si un magasin partagé est configuré (cache_partage).
+    """
+    config = _config_stockage()
+    rafraichir = str(config.get("cache_rafraichi", "true")).lower() not in ("0", "false", "non", "no")
+    try:
+        partage = ouvrir_magasin_partage(config.get("cache_partage"))
+    except Exception as e:
+        st.warning(f"Cache partagé indisponible, cache local seulement : {e}")
+        partage = None
+    return CacheLectures(config.get("cache_duree"), rafraichir, partage)
+
+def _muter(op, nom_onglet, direct, message_erreur, corriger=None, **champs):
+    """
+    Passe une écriture par le journal : inscrite sur le disque, puis appliquée au stockage.
+    Sans journal, direct(backend) est appelé tel quel.
+    corriger(resultat) met à jour le cache des lectures une fois l'écriture acceptée
+    (par défaut : les entrées de l'onglet sont effacées).
+    Retourne le résultat de l'écriture (l'ID_Ligne pour un ajout), False en cas d'échec.
+    """
+    corriger = corriger or (lambda resultat: get_read_cache().invalider(nom_onglet))
+    resultat = _muter_stockage(op, nom_onglet, direct, message_erreur, **champs)
+    if resultat is not False:
+        corriger(resultat)
+        ajoutees = [en_record(nom_onglet, champs["valeurs"], resultat)] if op == OP_AJOUT else None
+        if nom_onglet in INDEX_COMPTES:
+            _corriger_comptes(nom_onglet, ajoutees)
+        if nom_onglet in agregats.AGREGATS:
+            _corriger_agregats(nom_onglet, ajoutees)
+    return resultat
+
+def _corriger_comptes(nom_onglet, records=None):
+    """Lignes ajoutées : indexées tout de suite ; autre écriture (records None) : index reconstruit."""
+    index = get_account_index()
+    if records is None:
+        index.invalider(nom_onglet)
+    for record in records or []:
+        index.ajouter(nom_onglet, record)
+
+def _corriger_agregats(nom_onglet, records=None):
+    """Lignes ajoutées : fusionnées dans les agrégats quotidiens ; autre écriture : agrégats reconstruits."""
+    if records is None:
+        agregats.invalider(nom_onglet)
+    else:
+        agregats.ajouter(nom_onglet, records)
+
+def _muter_stockage(op, nom_onglet, direct, message_erreur, **champs):
+    journal = get_journal()
+    if not journal:
+        backend = get_backend()
+        if not backend: return False
         try:
-            worksheet = sheet.worksheet(nom_onglet)
-        except:
-            # Création de l'onglet s'il n'existe pas
-            worksheet = sheet.add_worksheet(title=nom_onglet, rows=100, cols=20)
-        
-        worksheet.append_row(donnees_liste)
-        return True
+            return direct(backend)
+        except Exception as e:
+            st.error(f"{message_erreur} : {e}")
+            return False
+
+    # Résultat connu d'avance : l'ID_Ligne pour un ajout ou un upsert (attribué ici), True sinon
+    avec_id = op in (OP_AJOUT, OP_REMPLACEMENT)
+    if avec_id:
+        champs.setdefault("id", nouvel_id())
+    provisoire = champs["id"] if avec_id else True
+    differee = get_ecriture_differee()
+    try:
+        n = (differee or journal).enregistrer(op, nom_onglet, **champs)
+    except Exception as e:
+        st.error(f"{message_erreur} : {e}")
+        return False
+    if differee:
+        return provisoire
+
+    try:
+        resultat = journal.appliquer_jusqua(n)
+    except Exception as e:
+        if journal.abandonnee(n):
+            st.error(f"{message_erreur} : {e}")
+            return False
+        st.warning("Google Sheets ne répond pas : la saisie est gardée et sera envoyée automatiquement.")
+        return provisoire
+    return provisoire if avec_id else resultat
+
+def _avec_en_attente(nom_onglet, records, patient_id=None):
+    """Lignes lues, corrigées des écritures du journal pas encore appliquées au stockage."""
+    journal = get_journal()
+    if not journal:
+        return records
+    return journal.appliquer_en_attente(nom_onglet, records, patient_id)
+
+def save_status(id_ligne):
+    """
+    État d'une ligne enregistrée par save_data via le journal :
+    {"statut": "en_attente" | "envoi" | "envoye" | "abandon", "essais", "erreur"}. None : pas de journal ou ligne ancienne.
+    """
+    journal = get_journal()
+    return journal.statut(id_ligne) if journal else None
+
+def journal_stats():
+    """Opérations du journal pas encore appliquées, abandons et âge de la plus ancienne, None sans journal."""
+    journal = get_journal()
+    return journal.metriques() if journal else None
+
+def cache_stats():
+    """Entrées du cache des lectures, lectures servies / manquées, corrections faites par les écritures."""
+    return get_read_cache().metriques()
+
+def scheduler_stats():
+    """Métriques du planificateur (profondeur de file par priorité, jetons, essais), None s'il n'y en a pas."""
+    backend = get_backend()
+    if not backend or backend.planificateur is None: return None
+    return backend.planificateur.metriques()
+
+# =========================================================
+# 3. FONCTIONS DE LECTURE / ECRITURE
+# =========================================================
+
+def save_data(nom_onglet, donnees_liste):
+    """
+    Ajoute une ligne à la fin de l'onglet spécifié.
+    Retourne l'ID_Ligne de la nouvelle ligne (à garder pour la modifier / supprimer), False en cas d'échec.
+    """
+    valeurs = list(donnees_liste)
+    return _muter(
+        OP_AJOUT, nom_onglet,
+        # Un ajout n'est pas rejoué sur une erreur 5xx (il a pu être fait : doublon)
+        lambda backend: _appeler(backend, PRIORITE_ECRITURE, lambda: backend.ajouter_ligne(nom_onglet, valeurs), idempotent=False),
+        "Erreur sauvegarde",
+        corriger=lambda id_ligne: get_read_cache().ajouter(nom_onglet, [en_record(nom_onglet, valeurs, id_ligne)]),
+        valeurs=valeurs
+    )
+
+def save_rows(nom_onglet, lignes):
+    """
+    Ajoute plusieurs lignes à la fin de l'onglet en une seule écriture (un append_rows).
+    Retourne la liste de leurs ID_Ligne, False en cas d'échec.
+    """
+    lignes = [list(l) for l in lignes]
+    if not lignes: return []
+
+    ids = _ajouter_plusieurs(nom_onglet, lignes)
+    if ids is not False:
+        records = [en_record(nom_onglet, l, i) for l, i in zip(lignes, ids)]
+        get_read_cache().ajouter(nom_onglet, records)
+        if nom_onglet in INDEX_COMPTES:
+            _corriger_comptes(nom_onglet, records)
+        if nom_onglet in agregats.AGREGATS:
+            _corriger_agregats(nom_onglet, records)
+    return ids
+
+def _ajouter_plusieurs(nom_onglet, lignes):
+    journal = get_journal()
+    if not journal:
+        backend = get_backend()
+        if not backend: return False
+        try:
+            return _appeler(backend, PRIORITE_ECRITURE, lambda: backend.ajouter_lignes(nom_onglet, lignes), idempotent=False)
+        except Exception as e:
+            st.error(f"Erreur sauvegarde : {e}")
+            return False
+
+    ids = [nouvel_id() for _ in lignes]
+    differee = get_ecriture_differee()
+    try:
+        # Toutes les lignes inscrites ensemble : un seul passage sur le disque pour le lot
+        numeros = (differee or journal).enregistrer_plusieurs(
+            OP_AJOUT, nom_onglet, [{"id": i, "valeurs": l} for i, l in zip(ids, lignes)]
+        )
     except Exception as e:
         st.error(f"Erreur sauvegarde : {e}")
         return False
+    if differee:
+        return ids
+
+    try:
+        # Les ajouts consécutifs au même onglet partent ensemble
+        journal.appliquer_jusqua(numeros[-1])
+    except Exception as e:
+        if any(journal.abandonnee(n) for n in numeros):
+            st.error(f"Erreur sauvegarde : {e}")
+            return False
+        st.warning("Google Sheets ne répond pas : la saisie est gardée et sera envoyée automatiquement.")
+    return ids
+
+def load_data(nom_onglet, erreurs=False, frais=False):
+    """
+    Récupère toutes les données d'un onglet.
+    erreurs / frais : comme pour load_patient_rows (lever l'erreur, ne pas passer par le cache des lectures).
+    """
+    backend = get_backend()
+    if not backend:
+        if erreurs: raise RuntimeError("Stockage indisponible")
+        return []
+
+    def charger(priorite=PRIORITE_LECTURE):
+        return _appeler(backend, priorite, lambda: backend.lire_onglet(nom_onglet))
 
-def load_data(nom_onglet):
-    """Récupère toutes les données d'un onglet."""
-    client = get_client()
-    if not client: return []
-    
     try:
-        sheet = client.open("TCC_Base_Donnees")
-        ws = sheet.worksheet(nom_onglet)
-        return ws.get_all_records()
+        lignes = charger() if frais else get_read_cache().lire(nom_onglet, None, charger)
+        return _avec_en_attente(nom_onglet, lignes)
     except:
+        if erreurs: raise
+        return []
+
+def load_patient_rows(nom_onglet, patient_id, erreurs=False, frais=False):
+    """
+    Récupère uniquement les lignes d'un patient.
+    Le filtre est fait par le moteur (index), pas après un téléchargement complet de l'onglet.
+    erreurs=True : une lecture impossible lève l'exception au lieu de donner une liste vide
+    (pour ne pas prendre une panne pour un dossier vide).
+    frais=True : lu directement dans le stockage, sans passer par le cache des lectures.
+    """
+    backend = get_backend()
+    if not backend:
+        if erreurs: raise RuntimeError("Stockage indisponible")
         return []
 
+    def charger(priorite=PRIORITE_LECTURE):
+        return _appeler(backend, priorite, lambda: backend.lire_lignes_patient(nom_onglet, patient_id))
+
+    try:
+        lignes = charger() if frais else get_read_cache().lire(nom_onglet, patient_id, charger)
+        return _avec_en_attente(nom_onglet, lignes, patient_id)
+    except:
+        if erreurs: raise
+        return []
+
+def load_many(tabs, patient_id, erreurs=False):
+    """
+    Charge les lignes d'un patient dans plusieurs onglets en un seul aller-retour.
+    Retourne {onglet: DataFrame} ; un onglet vide ou absent donne un DataFrame vide
+    avec les colonnes connues de l'onglet.
+    Seuls les onglets absents du cache des lectures sont demandés au stockage.
+    erreurs=True : une lecture impossible lève l'exception (comme load_patient_rows).
+    """
+    tabs = list(dict.fromkeys(tabs))  # Sans doublons, ordre conservé
+    resultats = {}
+    cache = get_read_cache()
+    backend = get_backend()
+    if not backend and erreurs:
+        raise RuntimeError("Stockage indisponible")
+    if backend:
+        try:
+            resultats = cache.lire_plusieurs(
+                tabs, patient_id,
+                lambda manquants, priorite=PRIORITE_LECTURE: _appeler(
+                    backend, priorite, lambda: backend.lire_plusieurs(manquants, patient_id)
+                )
+            )
+        except:
+            if erreurs: raise
+            resultats = {}
+
+    def construire(nom, lignes):
+        return appliquer_schema(nom, pd.DataFrame(lignes)) if lignes else pd.DataFrame(columns=ENTETES_ONGLETS.get(nom, []))
+
+    journal = get_journal()
+    dfs = {}
+    for nom in tabs:
+        df = None
+        if not (journal and journal.a_des_operations(nom)):
+            # DataFrame typé une seule fois par entrée du cache (refait après une écriture)
+            df = cache.dataframe(nom, patient_id, lambda lignes: construire(nom, lignes))
+        if df is None:
+            df = construire(nom, _avec_en_attente(nom, resultats.get(nom) or [], patient_id))
+        dfs[nom] = df
+    return dfs
+
 # =========================================================
-# 3. GESTION DES UTILISATEURS
+# 4. GESTION DES UTILISATEURS
 # =========================================================
 
+@st.cache_resource
+def get_account_index():
+    """
+    Index des comptes (codes patients, thérapeutes, utilisateurs), commun à toutes les sessions.
+    Il relit lui-même le stockage (DUREE_VIE, DELAI_RECONSTRUCTION) : pas de passage par le cache des lectures,
+    dont la durée de vie est bien plus longue. Une lecture impossible lève l'erreur (rien n'est indexé).
+    """
+    return IndexComptes(lambda nom_onglet: load_data(nom_onglet, erreurs=True, frais=True))
+
+def chercher_code_patient(code):
+    """Ligne de Codes_Patients pour ce code d'accès (casse et espaces ignorés), None s'il est inconnu."""
+    try:
+        return get_account_index().chercher("Codes_Patients", "code", code)
+    except:
+        return None
+
+def chercher_patient(identifiant):
+    """Ligne de Codes_Patients pour cet identifiant de dossier (ex: PAT-001), None s'il est inconnu."""
+    try:
+        return get_account_index().chercher("Codes_Patients", "identifiant", identifiant)
+    except:
+        return None
+
+def chercher_therapeute(identifiant):
+    """Ligne de Therapeutes pour cet identifiant, None s'il est inconnu."""
+    try:
+        return get_account_index().chercher("Therapeutes", "identifiant", identifiant)
+    except:
+        return None
+
+_VERROU_CREATION = threading.Lock()  # Deux créations simultanées ne tirent pas les mêmes numéros de dossier
+
+def creer_patients(therapeute_id, nombre, identifiants=None):
+    """
+    Crée nombre dossiers patients pour ce thérapeute en une seule écriture dans Codes_Patients.
+    Codes d'accès et identifiants sont vérifiés dans l'index des comptes (pas de doublon) ;
+    identifiants : noms de dossier imposés (sinon PAT-xxx à la suite des existants).
+    Retourne la liste des lignes créées (Code, Therapeute_ID, Identifiant, Date_Creation), False en cas d'échec.
+    """
+    index = get_account_index()
+    with _VERROU_CREATION:
+        try:
+            codes_pris = index.cles("Codes_Patients", "code")
+            dossiers_pris = index.cles("Codes_Patients", "identifiant")
+        except Exception as e:
+            st.error(f"Erreur lecture des codes existants : {e}")
+            return False
+
+        if identifiants is None:
+            identifiants = nouveaux_dossiers(nombre, dossiers_pris)
+        deja_pris = [i for i in identifiants if normaliser(i) in dossiers_pris]
+        if deja_pris or len({normaliser(i) for i in identifiants}) < len(identifiants):
+            st.error(f"Dossier déjà existant : {', '.join(deja_pris) or 'identifiant en double'}")
+            return False
+
+        date = str(datetime.now().date())
+        lignes = [[code, therapeute_id, identifiant, date]
+                  for code, identifiant in zip(nouveaux_codes(len(identifiants), codes_pris), identifiants)]
+        # save_rows indexe les nouvelles lignes : la création suivante les voit déjà
+        ids = save_rows("Codes_Patients", lignes)
+        if ids is False:
+            return False
+    return [en_record("Codes_Patients", l, i) for l, i in zip(lignes, ids)]
+
 def charger_utilisateurs():
     """Récupère la liste de tous les utilisateurs inscrits"""
     return load_data("Utilisateurs")
@@ -81,49 +489,55 @@ def creer_compte(identifiant, mot_de_passe):
     return save_data("Utilisateurs", row)
 
 # =========================================================
-# 4. SUPPRESSION (LOGIQUE CORRIGÉE)
+# 5. SUPPRESSION (LOGIQUE CORRIGÉE)
 # =========================================================
 
 def delete_data_flexible(nom_onglet, criteres_dict):
     """
     Supprime une ligne spécifique selon des critères.
-    Optimisé pour trouver l'index sans tout recharger.
+    La recherche de la ligne est déléguée au moteur de stockage.
     """
-    client = get_client()
-    if not client: return False
+    return _muter(
+        OP_SUPPRESSION_CRITERES, nom_onglet,
+        # Rejouée après un 5xx, la suppression pourrait viser une autre ligne qui respecte les critères
+        lambda backend: _appeler(backend, PRIORITE_ECRITURE, lambda: backend.supprimer_ligne(nom_onglet, criteres_dict), idempotent=False),
+        "Erreur suppression", criteres=dict(criteres_dict)
+    )
 
-    try:
-        sheet = client.open("TCC_Base_Donnees")
-        ws = sheet.worksheet(nom_onglet)
-        
-        # On récupère tout pour chercher l'index
-        records = ws.get_all_records()
-        
-        row_index_to_delete = None
-        
-        # i commence à 0, mais dans GSheet ligne 1 = Headers. 
-        # Donc la donnée 0 est à la ligne 2.
-        for i, row in enumerate(records):
-            match = True
-            for key, val in criteres_dict.items():
-                # Comparaison en string pour éviter erreurs de type
-                if str(row.get(key)) != str(val):
-                    match = False
-                    break
-            
-            if match:
-                row_index_to_delete = i + 2
-                break 
-        
-        if row_index_to_delete:
-            ws.delete_rows(row_index_to_delete)
-            return True
-        else:
-            return False
-            
-    except Exception as e:
-        st.error(f"Erreur suppression : {e}")
-        return False
+def delete_by_id(nom_onglet, id_ligne):
+    """Supprime la ligne portant cet ID_Ligne, sans relire l'onglet."""
+    return _muter(
+        OP_SUPPRESSION_ID, nom_onglet,
+        lambda backend: _appeler(backend, PRIORITE_ECRITURE, lambda: backend.supprimer_par_id(nom_onglet, id_ligne)),
+        "Erreur suppression",
+        corriger=lambda resultat: get_read_cache().supprimer_id(nom_onglet, id_ligne),
+        id=str(id_ligne)
+    )
+
+def update_by_id(nom_onglet, id_ligne, donnees_liste):
+    """Remplace sur place la ligne portant cet ID_Ligne (même ordre de valeurs que save_data)."""
+    valeurs = list(donnees_liste)
+    return _muter(
+        OP_MODIFICATION_ID, nom_onglet,
+        lambda backend: _appeler(backend, PRIORITE_ECRITURE, lambda: backend.modifier_par_id(nom_onglet, id_ligne, valeurs)),
+        "Erreur modification",
+        corriger=lambda resultat: get_read_cache().modifier_id(nom_onglet, id_ligne, en_record(nom_onglet, valeurs, str(id_ligne))),
+        id=str(id_ligne), valeurs=valeurs
+    )
+
+def upsert(nom_onglet, key_cols, donnees_liste):
+    """
+    Met à jour sur place la ligne qui a les mêmes valeurs sur key_cols (ex: ["Patient"]),
+    ou l'ajoute si elle n'existe pas. Une seule écriture, pas de moment où la ligne a disparu.
+    Retourne l'ID_Ligne de la ligne, False en cas d'échec.
+    """
+    cles, valeurs = list(key_cols), list(donnees_liste)
+    id_ligne = nouvel_id()  # Connu avant l'écriture : retourné aussi en écriture différée, comme pour save_data
+    return _muter(
+        OP_REMPLACEMENT, nom_onglet,
+        lambda backend: _appeler(backend, PRIORITE_ECRITURE, lambda: backend.remplacer_ou_ajouter(nom_onglet, cles, valeurs, id_ligne)),
+        "Erreur sauvegarde", cles=cles, valeurs=valeurs, id=id_ligne
+    )
 
 def supprimer_reponse(patient_id, timestamp, type_exo):
     """
@@ -144,7 +558,7 @@ def supprimer_reponse(patient_id, timestamp, type_exo):
     return delete_data_flexible("Reponses_Hebdo", criteres)
 
 # =========================================================
-# 5. SAUVEGARDE SPÉCIFIQUE
+# 6. SAUVEGARDE SPÉCIFIQUE
 # =========================================================
 
 def sauvegarder_reponse_hebdo(patient_id, nom_questionnaire, score_global, details_dict):
@@ -0,0 +1,45 @@
+import threading
+import time
+
+# =========================================================
+# ÉCRITURE DIFFÉRÉE (OPTIONNELLE) AU-DESSUS DU JOURNAL
+# =========================================================
+# Sans elle, chaque écriture est inscrite dans le journal (journal.py) puis envoyée tout de suite,
+# l'appelant attendant la réponse du stockage. Avec elle, les fonctions d'écriture de connect_db
+# rendent la main dès que l'opération est sur le disque : un thread envoie ensuite les opérations
+# en attente, les ajouts consécutifs d'un même onglet en un seul append_rows.
+# Le journal reste le seul magasin local : rejeu au démarrage, vérification par ID_Ligne avant
+# un nouvel envoi, statuts (save_status) et lectures corrigées des lignes pas encore envoyées.
+
+class EcritureDifferee:
+    """
+    N'envoie rien elle-même : inscrit dans le journal, puis réveille son thread qui demande
+    au journal d'appliquer tout ce qui attend (journal.rejouer), dans l'ordre du journal.
+    """
+    DELAI_REGROUPEMENT = 0.5  # secondes : les saisies rapprochées partent dans le même lot
+    INTERVALLE = 5            # secondes entre deux passages du thread (nouveaux essais)
+
+    def __init__(self, journal):
+        self.journal = journal
+        self._reveil = threading.Event()
+        threading.Thread(target=self._boucle, daemon=True).start()
+        self._reveil.set()  # Opérations restées dans le journal au démarrage
+
+    def enregistrer(self, op, nom_onglet, **champs):
+        """Inscrit l'opération dans le journal (sur le disque au retour) et retourne son numéro, sans l'envoyer."""
+        n = self.journal.enregistrer(op, nom_onglet, **champs)
+        self._reveil.set()
+        return n
+
+    def enregistrer_plusieurs(self, op, nom_onglet, liste_champs):
+        """Comme enregistrer, pour un lot (un seul fsync)."""
+        numeros = self.journal.enregistrer_plusieurs(op, nom_onglet, liste_champs)
+        self._reveil.set()
+        return numeros
+
+    def _boucle(self):
+        while True:
+            self._reveil.wait(self.INTERVALLE)
+            self._reveil.clear()
+            time.sleep(self.DELAI_REGROUPEMENT)
+            self.journal.rejouer()
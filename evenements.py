@@ -0,0 +1,240 @@
+import copy
+import json
+import threading
+from datetime import datetime
+
+from stockage import COLONNE_ID
+
+# =========================================================
+# SUIVI DU PROTOCOLE EN ÉVÉNEMENTS
+# =========================================================
+# Progression, outils autorisés, validation, devoirs et notes de séance ne sont plus
+# une ligne par patient réécrite à chaque clic : chaque action du thérapeute ajoute
+# un événement (une ligne) à l'onglet Evenements_Suivi.
+# L'état d'un patient est rejoué à partir de son dernier point de contrôle,
+# et gardé en mémoire : seuls les événements nouveaux sont appliqués à la lecture suivante.
+
+ONGLET_EVENEMENTS = "Evenements_Suivi"
+
+EV_MODULE_DEBLOQUE = "module_debloque"          # Cle = code du module
+EV_MODULE_BLOQUE = "module_bloque"
+EV_OUTIL_AUTORISE = "outil_autorise"            # Cle = clé de l'outil (ex: "sommeil")
+EV_OUTIL_RETIRE = "outil_retire"
+EV_MODULE_VALIDE = "module_valide"              # Cle = code du module
+EV_MODULE_INVALIDE = "module_invalide"
+EV_COMMENTAIRE_MODIFIE = "commentaire_modifie"  # Cle = module, Valeur = texte
+EV_DEVOIRS_MODIFIES = "devoirs_modifies"        # Cle = module, Valeur = indices exclus (JSON)
+EV_NOTE_MODIFIEE = "note_modifiee"              # Cle = module, Valeur = texte
+EV_POINT_CONTROLE = "point_controle"            # Valeur = état complet (JSON)
+
+# Événements qui ajoutent / retirent un élément d'une liste de l'état
+_LISTES = {
+    EV_MODULE_DEBLOQUE: ("progression", True), EV_MODULE_BLOQUE: ("progression", False),
+    EV_OUTIL_AUTORISE: ("outils", True), EV_OUTIL_RETIRE: ("outils", False),
+    EV_MODULE_VALIDE: ("valides", True), EV_MODULE_INVALIDE: ("valides", False),
+}
+# Événements qui remplacent la valeur d'une clé dans un dictionnaire de l'état
+_DICTIONNAIRES = {
+    EV_COMMENTAIRE_MODIFIE: "commentaires",
+    EV_DEVOIRS_MODIFIES: "devoirs",
+    EV_NOTE_MODIFIEE: "notes",
+}
+
+POINT_CONTROLE_TOUS = 50  # Événements d'un patient entre deux points de contrôle
+
+def etat_vide():
+    """État d'un patient sans aucun historique (seule l'intro est débloquée, aucun outil)."""
+    return {"progression": ["intro"], "outils": [], "valides": [], "commentaires": {}, "devoirs": {}, "notes": {}}
+
+# =========================================================
+# 1. REJEU
+# =========================================================
+
+def appliquer_evenement(etat, evenement):
+    """Applique un événement (ligne de l'onglet) à l'état, sur place. Les types inconnus sont ignorés."""
+    type_ev = str(evenement.get("Type", ""))
+    cle = str(evenement.get("Cle", ""))
+    valeur = evenement.get("Valeur", "")
+
+    if type_ev == EV_POINT_CONTROLE:
+        etat.clear()
+        etat.update(etat_vide())
+        etat.update(json.loads(valeur))
+    elif type_ev in _LISTES:
+        champ, present = _LISTES[type_ev]
+        # Ajouter un élément déjà là (ou retirer un absent) ne change rien : le rejeu est sans risque
+        if present and cle not in etat[champ]:
+            etat[champ].append(cle)
+        elif not present and cle in etat[champ]:
+            etat[champ].remove(cle)
+    elif type_ev in _DICTIONNAIRES:
+        champ = _DICTIONNAIRES[type_ev]
+        etat[champ][cle] = json.loads(valeur) if type_ev == EV_DEVOIRS_MODIFIES else str(valeur)
+    return etat
+
+def evenements_entre(avant, apres):
+    """Événements (type, clé, valeur) qui font passer de l'état avant à l'état apres."""
+    evenements = []
+    for type_ev, (champ, present) in _LISTES.items():
+        if champ not in apres:
+            continue
+        source, cible = (apres, avant) if present else (avant, apres)
+        evenements += [(type_ev, x, "") for x in source[champ] if x not in cible[champ]]
+    for type_ev, champ in _DICTIONNAIRES.items():
+        if champ not in apres:
+            continue
+        for cle, valeur in apres[champ].items():
+            if avant[champ].get(cle) != valeur:
+                texte = json.dumps(valeur) if type_ev == EV_DEVOIRS_MODIFIES else str(valeur)
+                evenements.append((type_ev, str(cle), texte))
+    return evenements
+
+# =========================================================
+# 2. ÉTATS EN MÉMOIRE
+# =========================================================
+# patient -> {"etat", "vus" (événements appliqués), "dernier_id", "depuis_controle"}
+_ETATS = {}
+_VERROU = threading.Lock()
+
+def _etat_historique(patient_id):
+    """
+    État lu dans les anciens onglets (une ligne par patient), pour les dossiers sans point de contrôle.
+    Une lecture impossible lève l'exception : un ancien dossier ne doit pas passer pour un dossier vide.
+    """
+    from connect_db import load_many
+
+    etat = etat_vide()
+    dfs = load_many(
+        ["Progression", "Outils_Autorises", "Suivi_Validation", "Suivi_Devoirs", "Notes_Seance"], patient_id, erreurs=True
+    )
+
+    def premiere(nom, colonne):
+        df = dfs.get(nom)
+        if df is None or df.empty or colonne not in df.columns:
+            return None
+        valeur = str(df.iloc[0][colonne])
+        return None if valeur in ("", "nan", "None") else valeur
+
+    def liste(texte):
+        return [x.strip() for x in texte.split(",") if x.strip()]
+
+    def dictionnaire(texte):
+        try:
+            return json.loads(texte) if texte else {}
+        except ValueError:
+            return {}
+
+    # Une ligne Progression vide voulait déjà dire « aucun module » : seule son absence donne l'intro
+    df_prog = dfs.get("Progression")
+    if df_prog is not None and not df_prog.empty:
+        etat["progression"] = liste(premiere("Progression", "Modules_Actifs") or "")
+    etat["outils"] = liste(premiere("Outils_Autorises", "Outils") or "")
+    etat["valides"] = liste(premiere("Suivi_Validation", "Modules_Valides") or "")
+    etat["commentaires"] = dictionnaire(premiere("Suivi_Validation", "Commentaires"))
+    etat["devoirs"] = dictionnaire(premiere("Suivi_Devoirs", "Donnees_Json"))
+    etat["notes"] = dictionnaire(premiere("Notes_Seance", "Donnees_Json"))
+    return etat
+
+def _rejouer(patient_id, lignes):
+    """
+    Reconstruit l'état à partir des lignes d'événements du patient (en repartant du mémo si possible).
+    Les lignes doivent venir d'une lecture réussie : une liste vide passée pour une panne effacerait le suivi.
+    """
+    cle = str(patient_id).strip()
+    with _VERROU:
+        memo = copy.deepcopy(_ETATS.get(cle))
+
+    # Le mémo n'est réutilisable que si les lignes qu'il a vues sont toujours en tête de la liste
+    if memo and memo["vus"] <= len(lignes) and (
+        memo["vus"] == 0 or str(lignes[memo["vus"] - 1].get(COLONNE_ID, "")) == memo["dernier_id"]
+    ):
+        etat, debut, depuis_controle = memo["etat"], memo["vus"], memo["depuis_controle"]
+    else:
+        dernier = max((i for i, l in enumerate(lignes) if l.get("Type") == EV_POINT_CONTROLE), default=None)
+        if dernier is None:
+            etat, debut, depuis_controle = _etat_historique(patient_id), 0, None  # None : jamais de point de contrôle
+        else:
+            etat, debut, depuis_controle = etat_vide(), dernier, 0
+
+    for ligne in lignes[debut:]:
+        try:
+            appliquer_evenement(etat, ligne)
+        except ValueError:
+            continue  # Valeur JSON abîmée (cellule modifiée à la main) : événement ignoré
+        if ligne.get("Type") == EV_POINT_CONTROLE:
+            depuis_controle = 0
+        elif depuis_controle is not None:
+            depuis_controle += 1
+
+    memo = {
+        "etat": etat, "vus": len(lignes), "depuis_controle": depuis_controle,
+        "dernier_id": str(lignes[-1].get(COLONNE_ID, "")) if lignes else "",
+    }
+    with _VERROU:
+        _ETATS[cle] = copy.deepcopy(memo)
+    return memo
+
+def etat_patient(patient_id):
+    """
+    État courant du suivi d'un patient (copie : la modifier ne change rien).
+    Lève l'exception si le stockage ne répond pas (rien n'est alors mémorisé).
+    """
+    from connect_db import load_patient_rows
+    lignes = load_patient_rows(ONGLET_EVENEMENTS, patient_id, erreurs=True)
+    return copy.deepcopy(_rejouer(patient_id, lignes)["etat"])
+
+def historique_patient(patient_id):
+    """Tous les événements d'un patient (points de contrôle exclus), du plus ancien au plus récent."""
+    from connect_db import load_patient_rows
+    return [l for l in load_patient_rows(ONGLET_EVENEMENTS, patient_id) if l.get("Type") != EV_POINT_CONTROLE]
+
+# =========================================================
+# 3. ÉCRITURE
+# =========================================================
+
+def enregistrer_etat(patient_id, nouvel_etat, auteur=""):
+    """
+    Compare nouvel_etat (tout ou partie des champs) à l'état courant et ajoute les événements
+    correspondants en une seule écriture.
+    Les événements du patient sont relus dans le stockage juste avant (un autre processus a pu en ajouter) ;
+    seuls ceux qui manquent au mémo sont rejoués.
+    Retourne True si tout est enregistré (ou s'il n'y avait rien à changer), False sinon.
+    Lève l'exception si le stockage ne répond pas à la relecture.
+    """
+    from connect_db import load_patient_rows, save_rows
+
+    cle = str(patient_id).strip()
+    memo = _rejouer(patient_id, load_patient_rows(ONGLET_EVENEMENTS, patient_id, erreurs=True, frais=True))
+
+    evenements = evenements_entre(memo["etat"], nouvel_etat)
+    if not evenements:
+        return True
+
+    date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    etat = memo["etat"]
+    lignes = []
+    for type_ev, cle_ev, valeur in evenements:
+        appliquer_evenement(etat, {"Type": type_ev, "Cle": cle_ev, "Valeur": valeur})
+        lignes.append([patient_id, date, type_ev, cle_ev, valeur, auteur])
+
+    # Premier événement d'un ancien dossier, ou trop d'événements depuis le dernier point :
+    # l'état complet est ajouté dans la même écriture, les lectures repartiront de là
+    depuis_controle = memo["depuis_controle"]
+    if depuis_controle is None or depuis_controle + len(lignes) >= POINT_CONTROLE_TOUS:
+        lignes.append([patient_id, date, EV_POINT_CONTROLE, "", json.dumps(etat, ensure_ascii=False), auteur])
+        depuis_controle = 0
+    else:
+        depuis_controle += len(lignes)
+
+    ids = save_rows(ONGLET_EVENEMENTS, lignes)
+    if ids is False:
+        with _VERROU:
+            _ETATS.pop(cle, None)  # Rien n'est écrit : la prochaine lecture repart du stockage
+        return False
+
+    with _VERROU:
+        _ETATS[cle] = {
+            "etat": copy.deepcopy(etat), "vus": memo["vus"] + len(lignes),
+            "dernier_id": str(ids[-1]), "depuis_controle": depuis_controle,
+        }
+    return True
@@ -0,0 +1,127 @@
+import json
+import os
+import re
+import threading
+import time
+
+# =========================================================
+# INSTANTANÉS DISQUE DES ONGLETS (DÉMARRAGE À FROID)
+# =========================================================
+
+FORMAT_INSTANTANE = 1  # À incrémenter si la structure des fichiers change (les anciens sont ignorés)
+
+class MagasinInstantanes:
+    """
+    Garde sur le disque une copie de chaque onglet (un fichier Parquet par onglet).
+
+    Après un redémarrage, le moteur Google Sheets sert la première lecture depuis ce fichier
+    et revalide l'onglet en arrière-plan, au lieu de tout retélécharger avant d'afficher la page.
+    Chaque fichier porte un tampon de version (format, classeur, onglet, en-têtes, nombre de lignes,
+    date du dernier téléchargement complet) dans les métadonnées Parquet.
+
+    Les cellules sont stockées en texte, comme les renvoie get_all_values().
+    Nécessite pyarrow (installé avec streamlit) ; sans lui, les instantanés sont simplement désactivés.
+    """
+    DELAI_ECRITURE = 2  # secondes : plusieurs écritures rapprochées ne donnent qu'un seul fichier
+
+    def __init__(self, dossier=".cache_tcc"):
+        self.dossier = dossier
+        self._verrou = threading.Lock()
+        self._en_attente = {}  # (classeur, onglet) -> fonction qui retourne (entetes, lignes, meta)
+        self._generations = {}  # (classeur, onglet) -> compteur incrémenté à chaque effacement
+        self._ecrivain = None
+
+    @staticmethod
+    def disponible():
+        try:
+            import pyarrow.parquet  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def _chemin(self, classeur, onglet):
+        nom = re.sub(r"[^\w-]", "_", f"{classeur}__{onglet}")
+        return os.path.join(self.dossier, f"{nom}.parquet")
+
+    # --- Lecture ---
+
+    def charger(self, classeur, onglet):
+        """Retourne (entetes, lignes, meta) ou None (pas d'instantané, illisible ou d'un autre format)."""
+        import pyarrow.parquet as pq
+
+        try:
+            table = pq.read_table(self._chemin(classeur, onglet))
+            meta = json.loads((table.schema.metadata or {})[b"tcc"])
+        except Exception:
+            return None
+        if meta.get("format") != FORMAT_INSTANTANE or meta.get("classeur") != classeur or meta.get("onglet") != onglet:
+            return None
+
+        colonnes = [table.column(n).to_pylist() for n in table.column_names]
+        lignes = [list(l) for l in zip(*colonnes)] if colonnes else []
+        return meta["entetes"], lignes, meta
+
+    # --- Écriture ---
+
+    def enregistrer(self, classeur, onglet, entetes, lignes, meta=None, generation=None):
+        """Écrit l'instantané (fichier temporaire puis remplacement atomique)."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        largeur = max((len(l) for l in lignes), default=0)
+        table = pa.table({
+            f"c{i}": [str(l[i]) if i < len(l) else "" for l in lignes] for i in range(largeur)
+        })
+        tampon = {
+            "format": FORMAT_INSTANTANE, "classeur": classeur, "onglet": onglet,
+            "entetes": list(entetes), "nb_lignes": len(lignes), "enregistre_le": time.time(),
+            **(meta or {}),
+        }
+        table = table.replace_schema_metadata({"tcc": json.dumps(tampon)})
+
+        os.makedirs(self.dossier, exist_ok=True)
+        chemin = self._chemin(classeur, onglet)
+        temporaire = f"{chemin}.{os.getpid()}.{threading.get_ident()}.tmp"
+        pq.write_table(table, temporaire)
+        with self._verrou:
+            # Effacé pendant l'écriture (écriture faite entre-temps) : ce contenu est déjà périmé
+            if generation is not None and self._generations.get((classeur, onglet), 0) != generation:
+                os.remove(temporaire)
+                return
+            os.replace(temporaire, chemin)
+
+    def planifier(self, classeur, onglet, contenu):
+        """
+        Demande l'écriture de l'instantané d'ici DELAI_ECRITURE secondes.
+        contenu() est appelé au moment de l'écriture et retourne (entetes, lignes, meta) ou None.
+        """
+        cle = (classeur, onglet)
+        with self._verrou:
+            self._en_attente[cle] = (contenu, self._generations.get(cle, 0))
+            if self._ecrivain is None:
+                self._ecrivain = threading.Thread(target=self._ecrire_en_attente, daemon=True)
+                self._ecrivain.start()
+
+    def _ecrire_en_attente(self):
+        time.sleep(self.DELAI_ECRITURE)
+        with self._verrou:
+            en_attente, self._en_attente = self._en_attente, {}
+            self._ecrivain = None
+        for (classeur, onglet), (contenu, generation) in en_attente.items():
+            try:
+                resultat = contenu()
+                if resultat:
+                    self.enregistrer(classeur, onglet, *resultat, generation=generation)
+            except Exception:
+                pass  # L'instantané n'est qu'un accélérateur : la prochaine lecture ira sur le réseau
+
+    def effacer(self, classeur, onglet):
+        """Supprime l'instantané d'un onglet (et annule une écriture en attente)."""
+        cle = (classeur, onglet)
+        with self._verrou:
+            self._generations[cle] = self._generations.get(cle, 0) + 1
+            self._en_attente.pop(cle, None)
+            try:
+                os.remove(self._chemin(classeur, onglet))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,393 @@
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+from planificateur import CODES_QUOTA, CODES_SERVEUR, code_http
+from stockage import COLONNE_ID, ENTETES_ONGLETS, correspond, en_record, nouvel_id
+
+# =========================================================
+# JOURNAL LOCAL DES ÉCRITURES (WRITE-AHEAD)
+# =========================================================
+
+# Opérations journalisées (une par fonction d'écriture de connect_db)
+OP_AJOUT = "ajout"                              # save_data
+OP_SUPPRESSION_ID = "suppression_id"            # delete_by_id
+OP_MODIFICATION_ID = "modification_id"          # update_by_id
+OP_SUPPRESSION_CRITERES = "suppression_criteres"  # delete_data_flexible
+OP_REMPLACEMENT = "remplacement"                # upsert (la ligne écrite prend l'ID de l'opération)
+
+STATUT_EN_ATTENTE = "en_attente"  # Dans le journal, pas encore appliquée
+STATUT_ENVOI = "envoi"            # En cours d'envoi
+STATUT_ENVOYE = "envoye"          # Appliquée au stockage
+STATUT_ABANDON = "abandon"        # Refusée définitivement par le stockage (copiée dans le fichier .abandons)
+
+def erreur_passagere(erreur):
+    """Quota, erreur serveur ou réseau : l'écriture sera réessayée. Toute autre erreur est définitive."""
+    code = code_http(erreur)
+    if code is None:
+        return isinstance(erreur, OSError)  # ConnectionError, Timeout... (requests en dérive)
+    return code in CODES_QUOTA or code in CODES_SERVEUR
+
+class Journal:
+    """
+    Chaque écriture est d'abord ajoutée (avec fsync) à un fichier local en ajout seul,
+    une ligne JSON par opération, puis appliquée au stockage dans l'ordre du journal.
+    Une ligne « fait » est ajoutée quand le stockage l'a acceptée.
+
+    - Au démarrage, les opérations sans « fait » sont rejouées : une modification coupée entre
+      la suppression et le nouvel ajout (Beck, Résolution de problème...) finit d'être appliquée.
+    - Le rejeu est idempotent : un ajout porte son ID_Ligne dès le journal et n'est renvoyé qu'après
+      vérification qu'il n'est pas déjà dans l'onglet ; une suppression par critères est d'abord
+      résolue en ID_Ligne (noté dans le journal), puis faite par ID.
+    - Si le stockage ne répond pas, l'écriture reste dans le journal et un thread la réessaie :
+      l'appelant n'a jamais à attendre Google pour ne pas perdre sa saisie.
+    - Écriture différée (ecriture_differee.py) : les appelants n'attendent même pas l'envoi,
+      rejouer() envoie les ajouts consécutifs d'un même onglet en un seul append_rows.
+
+    Un seul processus utilise un fichier journal donné (verrou posé à l'ouverture).
+    """
+    TAILLE_LOT = 200
+    INTERVALLE = 5            # secondes entre deux passages du thread
+    ATTENTE_MAX = 300         # secondes entre deux essais d'une opération qui échoue
+    TAILLE_COMPACTAGE = 1_000_000  # octets : le journal est réécrit (opérations en attente seulement)
+    MEMOIRE = 10_000          # statuts et résultats gardés en mémoire
+
+    def __init__(self, moteur, chemin="tcc_journal.jsonl", executer=None):
+        self.moteur = moteur
+        self.chemin = chemin
+        # executer(action, idempotent) : passage par le planificateur (quota) ; appel direct sinon
+        self._executer = executer or (lambda action, idempotent=True: action())
+        self.verrou = threading.RLock()        # état en mémoire + fichier
+        self._verrou_rejeu = threading.Lock()  # une seule application à la fois, dans l'ordre du journal
+        self._reveil = threading.Event()
+
+        self._en_attente = {}  # n -> opération (ordre d'insertion = ordre du journal)
+        self._tentees = set()  # n déjà envoyés au moins une fois : issue incertaine
+        self._essais = {}      # n -> {"essais", "erreur", "prochain_essai"}
+        self._resultats = {}   # n -> résultat (retourné à l'appelant qui attend)
+        self._abandons = {}    # n -> erreur
+        self._statuts = {}     # ID_Ligne d'un ajout -> statut
+        self._prochain = 1
+
+        self._verrou_fichier = open(chemin + ".verrou", "w")
+        if fcntl:
+            try:
+                fcntl.flock(self._verrou_fichier, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                raise RuntimeError(f"Journal {chemin} déjà utilisé par un autre processus")
+        self._charger()
+        self._fichier = open(chemin, "a", encoding="utf-8")
+
+        threading.Thread(target=self._boucle, daemon=True).start()
+        if self._en_attente:
+            self._reveil.set()
+
+    # --- Fichier ---
+
+    def _charger(self):
+        """Relit le journal : opérations sans « fait », avec leur ID résolu le cas échéant."""
+        operations, faits, resolus = {}, set(), {}
+        if os.path.exists(self.chemin):
+            with open(self.chemin, encoding="utf-8") as f:
+                for ligne in f:
+                    try:
+                        entree = json.loads(ligne)
+                    except ValueError:
+                        continue  # Dernière ligne coupée par un arrêt brutal : jamais confirmée à l'appelant
+                    n = entree.get("n", 0)
+                    self._prochain = max(self._prochain, n + 1)
+                    if entree.get("type") == "op":
+                        operations[n] = entree
+                    elif entree.get("type") == "fait":
+                        faits.add(n)
+                    elif entree.get("type") == "resolu":
+                        resolus[n] = entree["id"]
+
+        for n in sorted(operations):
+            if n in faits:
+                continue
+            op = operations[n]
+            if n in resolus:
+                op["id"] = resolus[n]
+            self._en_attente[n] = op
+            self._tentees.add(n)  # Peut-être appliquée juste avant l'arrêt : vérifiée avant d'être rejouée
+            if op["op"] == OP_AJOUT:
+                self._statuts[op["id"]] = STATUT_EN_ATTENTE
+        self._compacter()
+
+    def _compacter(self):
+        """Réécrit le journal avec les seules opérations en attente (fichier temporaire + remplacement)."""
+        temporaire = self.chemin + ".tmp"
+        with open(temporaire, "w", encoding="utf-8") as f:
+            for op in self._en_attente.values():
+                f.write(json.dumps(op, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporaire, self.chemin)
+
+    def _ecrire(self, *entrees):
+        """Ajoute des lignes au journal ; rend la main une fois qu'elles sont sur le disque."""
+        for entree in entrees:
+            self._fichier.write(json.dumps(entree, ensure_ascii=False, default=str) + "\n")
+        self._fichier.flush()
+        os.fsync(self._fichier.fileno())
+
+    # --- Côté application ---
+
+    def enregistrer(self, op, nom_onglet, **champs):
+        """Inscrit une opération dans le journal (sur le disque au retour) et retourne son numéro."""
+        return self.enregistrer_plusieurs(op, nom_onglet, [champs])[0]
+
+    def enregistrer_plusieurs(self, op, nom_onglet, liste_champs):
+        """
+        Inscrit plusieurs opérations du même type (ex: ajouts d'un save_rows) en une seule écriture
+        sur le disque (un fsync) et retourne leurs numéros. Elles restent rejouées une par une.
+        """
+        entrees = []
+        with self.verrou:
+            t = time.time()
+            for champs in liste_champs:
+                champs = dict(champs)
+                if op == OP_AJOUT:
+                    champs.setdefault("id", nouvel_id())
+                entrees.append({"type": "op", "n": self._prochain, "op": op, "onglet": nom_onglet, "t": t, **champs})
+                self._prochain += 1
+            self._ecrire(*entrees)
+            for entree in entrees:
+                self._en_attente[entree["n"]] = entree
+                if op == OP_AJOUT:
+                    self._memoriser(self._statuts, entree["id"], STATUT_EN_ATTENTE)
+        self._reveil.set()
+        return [entree["n"] for entree in entrees]
+
+    def appliquer_jusqua(self, n):
+        """
+        Applique dans l'ordre toutes les opérations en attente jusqu'à n (comprise) et retourne le résultat de n.
+        Lève l'erreur du stockage si l'une d'elles échoue : elles restent alors dans le journal.
+        """
+        with self._verrou_rejeu:
+            while True:
+                with self.verrou:
+                    if n not in self._en_attente:
+                        if n in self._abandons:
+                            raise RuntimeError(self._abandons[n])
+                        return self._resultats.pop(n, None)
+                    lot = self._prochain_lot()
+                try:
+                    self._appliquer_lot(lot)
+                except Exception:
+                    # Une opération plus ancienne refusée définitivement n'empêche pas d'appliquer la suivante
+                    if any(op["n"] == n for op in lot) or not all(self.abandonnee(op["n"]) for op in lot):
+                        raise
+
+    def abandonnee(self, n):
+        with self.verrou:
+            return n in self._abandons
+
+    def statut(self, id_ligne):
+        """{"statut", "essais", "erreur"} d'une ligne ajoutée via le journal, None si elle est inconnue."""
+        with self.verrou:
+            statut = self._statuts.get(str(id_ligne))
+            if statut is None:
+                return None
+            n = next((n for n, op in self._en_attente.items() if op.get("id") == str(id_ligne)), None)
+            essais = self._essais.get(n, {})
+        return {"statut": statut, "essais": essais.get("essais", 0), "erreur": essais.get("erreur")}
+
+    def metriques(self):
+        with self.verrou:
+            premiere = next(iter(self._en_attente.values()), None)
+            return {
+                "en_attente": len(self._en_attente),
+                "abandons": len(self._abandons),
+                "plus_ancienne": round(time.time() - premiere["t"], 1) if premiere else 0.0,
+            }
+
+    # --- Lectures : opérations pas encore appliquées ---
+
+    def a_des_operations(self, nom_onglet):
+        """True si des opérations sur cet onglet ne sont pas encore appliquées au stockage."""
+        with self.verrou:
+            return any(op["onglet"] == nom_onglet for op in self._en_attente.values())
+
+    def appliquer_en_attente(self, nom_onglet, records, patient_id=None):
+        """Lignes lues dans le stockage, corrigées des opérations du journal pas encore appliquées."""
+        with self.verrou:
+            operations = [dict(op) for op in self._en_attente.values() if op["onglet"] == nom_onglet]
+        if not operations:
+            return records
+
+        records = list(records)
+        cible = None if patient_id is None else str(patient_id).strip()
+        def du_patient(record):
+            return cible is None or str(record.get("Patient", "")).strip() == cible
+        def position(predicat):
+            return next((i for i, r in enumerate(records) if predicat(r)), None)
+
+        for op in operations:
+            if op["op"] == OP_AJOUT:
+                record = en_record(nom_onglet, op["valeurs"], op["id"])
+                if du_patient(record) and position(lambda r: str(r.get(COLONNE_ID)) == op["id"]) is None:
+                    records.append(record)
+            elif op["op"] in (OP_SUPPRESSION_ID, OP_MODIFICATION_ID) or (op["op"] == OP_SUPPRESSION_CRITERES and op.get("id")):
+                i = position(lambda r: str(r.get(COLONNE_ID)) == str(op["id"]))
+                if i is None:
+                    continue
+                if op["op"] == OP_MODIFICATION_ID:
+                    record = en_record(nom_onglet, op["valeurs"], op["id"])
+                    if du_patient(record):
+                        records[i] = record
+                        continue
+                del records[i]
+            elif op["op"] == OP_SUPPRESSION_CRITERES:
+                i = position(lambda r: correspond(r, op["criteres"]))
+                if i is not None:
+                    del records[i]
+            elif op["op"] == OP_REMPLACEMENT:
+                entetes = ENTETES_ONGLETS.get(nom_onglet, [])
+                cles = {c: op["valeurs"][entetes.index(c)] for c in op["cles"] if c in entetes[:len(op["valeurs"])]}
+                i = position(lambda r: correspond(r, cles)) if len(cles) == len(op["cles"]) else None
+                ancien_id = records[i].get(COLONNE_ID, "") if i is not None else ""
+                record = en_record(nom_onglet, op["valeurs"], op.get("id") or ancien_id)
+                if i is not None:
+                    records[i] = record
+                elif du_patient(record):
+                    records.append(record)
+        return records
+
+    # --- Application au stockage ---
+
+    def _memoriser(self, table, cle, valeur):
+        table[cle] = valeur
+        if len(table) > self.MEMOIRE:
+            del table[next(iter(table))]
+
+    def _prochain_lot(self):
+        """Première opération en attente, plus les ajouts consécutifs au même onglet (un seul append_rows)."""
+        operations = iter(self._en_attente.values())
+        premiere = next(operations)
+        lot = [premiere]
+        if premiere["op"] == OP_AJOUT:
+            for op in operations:
+                if op["op"] != OP_AJOUT or op["onglet"] != premiere["onglet"] or len(lot) >= self.TAILLE_LOT:
+                    break
+                lot.append(op)
+        return lot
+
+    def _appliquer_lot(self, lot):
+        premiere, nom_onglet = lot[0], lot[0]["onglet"]
+        with self.verrou:
+            incertains = [op for op in lot if op["n"] in self._tentees]
+            self._tentees.update(op["n"] for op in lot)
+            for op in lot:
+                if op["op"] == OP_AJOUT:
+                    self._statuts[op["id"]] = STATUT_ENVOI
+
+        try:
+            if premiere["op"] == OP_AJOUT:
+                deja = set()
+                if incertains:
+                    deja = self._executer(lambda: self.moteur.ids_existants(nom_onglet, [op["id"] for op in incertains]))
+                restants = [op for op in lot if op["id"] not in deja]
+                if restants:
+                    # Pas de nouvel essai automatique : l'ajout a pu être fait malgré l'erreur (vérifié au prochain essai)
+                    self._executer(lambda: self.moteur.ajouter_lignes(
+                        nom_onglet, [op["valeurs"] for op in restants], [op["id"] for op in restants]
+                    ), idempotent=False)
+                resultat = None
+            elif premiere["op"] == OP_SUPPRESSION_ID:
+                resultat = self._executer(lambda: self.moteur.supprimer_par_id(nom_onglet, premiere["id"]))
+            elif premiere["op"] == OP_MODIFICATION_ID:
+                resultat = self._executer(lambda: self.moteur.modifier_par_id(nom_onglet, premiere["id"], premiere["valeurs"]))
+            elif premiere["op"] == OP_REMPLACEMENT:
+                resultat = self._executer(lambda: self.moteur.remplacer_ou_ajouter(
+                    nom_onglet, premiere["cles"], premiere["valeurs"], premiere.get("id")
+                ))
+            elif premiere["op"] == OP_SUPPRESSION_CRITERES:
+                resultat = self._supprimer_par_criteres(premiere)
+            else:
+                raise ValueError(f"Opération inconnue dans le journal : {premiere['op']}")
+        except Exception as e:
+            self._echec(lot, e)
+            raise
+
+        with self.verrou:
+            self._ecrire(*({"type": "fait", "n": op["n"]} for op in lot))
+            for op in lot:
+                self._terminer(op)
+                self._memoriser(self._resultats, op["n"], op["id"] if op["op"] == OP_AJOUT else resultat)
+            if not self._en_attente and self._fichier.tell() > self.TAILLE_COMPACTAGE:
+                self._fichier.close()
+                self._compacter()
+                self._fichier = open(self.chemin, "a", encoding="utf-8")
+
+    def _supprimer_par_criteres(self, op):
+        """Critères résolus en ID_Ligne une seule fois (noté dans le journal) : le rejeu ne vise jamais une autre ligne."""
+        if not op.get("id"):
+            id_ligne = self._executer(lambda: self.moteur.chercher_id(op["onglet"], op["criteres"]))
+            if not id_ligne:
+                return False
+            with self.verrou:
+                self._ecrire({"type": "resolu", "n": op["n"], "id": id_ligne})
+                op["id"] = id_ligne
+        return self._executer(lambda: self.moteur.supprimer_par_id(op["onglet"], op["id"]))
+
+    def _terminer(self, op, statut=STATUT_ENVOYE):
+        self._en_attente.pop(op["n"], None)
+        self._tentees.discard(op["n"])
+        self._essais.pop(op["n"], None)
+        if op["op"] == OP_AJOUT:
+            self._memoriser(self._statuts, op["id"], statut)
+
+    def _echec(self, lot, erreur):
+        """Erreur passagère : nouvel essai plus tard. Erreur définitive : opérations abandonnées (et mises de côté)."""
+        with self.verrou:
+            if not erreur_passagere(erreur):
+                with open(self.chemin + ".abandons", "a", encoding="utf-8") as f:
+                    for op in lot:
+                        f.write(json.dumps({**op, "erreur": str(erreur)}, ensure_ascii=False, default=str) + "\n")
+                self._ecrire(*({"type": "fait", "n": op["n"], "abandon": str(erreur)} for op in lot))
+                for op in lot:
+                    self._terminer(op, STATUT_ABANDON)
+                    self._memoriser(self._abandons, op["n"], str(erreur))
+                return
+            for op in lot:
+                essais = self._essais.get(op["n"], {}).get("essais", 0) + 1
+                self._essais[op["n"]] = {
+                    "essais": essais, "erreur": str(erreur)[:500],
+                    "prochain_essai": time.time() + min(self.ATTENTE_MAX, 2 ** essais),
+                }
+                if op["op"] == OP_AJOUT:
+                    self._statuts[op["id"]] = STATUT_EN_ATTENTE
+
+    # --- Thread de rejeu ---
+
+    def _boucle(self):
+        while True:
+            self._reveil.wait(self.INTERVALLE)
+            self._reveil.clear()
+            if not self._tentees:
+                # L'appelant (ou l'écriture différée) applique lui-même ; le thread ne reprend que ce qui a échoué
+                continue
+            self.rejouer()
+
+    def rejouer(self):
+        """Applique dans l'ordre les opérations en attente, jusqu'à la première qui doit attendre son prochain essai."""
+        with self._verrou_rejeu:
+            while True:
+                with self.verrou:
+                    if not self._en_attente:
+                        return
+                    lot = self._prochain_lot()
+                    if self._essais.get(lot[0]["n"], {}).get("prochain_essai", 0) > time.time():
+                        return  # En attente du prochain essai (stockage injoignable)
+                try:
+                    self._appliquer_lot(lot)
+                except Exception:
+                    pass  # Noté par _echec : abandonnée ou réessayée au prochain passage
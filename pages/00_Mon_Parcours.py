@@ -7,7 +7,7 @@ import json
 from datetime import datetime
 
 from protocole_config import PROTOCOLE_BARLOW, QUESTIONS_HEBDO 
-from connect_db import load_data, sauvegarder_reponse_hebdo, supprimer_reponse
+from connect_db import load_patient_rows, sauvegarder_reponse_hebdo, supprimer_reponse
 
 # --- CONFIGURATION ---
 st.set_page_config(page_title="Mon Espace Santé", page_icon="🧘", layout="wide")
@@ -35,10 +35,9 @@ current_user = st.session_state.user_id
 def charger_historique_complet(uid):
     """Charge tout l'historique et prépare la colonne 'Type' pour les graphiques"""
     try:
-        raw = load_data("Reponses_Hebdo")
+        raw = load_patient_rows("Reponses_Hebdo", uid)
         if raw:
             df = pd.DataFrame(raw)
-            df = df[df["Patient"] == uid].copy()
             if not df.empty:
                 df["Date"] = pd.to_datetime(df["Date"])
                 
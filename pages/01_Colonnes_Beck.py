@@ -28,28 +28,11 @@ if "beck_owner" not in st.session_state or st.session_state.beck_owner != CURREN
         del st.session_state.data_beck
     st.session_state.beck_owner = CURRENT_USER_ID
 
-# D. LE VIGILE (PERMISSIONS) - NOUVEAU
-CLE_PAGE = "beck" # <--- Changez ceci selon la page (ex: "activites", "conso"...)
+# D. LE VIGILE (PERMISSIONS) : test en mémoire, outils résolus une fois par session
+CLE_PAGE = "beck"
 
-if st.session_state.get("user_type") == "patient":
-    try:
-        from connect_db import load_data
-        perms = load_data("Permissions")
-        if perms:
-            df_perm = pd.DataFrame(perms)
-            # On cherche si le patient a des blocages
-            row = df_perm[df_perm["Patient"] == CURRENT_USER_ID]
-            if not row.empty:
-                bloques = str(row.iloc[0]["Bloques"]).split(",")
-                # Si la clé de la page est dans la liste des blocages
-                if CLE_PAGE in [b.strip() for b in bloques]:
-                    st.error("🔒 Cette fonctionnalité n'est pas activée dans votre programme.")
-                    st.info("Voyez avec votre thérapeute si vous pensez qu'il s'agit d'une erreur.")
-                    if st.button("Retour à l'accueil"):
-                        st.switch_page("streamlit_app.py")
-                    st.stop() # Arrêt immédiat
-    except Exception as e:
-        pass # En cas d'erreur technique (ex: pas de connexion), on laisse passer par défaut
+from permissions import verifier_acces
+verifier_acces(CLE_PAGE)
 
 st.title("🧩 Colonnes de Beck")
 st.caption("Identifiez et restructurez vos pensées automatiques.")
@@ -66,16 +49,17 @@ COLS_BECK = [
 ]
 
 if "data_beck" not in st.session_state:
-    # Création du DataFrame vide
-    df_init = pd.DataFrame(columns=COLS_BECK)
+    # Création du DataFrame vide (+ identifiant de ligne pour modifier / supprimer sans ambiguïté)
+    df_init = pd.DataFrame(columns=COLS_BECK + ["ID_Ligne"])
     
     # Tentative de chargement depuis le Cloud
     try:
-        from connect_db import load_data
-        data_cloud = load_data("Beck") # Nom de l'onglet GSheet
+        from connect_db import load_patient_rows
+        from schemas import appliquer_schema
+        data_cloud = load_patient_rows("Beck", CURRENT_USER_ID) # Nom de l'onglet GSheet
         
         if data_cloud:
-            df_cloud = pd.DataFrame(data_cloud)
+            df_cloud = appliquer_schema("Beck", pd.DataFrame(data_cloud))
             
             # Mapping intelligent des colonnes (Gestion des majuscules/minuscules)
             for col in COLS_BECK:
@@ -83,6 +67,8 @@ if "data_beck" not in st.session_state:
                     df_init[col] = df_cloud[col]
                 elif col.lower() in df_cloud.columns: # Si écrit en minuscule dans le sheet
                     df_init[col] = df_cloud[col.lower()]
+            if "ID_Ligne" in df_cloud.columns:
+                df_init["ID_Ligne"] = df_cloud["ID_Ligne"]
             
             # Nettoyage des chiffres (Conversion texte -> nombre pour les sliders)
             numeric_cols = ["Intensité (Avant)", "Croyance (Avant)", "Croyance (Rationnelle)", "Intensité (Après)", "Croyance (Après)"]
@@ -173,19 +159,21 @@ with tab1:
                 "Croyance (Après)": croyance_apres
             }
             
-            # 1. Sauvegarde Locale
-            st.session_state.data_beck = pd.concat([st.session_state.data_beck, pd.DataFrame([new_row_dict])], ignore_index=True)
-            
-            # 2. Sauvegarde Cloud
+            # 1. Sauvegarde Cloud (on garde l'ID de la ligne pour les modifications)
             try:
                 from connect_db import save_data
                 # Conversion dict -> list pour GSheet (Respecter l'ordre de COLS_BECK)
                 values_list = [new_row_dict[col] for col in COLS_BECK]
-                save_data("Beck", values_list)
+                id_ligne = save_data("Beck", values_list)
+                if id_ligne:
+                    new_row_dict["ID_Ligne"] = id_ligne
                 st.success("✅ Enregistré avec succès !")
             except Exception as e:
                 st.warning(f"⚠️ Enregistré en local uniquement ({e}).")
 
+            # 2. Sauvegarde Locale
+            st.session_state.data_beck = pd.concat([st.session_state.data_beck, pd.DataFrame([new_row_dict])], ignore_index=True)
+
 # ==============================================================================
 # ONGLET 2 : HISTORIQUE
 # ==============================================================================
@@ -210,6 +198,7 @@ with tab2:
                 "Situation": st.column_config.TextColumn("Situation", width="medium"),
                 "Pensée Auto": st.column_config.TextColumn("Pensée Auto", width="medium"),
                 "Pensée Rationnelle": st.column_config.TextColumn("Rationnel", width="medium"),
+                "ID_Ligne": None, # Colonne technique masquée
             },
             hide_index=True
         )
@@ -240,6 +229,7 @@ with tab2:
         if selected_label:
             idx_sel = options_dict[selected_label]
             row_sel = df_history.loc[idx_sel]
+            id_sel = str(row_sel["ID_Ligne"]).strip() if pd.notna(row_sel.get("ID_Ligne")) else ""
 
             col_edit, col_delete = st.columns([1, 1])
 
@@ -248,14 +238,17 @@ with tab2:
                 if st.button("🗑️ Supprimer définitivement", type="primary"):
                     # 1. Suppression Cloud
                     try:
-                        from connect_db import delete_data_flexible
+                        from connect_db import delete_by_id, delete_data_flexible
                         pid = CURRENT_USER_ID
-                        # On utilise Date et Situation comme clés pour identifier la ligne
-                        delete_data_flexible("Beck", {
-                            "Patient": pid,
-                            "Date": str(row_sel['Date']),
-                            "Situation": str(row_sel['Situation']) # On suppose que la situation est assez unique
-                        })
+                        if id_sel:
+                            delete_by_id("Beck", id_sel)
+                        else:
+                            # Ancienne ligne sans ID : on utilise Date et Situation comme clés
+                            delete_data_flexible("Beck", {
+                                "Patient": pid,
+                                "Date": str(row_sel['Date']),
+                                "Situation": str(row_sel['Situation'])
+                            })
                     except: pass
                     
                     # 2. Suppression Locale
@@ -300,19 +293,12 @@ with tab2:
                     btn_save_edit = st.form_submit_button("💾 Valider les modifications")
 
                     if btn_save_edit:
-                        # LOGIQUE DE MISE À JOUR : On supprime l'ancien et on crée le nouveau
-                        
-                        # 1. Suppression de l'ancienne version (Cloud)
+                        # LOGIQUE DE MISE À JOUR : la ligne est réécrite sur place (même ID)
                         try:
-                            from connect_db import delete_data_flexible, save_data
+                            from connect_db import update_by_id, delete_data_flexible, save_data
                             pid = CURRENT_USER_ID
-                            delete_data_flexible("Beck", {
-                                "Patient": pid,
-                                "Date": str(row_sel['Date']),
-                                "Situation": str(row_sel['Situation'])
-                            })
                             
-                            # 2. Création de la nouvelle ligne
+                            # 1. Nouvelle version de la ligne
                             updated_row = {
                                 "Patient": pid,
                                 "Date": str(e_date),
@@ -327,15 +313,26 @@ with tab2:
                                 "Croyance (Après)": e_croy_apr
                             }
                             
-                            # 3. Sauvegarde de la nouvelle version (Cloud)
+                            # 2. Sauvegarde Cloud
                             # Conversion dict -> list
                             values_list = [updated_row[col] for col in COLS_BECK]
-                            save_data("Beck", values_list)
+                            if id_sel:
+                                update_by_id("Beck", id_sel, values_list)
+                            else:
+                                # Ancienne ligne sans ID : suppression puis recréation
+                                delete_data_flexible("Beck", {
+                                    "Patient": pid,
+                                    "Date": str(row_sel['Date']),
+                                    "Situation": str(row_sel['Situation'])
+                                })
+                                nouvel_id = save_data("Beck", values_list)
+                                if nouvel_id:
+                                    st.session_state.data_beck.loc[idx_sel, "ID_Ligne"] = nouvel_id
                             
                         except Exception as e:
                             st.error(f"Erreur Cloud: {e}")
                         
-                        # 4. Mise à jour Locale (On remplace dans le dataframe)
+                        # 3. Mise à jour Locale (On remplace dans le dataframe)
                         st.session_state.data_beck.loc[idx_sel, "Date"] = str(e_date)
                         st.session_state.data_beck.loc[idx_sel, "Situation"] = e_sit
                         st.session_state.data_beck.loc[idx_sel, "Émotion"] = e_emo
@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 import altair as alt
+from schemas import en_nombres, colonne_dates
 
 st.set_page_config(page_title="Historique Global", page_icon="📜", layout="wide")
 
@@ -22,38 +23,54 @@ st.title("📜 Historique de vos progrès")
 # ==============================================================================
 # 1. FONCTION DE CHARGEMENT UNIFIÉE
 # ==============================================================================
-def get_data(key_session, key_cloud):
+# Clé de session -> onglet du cloud
+SOURCES = {
+    "data_sommeil": "Sommeil",
+    "data_activites": "Activites",
+    "data_addictions": "Addictions",
+    "data_compulsions": "Compulsions",
+    "data_humeur_jour": "Humeur",
+    "data_beck": "Colonnes_Beck",
+    "data_sorc": "SORC",
+    "data_problemes": "Resolution_Probleme",
+    "data_echelles": "Echelles_BDI",
+    "data_balance": "Balance_Decisionnelle",
+}
+
+def get_all_data():
     """Charge les données depuis la session ou le cloud de manière sécurisée"""
     # 1. Priorité Session
-    if key_session in st.session_state and isinstance(st.session_state[key_session], pd.DataFrame) and not st.session_state[key_session].empty:
-        return st.session_state[key_session]
+    resultats = {}
+    for key_session in SOURCES:
+        if key_session in st.session_state and isinstance(st.session_state[key_session], pd.DataFrame) and not st.session_state[key_session].empty:
+            resultats[key_session] = st.session_state[key_session]
     
-    # 2. Sinon Cloud
-    try:
-        from connect_db import load_data
-        data = load_data(key_cloud)
-        if data:
-            df = pd.DataFrame(data)
-            # Filtre sur l'utilisateur courant
-            if "Patient" in df.columns:
-                df = df[df["Patient"].astype(str).str.strip() == str(CURRENT_USER_ID).strip()]
-            return df
-    except: pass
-    
-    return pd.DataFrame() # Retourne vide si rien trouvé
+    # 2. Sinon Cloud : tous les onglets manquants en un seul aller-retour
+    manquants = [k for k in SOURCES if k not in resultats]
+    cloud = {}
+    if manquants:
+        try:
+            from connect_db import load_many
+            # Filtre sur l'utilisateur courant (fait par le moteur de stockage)
+            cloud = load_many([SOURCES[k] for k in manquants], CURRENT_USER_ID)
+        except: pass
+    for k in manquants:
+        resultats[k] = cloud.get(SOURCES[k], pd.DataFrame()) # Vide si rien trouvé
+    return resultats
 
 # Chargement de toutes les données au début
-df_sommeil = get_data("data_sommeil", "Sommeil")
-df_act = get_data("data_activites", "Activites")
-df_conso = get_data("data_addictions", "Addictions")
-df_comp = get_data("data_compulsions", "Compulsions")
-df_humeur = get_data("data_humeur_jour", "Humeur")
-
-df_beck = get_data("data_beck", "Colonnes_Beck")
-df_sorc = get_data("data_sorc", "SORC")
-df_prob = get_data("data_problemes", "Resolution_Probleme")
-df_bdi = get_data("data_echelles", "Echelles_BDI")
-df_balance = get_data("data_balance", "Balance_Decisionnelle")
+donnees = get_all_data()
+df_sommeil = donnees["data_sommeil"]
+df_act = donnees["data_activites"]
+df_conso = donnees["data_addictions"]
+df_comp = donnees["data_compulsions"]
+df_humeur = donnees["data_humeur_jour"]
+
+df_beck = donnees["data_beck"]
+df_sorc = donnees["data_sorc"]
+df_prob = donnees["data_problemes"]
+df_bdi = donnees["data_echelles"]
+df_balance = donnees["data_balance"]
 
 # ==============================================================================
 # 2. AFFICHAGE PAR GRANDS ONGLETS
@@ -71,12 +88,12 @@ with main_tab1:
     with st.expander("🌙 Sommeil & Énergie"):
         if not df_sommeil.empty:
             df_s = df_sommeil.copy()
-            df_s["Date"] = pd.to_datetime(df_s["Date"], errors='coerce')
+            df_s["Date"] = colonne_dates(df_s["Date"])
             
             # Nettoyage chiffres
             for c in ["Efficacité", "Qualité", "Forme"]:
                 if c in df_s.columns:
-                    df_s[c] = pd.to_numeric(df_s[c].astype(str).str.replace('%', ''), errors='coerce')
+                    df_s[c] = en_nombres(df_s[c])
             
             df_s = df_s.dropna(subset=["Date"]).sort_values("Date")
             
@@ -103,8 +120,8 @@ with main_tab1:
             if not df_humeur.empty:
                 st.caption("Évolution de l'Humeur")
                 df_h = df_humeur.copy()
-                df_h["Date"] = pd.to_datetime(df_h["Date"], errors='coerce')
-                df_h["Humeur Globale (0-10)"] = pd.to_numeric(df_h["Humeur Globale (0-10)"], errors='coerce')
+                df_h["Date"] = colonne_dates(df_h["Date"])
+                df_h["Humeur Globale (0-10)"] = en_nombres(df_h["Humeur Globale (0-10)"])
                 st.line_chart(df_h.set_index("Date")["Humeur Globale (0-10)"], color="#FFA500")
             else: st.info("Pas d'humeur notée.")
             
@@ -112,7 +129,7 @@ with main_tab1:
             if not df_act.empty:
                 st.caption("Activités : Plaisir Moyen")
                 df_a = df_act.copy()
-                df_a["Plaisir (0-10)"] = pd.to_numeric(df_a["Plaisir (0-10)"], errors='coerce')
+                df_a["Plaisir (0-10)"] = en_nombres(df_a["Plaisir (0-10)"])
                 top_act = df_a.groupby("Activité")["Plaisir (0-10)"].mean().sort_values(ascending=False).head(5)
                 st.bar_chart(top_act, color="#2ecc71")
             else: st.info("Pas d'activités notées.")
@@ -124,7 +141,7 @@ with main_tab1:
     with st.expander("🍷 Envies & Consommations"):
         if not df_conso.empty:
             df_c = df_conso.copy()
-            df_c["Date"] = pd.to_datetime(df_c["Date"], errors='coerce')
+            df_c["Date"] = colonne_dates(df_c["Date"])
             
             cnt_envie = len(df_c[df_c["Type"].str.contains("ENVIE", na=False)])
             cnt_conso = len(df_c[df_c["Type"].str.contains("CONSOMMÉ", na=False)])
@@ -141,8 +158,8 @@ with main_tab1:
     with st.expander("🛑 Compulsions (TOC)"):
         if not df_comp.empty:
             df_t = df_comp.copy()
-            df_t["Date"] = pd.to_datetime(df_t["Date"], errors='coerce')
-            df_t["Durée (min)"] = pd.to_numeric(df_t["Durée (min)"], errors='coerce').fillna(0)
+            df_t["Date"] = colonne_dates(df_t["Date"])
+            df_t["Durée (min)"] = en_nombres(df_t["Durée (min)"]).fillna(0)
             
             st.metric("Temps total consacré aux rituels", f"{int(df_t['Durée (min)'].sum())} min")
             
@@ -211,8 +228,8 @@ with main_tab2:
     with st.expander("📉 Suivi Dépression (BDI)"):
         if not df_bdi.empty:
             df_b = df_bdi.copy()
-            df_b["Date"] = pd.to_datetime(df_b["Date"], errors='coerce')
-            df_b["Score Total"] = pd.to_numeric(df_b["Score Total"], errors='coerce')
+            df_b["Date"] = colonne_dates(df_b["Date"])
+            df_b["Score Total"] = en_nombres(df_b["Score Total"])
             df_b = df_b.dropna(subset=["Date"]).sort_values("Date")
             
             chart_bdi = alt.Chart(df_b).mark_line(point=True, color="#e74c3c").encode(
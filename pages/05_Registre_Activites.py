@@ -30,28 +30,11 @@ if "activite_owner" not in st.session_state or st.session_state.activite_owner !
     if "data_humeur_jour" in st.session_state: del st.session_state.data_humeur_jour
     st.session_state.activite_owner = CURRENT_USER_ID
 
-# D. LE VIGILE (PERMISSIONS) - NOUVEAU
-CLE_PAGE = "activites" # <--- Changez ceci selon la page (ex: "activites", "conso"...)
+# D. LE VIGILE (PERMISSIONS) : test en mémoire, outils résolus une fois par session
+CLE_PAGE = "activites"
 
-if st.session_state.get("user_type") == "patient":
-    try:
-        from connect_db import load_data
-        perms = load_data("Permissions")
-        if perms:
-            df_perm = pd.DataFrame(perms)
-            # On cherche si le patient a des blocages
-            row = df_perm[df_perm["Patient"] == CURRENT_USER_ID]
-            if not row.empty:
-                bloques = str(row.iloc[0]["Bloques"]).split(",")
-                # Si la clé de la page est dans la liste des blocages
-                if CLE_PAGE in [b.strip() for b in bloques]:
-                    st.error("🔒 Cette fonctionnalité n'est pas activée dans votre programme.")
-                    st.info("Voyez avec votre thérapeute si vous pensez qu'il s'agit d'une erreur.")
-                    if st.button("Retour à l'accueil"):
-                        st.switch_page("streamlit_app.py")
-                    st.stop() # Arrêt immédiat
-    except Exception as e:
-        pass # En cas d'erreur technique (ex: pas de connexion), on laisse passer par défaut
+from permissions import verifier_acces
+verifier_acces(CLE_PAGE)
 
 st.title("📝 Registre des Activités")
 
@@ -65,10 +48,11 @@ cols_act = ["Patient", "Date", "Heure", "Activité", "Plaisir (0-10)", "Maîtris
 if "data_activites" not in st.session_state:
     df_final_act = pd.DataFrame(columns=cols_act)
     try:
-        from connect_db import load_data
-        data_cloud = load_data("Activites")
+        from connect_db import load_patient_rows
+        from schemas import appliquer_schema
+        data_cloud = load_patient_rows("Activites", CURRENT_USER_ID)
         if data_cloud:
-            df_cloud = pd.DataFrame(data_cloud)
+            df_cloud = appliquer_schema("Activites", pd.DataFrame(data_cloud))
             for col in cols_act:
                 if col in df_cloud.columns:
                     df_final_act[col] = df_cloud[col]
@@ -96,10 +80,11 @@ cols_hum = ["Patient", "Date", "Humeur Globale (0-10)"]
 if "data_humeur_jour" not in st.session_state:
     df_final_hum = pd.DataFrame(columns=cols_hum)
     try:
-        from connect_db import load_data
-        data_cloud_hum = load_data("Humeur")
+        from connect_db import load_patient_rows
+        from schemas import appliquer_schema
+        data_cloud_hum = load_patient_rows("Humeur", CURRENT_USER_ID)
         if data_cloud_hum:
-            df_cloud_hum = pd.DataFrame(data_cloud_hum)
+            df_cloud_hum = appliquer_schema("Humeur", pd.DataFrame(data_cloud_hum))
             for col in cols_hum:
                 if col in df_cloud_hum.columns:
                     df_final_hum[col] = df_cloud_hum[col]
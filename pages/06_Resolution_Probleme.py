@@ -24,28 +24,11 @@ if "pb_owner" not in st.session_state or st.session_state.pb_owner != CURRENT_US
     if "data_problemes" in st.session_state: del st.session_state.data_problemes
     st.session_state.pb_owner = CURRENT_USER_ID
 
-# D. LE VIGILE (PERMISSIONS) - NOUVEAU
-CLE_PAGE = "problemes" # <--- Changez ceci selon la page (ex: "activites", "conso"...)
+# D. LE VIGILE (PERMISSIONS) : test en mémoire, outils résolus une fois par session
+CLE_PAGE = "problemes"
 
-if st.session_state.get("user_type") == "patient":
-    try:
-        from connect_db import load_data
-        perms = load_data("Permissions")
-        if perms:
-            df_perm = pd.DataFrame(perms)
-            # On cherche si le patient a des blocages
-            row = df_perm[df_perm["Patient"] == CURRENT_USER_ID]
-            if not row.empty:
-                bloques = str(row.iloc[0]["Bloques"]).split(",")
-                # Si la clé de la page est dans la liste des blocages
-                if CLE_PAGE in [b.strip() for b in bloques]:
-                    st.error("🔒 Cette fonctionnalité n'est pas activée dans votre programme.")
-                    st.info("Voyez avec votre thérapeute si vous pensez qu'il s'agit d'une erreur.")
-                    if st.button("Retour à l'accueil"):
-                        st.switch_page("streamlit_app.py")
-                    st.stop() # Arrêt immédiat
-    except Exception as e:
-        pass # En cas d'erreur technique (ex: pas de connexion), on laisse passer par défaut
+from permissions import verifier_acces
+verifier_acces(CLE_PAGE)
 
 st.title("💡 Technique de Résolution de Problèmes")
 st.info("Une méthode structurée pour transformer un problème en plan d'action.")
@@ -53,19 +36,22 @@ st.info("Une méthode structurée pour transformer un problème en plan d'action
 # --- 0. INITIALISATION ET CHARGEMENT (ROBUSTE) ---
 
 # A. CHARGEMENT DE L'HISTORIQUE DES PROBLÈMES
+# Colonnes de l'onglet (aussi utilisées par la modification, donc définies hors du if)
+cols_pb = ["Patient", "Date", "Problème", "Objectif", "Solution Choisie", "Plan Action", "Obstacles", "Ressources", "Date Évaluation"]
+
 if "data_problemes" not in st.session_state:
-    cols_pb = ["Patient", "Date", "Problème", "Objectif", "Solution Choisie", "Plan Action", "Obstacles", "Ressources", "Date Évaluation"]
-    df_final = pd.DataFrame(columns=cols_pb)
+    df_final = pd.DataFrame(columns=cols_pb + ["ID_Ligne"])
     
     # 1. Tentative de chargement Cloud
     try:
-        from connect_db import load_data
-        data_cloud = load_data("Résolution_Problème") # Vérifiez que l'onglet Excel s'appelle bien "Résolution_Problème"
+        from connect_db import load_patient_rows
+        from schemas import appliquer_schema
+        data_cloud = load_patient_rows("Résolution_Problème", CURRENT_USER_ID) # Vérifiez que l'onglet Excel s'appelle bien "Résolution_Problème"
     except:
         data_cloud = []
 
     if data_cloud:
-        df_cloud = pd.DataFrame(data_cloud)
+        df_cloud = appliquer_schema("Résolution_Problème", pd.DataFrame(data_cloud))
         
         # 2. Remplissage intelligent (Gestion Majuscules/Minuscules)
         for col in cols_pb:
@@ -75,6 +61,10 @@ if "data_problemes" not in st.session_state:
                 df_final[col] = df_cloud[col.lower()]
             elif col.replace(" ", "_") in df_cloud.columns: # Si Excel a "Plan_Action"
                 df_final[col] = df_cloud[col.replace(" ", "_")]
+
+        # Identifiant de ligne : permet de modifier / supprimer la bonne entrée sans ambiguïté
+        if "ID_Ligne" in df_cloud.columns:
+            df_final["ID_Ligne"] = df_cloud["ID_Ligne"]
                 
     st.session_state.data_problemes = df_final
 
@@ -299,13 +289,15 @@ with tab1:
                 "Obstacles": obstacles, "Ressources": ressources, "Date Évaluation": str(date_eval)
             }
             
-            # Mise à jour locale
-            st.session_state.data_problemes = pd.concat([st.session_state.data_problemes, pd.DataFrame([new_row])], ignore_index=True)
-            
-            # Sauvegarde Cloud
+            # Sauvegarde Cloud (on garde l'ID de la ligne pour les modifications)
             from connect_db import save_data
             patient = CURRENT_USER_ID
-            save_data("Résolution_Problème", [patient, datetime.now().strftime("%Y-%m-%d"), probleme, objectif, solution_choisie, plan_texte_complet, obstacles, ressources, str(date_eval)])
+            id_ligne = save_data("Résolution_Problème", [patient, datetime.now().strftime("%Y-%m-%d"), probleme, objectif, solution_choisie, plan_texte_complet, obstacles, ressources, str(date_eval)])
+            if id_ligne:
+                new_row["ID_Ligne"] = id_ligne
+
+            # Mise à jour locale
+            st.session_state.data_problemes = pd.concat([st.session_state.data_problemes, pd.DataFrame([new_row])], ignore_index=True)
             
             # On vide les mémoires pour repartir à zéro (sauf si on veut modifier, voir plus bas)
             st.session_state.analyse_detaillee = pd.DataFrame(columns=["Solution", "Type", "Terme", "Description", "Note", "Valeur"])
@@ -329,16 +321,10 @@ with tab2:
         nom_dossier = CURRENT_USER_ID # Valeur par défaut
         
         try:
-            from connect_db import load_data
-            infos = load_data("Codes_Patients")
-            if infos:
-                df_i = pd.DataFrame(infos)
-                # On gère si la colonne s'appelle Identifiant ou Commentaire
-                col_id = "Identifiant" if "Identifiant" in df_i.columns else "Commentaire"
-                
-                # On trouve la ligne correspondante
-                match = df_i[df_i["Code"] == CURRENT_USER_ID]
-                if not match.empty: nom_dossier = match.iloc[0][col_id]
+            from connect_db import chercher_code_patient
+            compte = chercher_code_patient(CURRENT_USER_ID)
+            # On gère si la colonne s'appelle Identifiant ou Commentaire
+            if compte: nom_dossier = compte.get("Identifiant", compte.get("Commentaire", nom_dossier))
         except: pass
         
         # On remplace dans le tableau
@@ -353,6 +339,7 @@ with tab2:
                 "Patient": st.column_config.TextColumn("Dossier"), # On renomme la colonne
                 "Plan Action": st.column_config.TextColumn("Plan", width="large"),
                 "Date": st.column_config.DateColumn("Date", format="DD/MM/YYYY"),
+                "ID_Ligne": None, # Colonne technique masquée
             },
             hide_index=True
         )
@@ -380,6 +367,7 @@ with tab2:
         if selected_entry:
             idx_sel = options_map[selected_entry]
             row_sel = df_history.loc[idx_sel]
+            id_sel = str(row_sel["ID_Ligne"]).strip() if pd.notna(row_sel.get("ID_Ligne")) else ""
             
             col_edit, col_del = st.columns([1, 1])
             
@@ -388,13 +376,16 @@ with tab2:
                 if st.button("🗑️ Supprimer définitivement", type="primary"):
                     # Cloud
                     try:
-                        from connect_db import delete_data_flexible
+                        from connect_db import delete_by_id, delete_data_flexible
                         pid = CURRENT_USER_ID
-                        delete_data_flexible("Résolution_Problème", {
-                            "Patient": pid,
-                            "Date": str(row_sel["Date"]),
-                            "Problème": str(row_sel["Problème"])
-                        })
+                        if id_sel:
+                            delete_by_id("Résolution_Problème", id_sel)
+                        else:
+                            delete_data_flexible("Résolution_Problème", {
+                                "Patient": pid,
+                                "Date": str(row_sel["Date"]),
+                                "Problème": str(row_sel["Problème"])
+                            })
                     except: pass
                     
                     # Local
@@ -432,33 +423,37 @@ with tab2:
                     
                     # Validation
                     if st.form_submit_button("💾 Valider les modifications"):
-                        # 1. Suppression Cloud (Ancienne version)
+                        pid = CURRENT_USER_ID
+                        # 1. Nouvelle version
+                        updated_row = {
+                            "Patient": pid,
+                            "Date": str(m_date),
+                            "Problème": m_prob, "Objectif": m_obj,
+                            "Solution Choisie": m_sol, "Plan Action": m_plan,
+                            "Obstacles": m_obs, "Ressources": m_ress,
+                            "Date Évaluation": str(m_eval)
+                        }
+
+                        # 2. Sauvegarde Cloud : mise à jour sur place de la ligne (même ID)
                         try:
-                            from connect_db import delete_data_flexible, save_data
-                            pid = CURRENT_USER_ID
-                            delete_data_flexible("Résolution_Problème", {
-                                "Patient": pid,
-                                "Date": str(row_sel["Date"]),
-                                "Problème": str(row_sel["Problème"])
-                            })
-                            
-                            # 2. Création Nouvelle version
-                            updated_row = {
-                                "Patient": pid,
-                                "Date": str(m_date),
-                                "Problème": m_prob, "Objectif": m_obj,
-                                "Solution Choisie": m_sol, "Plan Action": m_plan,
-                                "Obstacles": m_obs, "Ressources": m_ress,
-                                "Date Évaluation": str(m_eval)
-                            }
-                            
-                            # 3. Sauvegarde Cloud (Nouvelle version)
-                            save_data("Résolution_Problème", [updated_row[c] for c in cols_pb])
-                            
+                            from connect_db import update_by_id, delete_data_flexible, save_data
+                            if id_sel:
+                                update_by_id("Résolution_Problème", id_sel, [updated_row[c] for c in cols_pb])
+                            else:
+                                # Ancienne ligne sans ID : suppression puis recréation
+                                delete_data_flexible("Résolution_Problème", {
+                                    "Patient": pid,
+                                    "Date": str(row_sel["Date"]),
+                                    "Problème": str(row_sel["Problème"])
+                                })
+                                nouvel_id = save_data("Résolution_Problème", [updated_row[c] for c in cols_pb])
+                                if nouvel_id:
+                                    updated_row["ID_Ligne"] = nouvel_id
+
                         except Exception as e:
                             st.warning(f"Erreur Cloud: {e}")
                             
-                        # 4. Mise à jour Locale (Directe dans le dataframe)
+                        # 3. Mise à jour Locale (Directe dans le dataframe)
                         for k, v in updated_row.items():
                             if k in st.session_state.data_problemes.columns:
                                 st.session_state.data_problemes.loc[idx_sel, k] = v
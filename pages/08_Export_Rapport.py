@@ -2,7 +2,6 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 from utils_pdf import generer_pdf
-import concurrent.futures # C'est le module magique pour la vitesse
 
 st.set_page_config(page_title="Export Rapport", page_icon="📩")
 
@@ -23,22 +22,9 @@ st.title("📩 Exporter mon Dossier")
 st.info("Générez un rapport PDF complet incluant toutes vos échelles et agendas.")
 
 # ==============================================================================
-# 1. CHARGEMENT ULTRA-RAPIDE (PARALLÉLISÉ)
+# 1. CHARGEMENT ULTRA-RAPIDE (UNE SEULE REQUÊTE)
 # ==============================================================================
 
-# Fonction de chargement unitaire
-def fetch_data(key):
-    try:
-        from connect_db import load_data
-        data = load_data(key)
-        if data:
-            df = pd.DataFrame(data)
-            if "Patient" in df.columns:
-                # On retourne le dataframe filtré directement
-                return df[df["Patient"] == CURRENT_USER_ID]
-    except: pass
-    return pd.DataFrame()
-
 # Dictionnaire des tables à charger
 TABLES_A_CHARGER = {
     "beck": "Beck",
@@ -54,21 +40,15 @@ TABLES_A_CHARGER = {
     "problemes": "Resolution_Probleme"
 }
 
-data_export = {}
-
-# C'est ici que la magie opère : On lance tout en même temps !
+# C'est ici que la magie opère : tous les onglets arrivent dans le même aller-retour !
 with st.spinner("🚀 Récupération accélérée de vos données..."):
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # On prépare les futures (les tâches)
-        future_to_key = {executor.submit(fetch_data, db_key): dict_key for dict_key, db_key in TABLES_A_CHARGER.items()}
-        
-        # On récolte les résultats au fur et à mesure qu'ils arrivent
-        for future in concurrent.futures.as_completed(future_to_key):
-            key = future_to_key[future]
-            try:
-                data_export[key] = future.result()
-            except Exception:
-                data_export[key] = pd.DataFrame()
+    try:
+        from connect_db import load_many
+        # Le moteur ne renvoie que les lignes du patient connecté
+        donnees = load_many(TABLES_A_CHARGER.values(), CURRENT_USER_ID)
+    except Exception:
+        donnees = {}
+    data_export = {dict_key: donnees.get(db_key, pd.DataFrame()) for dict_key, db_key in TABLES_A_CHARGER.items()}
 
 # ==============================================================================
 # 2. APERÇU DES DONNÉES DISPONIBLES
@@ -26,26 +26,11 @@ if "expo_owner" not in st.session_state or st.session_state.expo_owner != CURREN
     if "data_exposition" in st.session_state: del st.session_state.data_exposition
     st.session_state.expo_owner = CURRENT_USER_ID
 
-# D. LE VIGILE (PERMISSIONS)
-CLE_PAGE = "expo"  # <--- Clé spécifique pour l'Exposition
+# D. LE VIGILE (PERMISSIONS) : test en mémoire, outils résolus une fois par session
+CLE_PAGE = "expo"
 
-if st.session_state.get("user_type") == "patient":
-    try:
-        from connect_db import load_data
-        perms = load_data("Permissions")
-        if perms:
-            df_perm = pd.DataFrame(perms)
-            row = df_perm[df_perm["Patient"] == CURRENT_USER_ID]
-            if not row.empty:
-                bloques = str(row.iloc[0]["Bloques"]).split(",")
-                if CLE_PAGE in [b.strip() for b in bloques]:
-                    st.error("🔒 Cette fonctionnalité n'est pas activée dans votre programme.")
-                    st.info("Voyez avec votre thérapeute si vous pensez qu'il s'agit d'une erreur.")
-                    if st.button("Retour à l'accueil"):
-                        st.switch_page("streamlit_app.py")
-                    st.stop()
-    except Exception as e:
-        pass 
+from permissions import verifier_acces
+verifier_acces(CLE_PAGE)
 
 # ==============================================================================
 # CONTENU PRINCIPAL
@@ -3,6 +3,7 @@ import pandas as pd
 from datetime import datetime, time, timedelta
 import altair as alt # Import déplacé ici pour être propre
 from visualisations import afficher_sommeil
+from sommeil import calculer_metriques, valeurs_a_stocker, format_duree, format_efficacite, recalculer_historique
 
 st.set_page_config(page_title="Agenda du Sommeil", page_icon="🌙")
 
@@ -28,28 +29,11 @@ if "sommeil_owner" not in st.session_state or st.session_state.sommeil_owner !=
     if "data_sommeil" in st.session_state: del st.session_state.data_sommeil
     st.session_state.sommeil_owner = CURRENT_USER_ID
 
-# D. LE VIGILE (PERMISSIONS) - NOUVEAU
-CLE_PAGE = "sommeil" # <--- Changez ceci selon la page (ex: "activites", "conso"...)
+# D. LE VIGILE (PERMISSIONS) : test en mémoire, outils résolus une fois par session
+CLE_PAGE = "sommeil"
 
-if st.session_state.get("user_type") == "patient":
-    try:
-        from connect_db import load_data
-        perms = load_data("Permissions")
-        if perms:
-            df_perm = pd.DataFrame(perms)
-            # On cherche si le patient a des blocages
-            row = df_perm[df_perm["Patient"] == CURRENT_USER_ID]
-            if not row.empty:
-                bloques = str(row.iloc[0]["Bloques"]).split(",")
-                # Si la clé de la page est dans la liste des blocages
-                if CLE_PAGE in [b.strip() for b in bloques]:
-                    st.error("🔒 Cette fonctionnalité n'est pas activée dans votre programme.")
-                    st.info("Voyez avec votre thérapeute si vous pensez qu'il s'agit d'une erreur.")
-                    if st.button("Retour à l'accueil"):
-                        st.switch_page("streamlit_app.py")
-                    st.stop() # Arrêt immédiat
-    except Exception as e:
-        pass # En cas d'erreur technique (ex: pas de connexion), on laisse passer par défaut
+from permissions import verifier_acces
+verifier_acces(CLE_PAGE)
 
 st.title("🌙 Agenda du Sommeil")
 st.info("Remplissez ce formulaire chaque matin pour analyser la qualité de votre sommeil.")
@@ -62,15 +46,24 @@ if "data_sommeil" not in st.session_state:
         "Patient", "Date", "Sieste", 
         "Sport", "Cafeine", "Alcool", "Medic_Sommeil",
         "Heure Coucher", "Latence", "Eveil", 
-        "Heure Lever", "TTE", "TAL", "TTS", "Forme", "Qualité", "Efficacité"
+        "Heure Lever", "TTE", "TAL", "TTS", "Forme", "Qualité", "Efficacité", "Efficacité 7j", "ID_Ligne"
     ]
     df_final = pd.DataFrame(columns=cols_sommeil)
     
+    # Migration unique par session : les nuits stockées en texte ("7h30" / "85%") ou avec une ancienne
+    # formule sont réécrites en nombres, une seule fois par patient (la lecture ci-dessous voit les corrections)
+    if st.session_state.get("sommeil_recalcule") != CURRENT_USER_ID:
+        try:
+            if recalculer_historique(CURRENT_USER_ID) is not False:
+                st.session_state.sommeil_recalcule = CURRENT_USER_ID
+        except: pass
+
     try:
-        from connect_db import load_data
-        data_cloud = load_data("Sommeil")
+        from connect_db import load_patient_rows
+        from schemas import appliquer_schema
+        data_cloud = load_patient_rows("Sommeil", CURRENT_USER_ID)
         if data_cloud:
-            df_cloud = pd.DataFrame(data_cloud)
+            df_cloud = appliquer_schema("Sommeil", pd.DataFrame(data_cloud))
             
             # Correction colonne manquante
             if "Patient" not in df_cloud.columns:
@@ -80,8 +73,6 @@ if "data_sommeil" not in st.session_state:
             for col in cols_sommeil:
                 if col in df_cloud.columns:
                     df_final[col] = df_cloud[col]
-                elif col == "Eveil" and "Eveil Nocturne" in df_cloud.columns:
-                    df_final[col] = df_cloud["Eveil Nocturne"]
 
             # =================================================================
             # 🛑 FILTRAGE SIMPLIFIÉ
@@ -92,23 +83,15 @@ if "data_sommeil" not in st.session_state:
             else:
                 df_final = pd.DataFrame(columns=cols_sommeil)
 
+            # Indicateurs recalculés pour toutes les nuits (les anciens textes "7h30" / "85%" ne sont plus relus)
+            df_final = calculer_metriques(df_final)
+
     except: pass
     st.session_state.data_sommeil = df_final
 
 if "sommeil_units" not in st.session_state:
     st.session_state.sommeil_units = ["Verres", "Tasses", "mg", "cp", "ml", "Pintes"]
 
-# --- FONCTIONS CALCUL ---
-def calculer_duree_minutes(heure_debut, heure_fin):
-    h_deb = heure_debut.hour * 60 + heure_debut.minute
-    h_fin = heure_fin.hour * 60 + heure_fin.minute
-    if h_fin < h_deb: return (24 * 60 - h_deb) + h_fin
-    return h_fin - h_deb
-
-def format_minutes_en_h_m(minutes):
-    h = int(minutes // 60)
-    m = int(minutes % 60)
-    return f"{h}h{m:02d}"
 
 # ==============================================================================
 # ONGLETS
@@ -180,18 +163,6 @@ with tab1:
             alcool_final = "Non" if h_alcool == "Non" else f"{h_alcool} - {q_alcool} {u_alcool}"
             med_final = "Non" if h_med == "Non" else f"{h_med} - {q_med} {u_med}"
 
-            tal_minutes = calculer_duree_minutes(h_coucher, h_lever)
-            tte_minutes = latence + eveil_nocturne
-            tts_minutes = tal_minutes - tte_minutes
-            efficacite = round((tts_minutes / tal_minutes) * 100, 1) if tal_minutes > 0 else 0
-
-            st.success("✅ Données enregistrées !")
-            r1, r2, r3, r4 = st.columns(4)
-            r1.metric("Au lit", format_minutes_en_h_m(tal_minutes))
-            r2.metric("Sommeil", format_minutes_en_h_m(tts_minutes))
-            r3.metric("Éveil", format_minutes_en_h_m(tte_minutes))
-            r4.metric("Efficacité", f"{efficacite} %")
-
             new_row = {
                 "Patient": CURRENT_USER_ID, # Utilisation directe de l'ID session
                 "Date": str(date_nuit),
@@ -199,27 +170,37 @@ with tab1:
                 "Cafeine": cafe_final, "Alcool": alcool_final, "Medic_Sommeil": med_final,
                 "Heure Coucher": str(h_coucher)[:5], "Heure Lever": str(h_lever)[:5],
                 "Latence": latence, "Eveil": eveil_nocturne,
-                "TTE": format_minutes_en_h_m(tte_minutes),
-                "TAL": format_minutes_en_h_m(tal_minutes),
-                "TTS": format_minutes_en_h_m(tts_minutes),
-                "Forme": forme, "Qualité": qualite, "Efficacité": efficacite
+                "Forme": forme, "Qualité": qualite
             }
-            st.session_state.data_sommeil = pd.concat([st.session_state.data_sommeil, pd.DataFrame([new_row])], ignore_index=True)
-            
+            # Même calcul que pour l'historique ; stocké en nombres (minutes, %)
+            new_row.update(valeurs_a_stocker(calculer_metriques(pd.DataFrame([new_row])).iloc[0]))
+
+            st.success("✅ Données enregistrées !")
+            r1, r2, r3, r4 = st.columns(4)
+            r1.metric("Au lit", format_duree(new_row["TAL"]))
+            r2.metric("Sommeil", format_duree(new_row["TTS"]))
+            r3.metric("Éveil", format_duree(new_row["TTE"]))
+            r4.metric("Efficacité", format_efficacite(new_row.get("Efficacité")))
+
             try:
                 from connect_db import save_data
-                save_data("Sommeil", [
+                id_ligne = save_data("Sommeil", [
                     CURRENT_USER_ID, str(date_nuit), 
                     sieste_final, sport_final, cafe_final, alcool_final, med_final,
                     str(h_coucher)[:5], latence, eveil_nocturne, str(h_lever)[:5],
-                    format_minutes_en_h_m(tte_minutes),
-                    format_minutes_en_h_m(tal_minutes),
-                    format_minutes_en_h_m(tts_minutes),
-                    forme, qualite, f"{efficacite}%"
+                    new_row["TTE"], new_row["TAL"], new_row["TTS"],
+                    forme, qualite, new_row["Efficacité"]
                 ])
+                if id_ligne:
+                    new_row["ID_Ligne"] = id_ligne
             except Exception as e:
                 st.error(f"Erreur Cloud : {e}")
 
+            # Efficacité 7j dépend des nuits voisines : recalculée sur tout l'agenda (opérations sur colonnes)
+            st.session_state.data_sommeil = calculer_metriques(
+                pd.concat([st.session_state.data_sommeil, pd.DataFrame([new_row])], ignore_index=True)
+            )
+
     with st.expander("⚙️ Gérer les unités"):
         c_add, c_del = st.columns(2)
         with c_add:
@@ -247,7 +228,7 @@ with tab2:
         df_h = st.session_state.data_sommeil.sort_values(by="Date", ascending=False)
         if not df_h.empty:
             options_history = {
-                f"📅 {row['Date']} | Efficacité: {row.get('Efficacité', '?')}%": i 
+                f"📅 {row['Date']} | Sommeil: {format_duree(row.get('TTS'))} / Au lit: {format_duree(row.get('TAL'))} | Efficacité: {format_efficacite(row.get('Efficacité'))}": i 
                 for i, row in df_h.iterrows()
             }
             choix = st.selectbox("Sélectionnez la nuit à supprimer :", list(options_history.keys()), index=None)
@@ -256,13 +237,19 @@ with tab2:
                 if choix:
                     idx = options_history[choix]
                     row_to_del = df_h.loc[idx]
+                    id_del = str(row_to_del["ID_Ligne"]).strip() if pd.notna(row_to_del.get("ID_Ligne")) else ""
                     
                     try:
-                        from connect_db import delete_data_flexible
-                        delete_data_flexible("Sommeil", {
-                            "Patient": CURRENT_USER_ID, 
-                            "Date": str(row_to_del['Date'])
-                        })
+                        from connect_db import delete_by_id, delete_data_flexible
+                        if id_del:
+                            delete_by_id("Sommeil", id_del)
+                        else:
+                            # Ancienne ligne sans ID : on utilise Date et Heure Coucher comme clés
+                            delete_data_flexible("Sommeil", {
+                                "Patient": CURRENT_USER_ID, 
+                                "Date": str(row_to_del['Date']),
+                                "Heure Coucher": str(row_to_del['Heure Coucher'])[:5]
+                            })
                     except: pass
                     
                     st.session_state.data_sommeil = st.session_state.data_sommeil.drop(idx).reset_index(drop=True)
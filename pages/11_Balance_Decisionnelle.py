@@ -36,28 +36,11 @@ if "balance_owner" not in st.session_state or st.session_state.balance_owner !=
     if "balance_args_current" in st.session_state: del st.session_state.balance_args_current
     st.session_state.balance_owner = CURRENT_USER_ID
 
-# D. LE VIGILE (PERMISSIONS) - NOUVEAU
-CLE_PAGE = "balance" # <--- Changez ceci selon la page (ex: "activites", "conso"...)
+# D. LE VIGILE (PERMISSIONS) : test en mémoire, outils résolus une fois par session
+CLE_PAGE = "balance"
 
-if st.session_state.get("user_type") == "patient":
-    try:
-        from connect_db import load_data
-        perms = load_data("Permissions")
-        if perms:
-            df_perm = pd.DataFrame(perms)
-            # On cherche si le patient a des blocages
-            row = df_perm[df_perm["Patient"] == CURRENT_USER_ID]
-            if not row.empty:
-                bloques = str(row.iloc[0]["Bloques"]).split(",")
-                # Si la clé de la page est dans la liste des blocages
-                if CLE_PAGE in [b.strip() for b in bloques]:
-                    st.error("🔒 Cette fonctionnalité n'est pas activée dans votre programme.")
-                    st.info("Voyez avec votre thérapeute si vous pensez qu'il s'agit d'une erreur.")
-                    if st.button("Retour à l'accueil"):
-                        st.switch_page("streamlit_app.py")
-                    st.stop() # Arrêt immédiat
-    except Exception as e:
-        pass # En cas d'erreur technique (ex: pas de connexion), on laisse passer par défaut
+from permissions import verifier_acces
+verifier_acces(CLE_PAGE)
 
 # === GESTIONNAIRE DE CHARGEMENT (TOP LEVEL) ===
 if "sujet_a_charger" in st.session_state:
@@ -75,13 +58,14 @@ if "data_balance" not in st.session_state:
     df_final = pd.DataFrame(columns=cols_balance)
     
     try:
-        from connect_db import load_data
-        data_cloud = load_data("Balance_Decisionnelle") 
+        from connect_db import load_patient_rows
+        from schemas import appliquer_schema
+        data_cloud = load_patient_rows("Balance_Decisionnelle", CURRENT_USER_ID) 
     except:
         data_cloud = []
 
     if data_cloud:
-        df_cloud = pd.DataFrame(data_cloud)
+        df_cloud = appliquer_schema("Balance_Decisionnelle", pd.DataFrame(data_cloud))
         for col in cols_balance:
             if col in df_cloud.columns:
                 df_final[col] = df_cloud[col]
@@ -305,16 +289,10 @@ with tab2:
         nom_dossier = CURRENT_USER_ID # Par défaut
         
         try:
-            from connect_db import load_data
-            infos = load_data("Codes_Patients")
-            if infos:
-                df_i = pd.DataFrame(infos)
-                # On gère les noms de colonnes possibles
-                col_id = "Identifiant" if "Identifiant" in df_i.columns else "Commentaire"
-                
-                # On trouve la correspondance
-                match = df_i[df_i["Code"] == CURRENT_USER_ID]
-                if not match.empty: nom_dossier = match.iloc[0][col_id]
+            from connect_db import chercher_code_patient
+            compte = chercher_code_patient(CURRENT_USER_ID)
+            # On gère si la colonne s'appelle Identifiant ou Commentaire
+            if compte: nom_dossier = compte.get("Identifiant", compte.get("Commentaire", nom_dossier))
         except: pass
         
         # On remplace dans le tableau d'affichage
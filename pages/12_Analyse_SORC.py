@@ -25,16 +25,11 @@ if not CURRENT_USER_ID:
 # 2. Récupération de l'Identifiant Lisible (PAT-001)
 USER_IDENTIFIER = CURRENT_USER_ID 
 try:
-    from connect_db import load_data
-    infos = load_data("Codes_Patients")
-    if infos:
-        df_infos = pd.DataFrame(infos)
-        code_clean = str(CURRENT_USER_ID).strip().upper()
-        match = df_infos[df_infos["Code"].astype(str).str.strip().str.upper() == code_clean]
-        if not match.empty:
-            col_id = "Identifiant" if "Identifiant" in df_infos.columns else "Commentaire"
-            val = str(match.iloc[0][col_id]).strip()
-            if val: USER_IDENTIFIER = val
+    from connect_db import chercher_code_patient
+    compte = chercher_code_patient(CURRENT_USER_ID)
+    if compte:
+        val = str(compte.get("Identifiant", compte.get("Commentaire", ""))).strip()
+        if val: USER_IDENTIFIER = val
 except: pass
 
 # 3. Système Anti-Fuite
@@ -45,28 +40,11 @@ if "sorc_owner" not in st.session_state or st.session_state.sorc_owner != CURREN
 st.title("🔍 Analyse SORC")
 st.info(f"Dossier : {USER_IDENTIFIER}")
 
-# D. LE VIGILE (PERMISSIONS) - NOUVEAU
-CLE_PAGE = "sorc" # <--- Changez ceci selon la page (ex: "activites", "conso"...)
+# D. LE VIGILE (PERMISSIONS) : test en mémoire, outils résolus une fois par session
+CLE_PAGE = "sorc"
 
-if st.session_state.get("user_type") == "patient":
-    try:
-        from connect_db import load_data
-        perms = load_data("Permissions")
-        if perms:
-            df_perm = pd.DataFrame(perms)
-            # On cherche si le patient a des blocages
-            row = df_perm[df_perm["Patient"] == CURRENT_USER_ID]
-            if not row.empty:
-                bloques = str(row.iloc[0]["Bloques"]).split(",")
-                # Si la clé de la page est dans la liste des blocages
-                if CLE_PAGE in [b.strip() for b in bloques]:
-                    st.error("🔒 Cette fonctionnalité n'est pas activée dans votre programme.")
-                    st.info("Voyez avec votre thérapeute si vous pensez qu'il s'agit d'une erreur.")
-                    if st.button("Retour à l'accueil"):
-                        st.switch_page("streamlit_app.py")
-                    st.stop() # Arrêt immédiat
-    except Exception as e:
-        pass # En cas d'erreur technique (ex: pas de connexion), on laisse passer par défaut
+from permissions import verifier_acces
+verifier_acces(CLE_PAGE)
 
 # ==============================================================================
 # 1. CHARGEMENT DES DONNÉES
@@ -82,10 +60,14 @@ COLS_SORC = [
 if "data_sorc" not in st.session_state:
     df_init = pd.DataFrame(columns=COLS_SORC)
     try:
-        from connect_db import load_data
-        data_cloud = load_data("SORC")
+        from connect_db import load_patient_rows
+        from schemas import appliquer_schema
+        # Les analyses peuvent être rangées sous le code ou sous l'identifiant lisible
+        data_cloud = load_patient_rows("SORC", CURRENT_USER_ID)
+        if str(USER_IDENTIFIER).strip() != str(CURRENT_USER_ID).strip():
+            data_cloud = data_cloud + load_patient_rows("SORC", USER_IDENTIFIER)
         if data_cloud:
-            df_cloud = pd.DataFrame(data_cloud)
+            df_cloud = appliquer_schema("SORC", pd.DataFrame(data_cloud))
             
             if "Patient" not in df_cloud.columns:
                 df_cloud["Patient"] = str(USER_IDENTIFIER)
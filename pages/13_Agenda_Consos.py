@@ -30,28 +30,11 @@ if "conso_owner" not in st.session_state or st.session_state.conso_owner != CURR
     if "liste_substances" in st.session_state: del st.session_state.liste_substances
     st.session_state.conso_owner = CURRENT_USER_ID
 
-# D. LE VIGILE (PERMISSIONS) - NOUVEAU
-CLE_PAGE = "conso" # <--- Changez ceci selon la page (ex: "activites", "conso"...)
+# D. LE VIGILE (PERMISSIONS) : test en mémoire, outils résolus une fois par session
+CLE_PAGE = "conso"
 
-if st.session_state.get("user_type") == "patient":
-    try:
-        from connect_db import load_data
-        perms = load_data("Permissions")
-        if perms:
-            df_perm = pd.DataFrame(perms)
-            # On cherche si le patient a des blocages
-            row = df_perm[df_perm["Patient"] == CURRENT_USER_ID]
-            if not row.empty:
-                bloques = str(row.iloc[0]["Bloques"]).split(",")
-                # Si la clé de la page est dans la liste des blocages
-                if CLE_PAGE in [b.strip() for b in bloques]:
-                    st.error("🔒 Cette fonctionnalité n'est pas activée dans votre programme.")
-                    st.info("Voyez avec votre thérapeute si vous pensez qu'il s'agit d'une erreur.")
-                    if st.button("Retour à l'accueil"):
-                        st.switch_page("streamlit_app.py")
-                    st.stop() # Arrêt immédiat
-    except Exception as e:
-        pass # En cas d'erreur technique (ex: pas de connexion), on laisse passer par défaut
+from permissions import verifier_acces
+verifier_acces(CLE_PAGE)
 
 st.title("🍷 Agenda des Envies & Consommations")
 st.info("Notez vos envies (craving) et vos consommations pour identifier les déclencheurs.")
@@ -75,11 +58,12 @@ if "data_addictions" not in st.session_state:
     
     # Tentative de chargement Cloud
     try:
-        from connect_db import load_data
-        data_cloud = load_data("Addictions")
+        from connect_db import load_patient_rows
+        from schemas import appliquer_schema
+        data_cloud = load_patient_rows("Addictions", CURRENT_USER_ID)
         
         if data_cloud:
-            df_cloud = pd.DataFrame(data_cloud)
+            df_cloud = appliquer_schema("Addictions", pd.DataFrame(data_cloud))
             
             # Remplissage intelligent
             for col in cols_conso:
@@ -95,12 +79,7 @@ if "data_addictions" not in st.session_state:
                 df_final = df_final[df_final["Patient"].astype(str) == str(CURRENT_USER_ID)]
             else:
                 df_final = pd.DataFrame(columns=cols_conso)
-            
-            # Nettoyage numérique
-            for col_num in ["Intensité", "Quantité"]:
-                if col_num in df_final.columns:
-                    df_final[col_num] = df_final[col_num].astype(str).str.replace(',', '.')
-                    df_final[col_num] = pd.to_numeric(df_final[col_num], errors='coerce')
+
 
     except Exception as e:
         pass
@@ -22,28 +22,11 @@ if "who5_owner" not in st.session_state or st.session_state.who5_owner != CURREN
     if "data_who5" in st.session_state: del st.session_state.data_who5
     st.session_state.who5_owner = CURRENT_USER_ID
 
-# D. LE VIGILE (PERMISSIONS) - NOUVEAU
-CLE_PAGE = "who5" # <--- Changez ceci selon la page (ex: "activites", "conso"...)
+# D. LE VIGILE (PERMISSIONS) : test en mémoire, outils résolus une fois par session
+CLE_PAGE = "who5"
 
-if st.session_state.get("user_type") == "patient":
-    try:
-        from connect_db import load_data
-        perms = load_data("Permissions")
-        if perms:
-            df_perm = pd.DataFrame(perms)
-            # On cherche si le patient a des blocages
-            row = df_perm[df_perm["Patient"] == CURRENT_USER_ID]
-            if not row.empty:
-                bloques = str(row.iloc[0]["Bloques"]).split(",")
-                # Si la clé de la page est dans la liste des blocages
-                if CLE_PAGE in [b.strip() for b in bloques]:
-                    st.error("🔒 Cette fonctionnalité n'est pas activée dans votre programme.")
-                    st.info("Voyez avec votre thérapeute si vous pensez qu'il s'agit d'une erreur.")
-                    if st.button("Retour à l'accueil"):
-                        st.switch_page("streamlit_app.py")
-                    st.stop() # Arrêt immédiat
-    except Exception as e:
-        pass # En cas d'erreur technique (ex: pas de connexion), on laisse passer par défaut
+from permissions import verifier_acces
+verifier_acces(CLE_PAGE)
 
 st.title("🌿 Indice de Bien-être (WHO-5)")
 st.caption("Au cours des **2 dernières semaines**, comment vous êtes-vous senti(e) ?")
@@ -56,10 +39,11 @@ COLS_WHO = ["Patient", "Date", "Q1", "Q2", "Q3", "Q4", "Q5", "Score Brut", "Scor
 if "data_who5" not in st.session_state:
     df_init = pd.DataFrame(columns=COLS_WHO)
     try:
-        from connect_db import load_data
-        data_cloud = load_data("WHO5")
+        from connect_db import load_patient_rows
+        from schemas import appliquer_schema
+        data_cloud = load_patient_rows("WHO5", CURRENT_USER_ID)
         if data_cloud:
-            df_cloud = pd.DataFrame(data_cloud)
+            df_cloud = appliquer_schema("WHO5", pd.DataFrame(data_cloud))
             if "Patient" not in df_cloud.columns: df_cloud["Patient"] = str(CURRENT_USER_ID)
             
             for col in COLS_WHO:
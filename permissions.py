@@ -0,0 +1,87 @@
+import threading
+import time
+import streamlit as st
+
+# =========================================================
+# SERVICE DE PERMISSIONS (OUTILS AUTORISÉS D'UN PATIENT)
+# =========================================================
+# Les accès sont résolus une fois par session (frozensets gardés dans st.session_state),
+# puis chaque page outil ne fait qu'un test en mémoire.
+# Le vigile des pages garde la règle d'origine (liste noire) : une page n'est arrêtée que si
+# son outil est bloqué dans l'onglet Permissions. La liste blanche du suivi sert à l'accueil.
+# Quand le thérapeute enregistre les accès, la version du patient change : toutes les sessions
+# de ce patient (dans ce processus) refont la résolution au prochain affichage.
+
+DUREE_MAX = 300  # secondes : filet de sécurité si les accès sont modifiés depuis un autre processus
+
+@st.cache_resource
+def _versions():
+    """Compteur par patient, incrémenté à chaque sauvegarde des accès (commun à toutes les sessions)."""
+    return {"verrou": threading.Lock(), "patients": {}}
+
+def _version(cle):
+    versions = _versions()
+    with versions["verrou"]:
+        return versions["patients"].get(cle, 0)
+
+def _resoudre(patient_id):
+    """
+    Outils bloqués (onglet Permissions, pour le vigile des pages) : seule lecture faite par le vigile.
+    Une lecture impossible lève l'exception : rien n'est alors mémorisé.
+    """
+    from connect_db import load_patient_rows
+
+    bloques = set()
+    for ligne in load_patient_rows("Permissions", patient_id, erreurs=True):
+        bloques |= {b.strip() for b in str(ligne.get("Bloques", "")).split(",") if b.strip()}
+    return {"bloques": frozenset(bloques)}
+
+def _acces(patient_id):
+    cle = str(patient_id).strip()
+    memo = st.session_state.setdefault("permissions_outils", {})
+    version = _version(cle)
+    entree = memo.get(cle)
+    if entree and entree["version"] == version and time.time() - entree["resolu_le"] < DUREE_MAX:
+        return entree
+
+    entree = dict(_resoudre(patient_id), version=version, resolu_le=time.time())
+    memo[cle] = entree
+    return entree
+
+def outils_autorises(patient_id):
+    """frozenset des clés d'outils autorisés au patient (ex: {"sommeil", "beck"}), affichés à l'accueil."""
+    entree = _acces(patient_id)
+    if "autorises" not in entree:
+        # Liste blanche du suivi résolue à la demande (accueil) : le vigile des pages n'en a pas besoin
+        from evenements import etat_patient
+        entree["autorises"] = frozenset(etat_patient(patient_id)["outils"])
+    return entree["autorises"]
+
+def outils_bloques(patient_id):
+    """frozenset des clés d'outils bloqués pour le patient : seules pages que le vigile arrête."""
+    return _acces(patient_id)["bloques"]
+
+def invalider_permissions(patient_id):
+    """À appeler après une sauvegarde des accès d'un patient."""
+    cle = str(patient_id).strip()
+    versions = _versions()
+    with versions["verrou"]:
+        versions["patients"][cle] = versions["patients"].get(cle, 0) + 1
+
+def verifier_acces(cle_page):
+    """
+    Vigile d'une page outil : arrête la page si son outil est bloqué pour le patient connecté.
+    Les thérapeutes passent toujours ; en cas d'erreur technique, on laisse passer par défaut.
+    """
+    if st.session_state.get("user_type") != "patient":
+        return
+    try:
+        bloque = cle_page in outils_bloques(st.session_state.get("user_id", ""))
+    except Exception:
+        return
+    if bloque:
+        st.error("🔒 Cette fonctionnalité n'est pas activée dans votre programme.")
+        st.info("Voyez avec votre thérapeute si vous pensez qu'il s'agit d'une erreur.")
+        if st.button("Retour à l'accueil"):
+            st.switch_page("streamlit_app.py")
+        st.stop() # Arrêt immédiat
@@ -0,0 +1,137 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+# =========================================================
+# PLANIFICATEUR DES APPELS GOOGLE SHEETS (QUOTA)
+# =========================================================
+
+# Plus le chiffre est petit, plus l'appel passe tôt
+PRIORITE_ECRITURE = 0  # Saisie d'un patient / thérapeute : ne doit pas être perdue
+PRIORITE_LECTURE = 1   # Affichage d'une page
+PRIORITE_FOND = 2      # Rafraîchissements en arrière-plan (revalidation des instantanés...)
+
+NOMS_PRIORITES = {PRIORITE_ECRITURE: "ecriture", PRIORITE_LECTURE: "lecture", PRIORITE_FOND: "fond"}
+
+CODES_QUOTA = {429}
+CODES_SERVEUR = {500, 502, 503, 504}
+
+def code_http(erreur):
+    """Code HTTP d'une erreur gspread (APIError), None pour les autres erreurs."""
+    return getattr(getattr(erreur, "response", None), "status_code", None)
+
+class Planificateur:
+    """
+    Fait passer les appels au stockage un par un dans une file à priorités, au rythme du quota.
+
+    - Seau à jetons : QUOTA_PAR_MINUTE jetons, qui se remplissent en continu ; un appel consomme un jeton.
+      Les pointes (lundi matin, questionnaires hebdomadaires) attendent leur tour au lieu d'échouer.
+    - Priorités : une écriture en attente passe avant les lectures, qui passent avant les tâches de fond.
+    - Erreurs 429 (quota) et 5xx : nouvel essai après une attente exponentielle (avec une part d'aléatoire).
+      Un 429 vide aussi le seau, pour que tous les appels ralentissent ensemble.
+    """
+    QUOTA_PAR_MINUTE = 60  # Quota Sheets par défaut : 60 requêtes / minute / utilisateur
+    ESSAIS_MAX = 5
+    ATTENTE_BASE = 1.0  # secondes (1, 2, 4, 8...)
+    ATTENTE_MAX = 32.0
+
+    def __init__(self, quota_par_minute=None):
+        self.capacite = float(quota_par_minute or self.QUOTA_PAR_MINUTE)
+        self.debit = self.capacite / 60.0  # jetons par seconde
+        self.jetons = self.capacite
+        self._remplissage = time.monotonic()
+        self._file = []  # tas de (priorité, numéro d'arrivée)
+        self._arrivees = itertools.count()
+        self._condition = threading.Condition()
+        self._compteurs = {"executes": 0, "reessais": 0, "echecs": 0, "attente_totale": 0.0}
+
+    # --- Seau à jetons ---
+
+    def _remplir(self):
+        maintenant = time.monotonic()
+        self.jetons = min(self.capacite, self.jetons + (maintenant - self._remplissage) * self.debit)
+        self._remplissage = maintenant
+
+    def _attendre_son_tour(self, priorite):
+        """Bloque jusqu'à être en tête de file (priorité, puis ordre d'arrivée) avec un jeton disponible."""
+        ticket = (priorite, next(self._arrivees))
+        debut = time.monotonic()
+        with self._condition:
+            heapq.heappush(self._file, ticket)
+            try:
+                while True:
+                    self._remplir()
+                    en_tete = self._file[0] == ticket
+                    if en_tete and self.jetons >= 1:
+                        break
+                    # En tête : on dort jusqu'au prochain jeton ; sinon jusqu'à ce que la file avance
+                    self._condition.wait((1 - self.jetons) / self.debit if en_tete else None)
+            except BaseException:
+                self._file.remove(ticket)
+                heapq.heapify(self._file)
+                self._condition.notify_all()
+                raise
+            heapq.heappop(self._file)
+            self.jetons -= 1
+            self._compteurs["attente_totale"] += time.monotonic() - debut
+            self._condition.notify_all()
+
+    def _ralentir(self):
+        """Quota dépassé côté Google : plus aucun jeton d'avance."""
+        with self._condition:
+            self._remplir()
+            self.jetons = min(self.jetons, 0.0)
+
+    def _compter(self, cle):
+        with self._condition:
+            self._compteurs[cle] += 1
+
+    # --- Exécution ---
+
+    def executer(self, action, priorite=PRIORITE_LECTURE, idempotent=True):
+        """
+        Exécute action() à son tour et retourne son résultat.
+        idempotent=False : pas de nouvel essai sur une erreur 5xx (l'ajout a pu être fait malgré l'erreur ;
+        le refaire créerait un doublon). Un 429 est toujours réessayé : Google a refusé la requête.
+        """
+        for essai in range(self.ESSAIS_MAX):
+            self._attendre_son_tour(priorite)
+            try:
+                resultat = action()
+            except Exception as e:
+                code = code_http(e)
+                reessayable = code in CODES_QUOTA or (idempotent and code in CODES_SERVEUR)
+                if not reessayable or essai == self.ESSAIS_MAX - 1:
+                    self._compter("echecs")
+                    raise
+                self._compter("reessais")
+                if code in CODES_QUOTA:
+                    self._ralentir()
+                time.sleep(min(self.ATTENTE_MAX, self.ATTENTE_BASE * 2 ** essai) * random.uniform(0.5, 1.0))
+                continue
+            self._compter("executes")
+            return resultat
+
+    # --- Métriques ---
+
+    def metriques(self):
+        """Profondeur de la file (par priorité), jetons disponibles et compteurs depuis le démarrage."""
+        with self._condition:
+            self._remplir()
+            file = {nom: 0 for nom in NOMS_PRIORITES.values()}
+            for priorite, _ in self._file:
+                file[NOMS_PRIORITES.get(priorite, str(priorite))] += 1
+            compteurs = dict(self._compteurs)
+        servis = compteurs["executes"] + compteurs["echecs"] + compteurs["reessais"]
+        return {
+            "profondeur": sum(file.values()),
+            "file": file,
+            "jetons": round(self.jetons, 1),
+            "capacite": self.capacite,
+            "executes": compteurs["executes"],
+            "reessais": compteurs["reessais"],
+            "echecs": compteurs["echecs"],
+            "attente_moyenne": round(compteurs["attente_totale"] / servis, 3) if servis else 0.0,
+        }
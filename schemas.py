@@ -0,0 +1,210 @@
+import threading
+import pandas as pd
+
+# =========================================================
+# 1. TYPES DE COLONNES
+# =========================================================
+# "texte"     : laissé tel quel
+# "categorie" : valeurs répétées d'une liste fermée (Patient, Sévérité...) -> dtype category.
+#               Jamais pour un texte libre : les pages modifient les lignes sur place (.loc, data_editor)
+#               et une catégorie refuse toute valeur qu'elle ne connaît pas déjà.
+# "echelle"   : note 0-10 (ou 1-5) -> entier compact (Int8)
+# "entier"    : compteur / score -> plus petit entier nullable qui convient (Int8, Int16...)
+# "decimal"   : nombre à virgule, tolère "85,5" et "85 %" -> float32
+# "date" / "heure" : gardées en texte (les suppressions comparent str(Date)),
+#                    mais converties une seule fois par valeur via colonne_dates()
+
+FORMAT_DATE = "%Y-%m-%d"
+FORMAT_DATE_HEURE = "%Y-%m-%d %H:%M"
+
+# Colonnes présentes dans presque tous les onglets
+COLONNES_COMMUNES = {
+    "Patient": "categorie",
+    "Date": "date",
+    "Heure": "heure",
+    "ID_Ligne": "texte",
+}
+
+_ECHELLES_PHQ9 = {f"Q{i}": "echelle" for i in range(1, 10)}
+_ECHELLES_GAD7 = {f"Q{i}": "echelle" for i in range(1, 8)}
+_ECHELLES_5 = {f"Q{i}": "echelle" for i in range(1, 6)}
+
+_RESOLUTION = {
+    "colonnes": {"Date Évaluation": "date"},
+    "alias": {"Plan_Action": "Plan Action", "Solution_Choisie": "Solution Choisie", "Date_Evaluation": "Date Évaluation"},
+}
+
+# =========================================================
+# 2. REGISTRE DES ONGLETS
+# =========================================================
+# Pour chaque onglet : types des colonnes (en plus des communes) et anciens noms de colonnes
+SCHEMAS = {
+    "Beck": {
+        "colonnes": {
+            "Émotion": "texte",  # Saisie libre (st.text_input)
+            "Intensité (Avant)": "echelle", "Croyance (Avant)": "echelle",
+            "Croyance (Rationnelle)": "echelle",
+            "Intensité (Après)": "echelle", "Croyance (Après)": "echelle",
+        },
+    },
+    "Activites": {
+        "colonnes": {"Plaisir (0-10)": "echelle", "Maîtrise (0-10)": "echelle", "Satisfaction (0-10)": "echelle"},
+    },
+    "Humeur": {
+        "colonnes": {"Humeur Globale (0-10)": "echelle"},
+    },
+    "Sommeil": {
+        "colonnes": {
+            "Heure Coucher": "heure", "Heure Lever": "heure",
+            "Latence": "entier", "Eveil": "entier",
+            "Forme": "echelle", "Qualité": "echelle", "Efficacité": "decimal",
+        },
+        "alias": {"Eveil Nocturne": "Eveil"},
+    },
+    "Addictions": {
+        "colonnes": {
+            "Substance": "texte", "Type": "categorie", "Unité": "texte",  # Substances et unités : ajoutées par le patient
+            "Intensité": "decimal", "Quantité": "decimal",
+        },
+    },
+    "Compulsions": {
+        "colonnes": {"Répétitions": "entier", "Durée (min)": "entier"},
+    },
+    "SORC": {
+        "colonnes": {"Intensité Emo": "echelle", "Douleur Active": "categorie", "Intensité Douleur": "echelle"},
+    },
+    "Résolution_Problème": _RESOLUTION,
+    "Resolution_Probleme": _RESOLUTION,
+    "Balance_Decisionnelle": {
+        "colonnes": {"Score": "decimal"},
+    },
+    "Evitements": {
+        "colonnes": {"Anxiété": "echelle"},
+    },
+    "Expositions": {
+        "colonnes": {"Type": "categorie", "Score1": "echelle", "Score2": "echelle", "Score3": "echelle"},
+    },
+    "PHQ9": {
+        "colonnes": {**_ECHELLES_PHQ9, "Score Total": "entier", "Impact": "categorie", "Sévérité": "categorie"},
+    },
+    "GAD7": {
+        "colonnes": {**_ECHELLES_GAD7, "Score Total": "entier", "Impact": "categorie", "Sévérité": "categorie"},
+    },
+    "ISI": {
+        "colonnes": {
+            "Q1a": "echelle", "Q1b": "echelle", "Q1c": "echelle",
+            "Q2": "echelle", "Q3": "echelle", "Q4": "echelle", "Q5": "echelle",
+            "Score Total": "entier", "Sévérité": "categorie",
+        },
+    },
+    "PEG": {
+        "colonnes": {"Q1": "echelle", "Q2": "echelle", "Q3": "echelle", "Score Moyen": "decimal", "Interprétation": "categorie"},
+    },
+    "WSAS": {
+        "colonnes": {**_ECHELLES_5, "Score Total": "entier", "Sévérité": "categorie"},
+    },
+    "WHO5": {
+        "colonnes": {**_ECHELLES_5, "Score Brut": "entier", "Score Pourcent": "entier"},
+    },
+    "Reponses_Hebdo": {
+        "colonnes": {"Questionnaire": "categorie", "Score_Global": "decimal"},
+    },
+}
+
+# =========================================================
+# 3. CONVERSIONS
+# =========================================================
+
+def en_nombres(serie):
+    """Convertit une colonne en nombres ("85,5", "85 %" acceptés). Ne fait rien si elle l'est déjà."""
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie
+    textes = serie.astype(str).str.replace("%", "", regex=False).str.replace(",", ".", regex=False).str.strip()
+    return pd.to_numeric(textes, errors="coerce")
+
+def _entier_compact(nombres):
+    """Plus petit entier nullable qui contient toutes les valeurs (float32 si valeurs décimales)."""
+    valeurs = nombres.dropna()
+    if valeurs.empty:
+        return nombres.astype("Int8")
+    if not (valeurs % 1 == 0).all():
+        return nombres.astype("float32")
+    mini, maxi = valeurs.min(), valeurs.max()
+    for dtype, borne in (("Int8", 127), ("Int16", 32767), ("Int32", 2**31 - 1)):
+        if -borne - 1 <= mini and maxi <= borne:
+            return nombres.astype(dtype)
+    return nombres.astype("Int64")
+
+def _convertir(serie, type_colonne):
+    if type_colonne == "categorie":
+        return serie if isinstance(serie.dtype, pd.CategoricalDtype) else serie.astype("category")
+    if type_colonne in ("echelle", "entier"):
+        if pd.api.types.is_integer_dtype(serie) and str(serie.dtype) in ("Int8", "Int16", "Int32"):
+            return serie
+        return _entier_compact(en_nombres(serie))
+    if type_colonne == "decimal":
+        if str(serie.dtype) == "float32":
+            return serie
+        return en_nombres(serie).astype("float32")
+    return serie  # texte, date, heure
+
+def schema_onglet(nom_onglet):
+    """Types de toutes les colonnes connues d'un onglet (communes comprises)."""
+    schema = SCHEMAS.get(nom_onglet, {})
+    return {**COLONNES_COMMUNES, **schema.get("colonnes", {})}
+
+def appliquer_schema(nom_onglet, df):
+    """
+    Renomme les anciennes colonnes et type le DataFrame d'un onglet.
+    À appeler une fois au chargement ; un second appel ne refait aucune conversion.
+    """
+    if df is None or df.empty:
+        return df
+
+    alias = SCHEMAS.get(nom_onglet, {}).get("alias", {})
+    renommage = {a: c for a, c in alias.items() if a in df.columns and c not in df.columns}
+    df = df.rename(columns=renommage) if renommage else df.copy()
+
+    for col, type_colonne in schema_onglet(nom_onglet).items():
+        if col in df.columns:
+            df[col] = _convertir(df[col], type_colonne)
+    return df
+
+# =========================================================
+# 4. DATES (CONVERSION MÉMORISÉE)
+# =========================================================
+# Une même date revient sur des dizaines de lignes et à chaque affichage :
+# chaque texte n'est converti qu'une fois par processus.
+_DATES_CONNUES = {}
+_VERROU_DATES = threading.Lock()
+_TAILLE_MAX_DATES = 100_000
+
+def colonne_dates(serie, fmt=FORMAT_DATE):
+    """Équivalent de pd.to_datetime(serie, errors='coerce'), avec mémorisation par valeur."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+
+    textes = serie.astype(str).str.strip()
+    uniques = pd.unique(textes)
+    with _VERROU_DATES:
+        inconnues = [t for t in uniques if (fmt, t) not in _DATES_CONNUES]
+
+    if inconnues:
+        brutes = pd.Series(inconnues, dtype=object)
+        dates = pd.to_datetime(brutes, format=fmt, errors="coerce")
+        ratees = dates.isna() & ~brutes.isin(["", "nan", "None", "NaT"])
+        if ratees.any():
+            # Anciens formats (ex: 05/01/2024 ou avec secondes) : conversion générique, comme avant
+            dates[ratees] = pd.to_datetime(brutes[ratees], errors="coerce")
+        with _VERROU_DATES:
+            if len(_DATES_CONNUES) > _TAILLE_MAX_DATES:
+                _DATES_CONNUES.clear()
+            _DATES_CONNUES.update({(fmt, t): d for t, d in zip(inconnues, dates)})
+
+    with _VERROU_DATES:
+        correspondance = {t: _DATES_CONNUES.get((fmt, t), pd.NaT) for t in uniques}
+    return pd.to_datetime(textes.map(correspondance), errors="coerce")
+
+def colonne_date_heure(dates, heures):
+    """Date + Heure (ex: '2024-01-05' + '14:30') en datetime, avec la même mémorisation."""
+    return colonne_dates(dates.astype(str) + " " + heures.astype(str).str[:5], FORMAT_DATE_HEURE)
@@ -0,0 +1,123 @@
+import pandas as pd
+
+from schemas import en_nombres, colonne_dates, SCHEMAS
+from stockage import ENTETES_ONGLETS, COLONNE_ID
+
+# =========================================================
+# INDICATEURS DE L'AGENDA DU SOMMEIL
+# =========================================================
+# Tous les indicateurs d'une nuit sont calculés ici, pour toutes les nuits d'un coup
+# (opérations sur colonnes), à partir des seules saisies : heures de coucher / lever, latence, éveils.
+# Ils sont stockés en nombres (minutes, pourcentage) : si une formule change, on recalcule
+# l'historique (recalculer_historique) au lieu de relire des textes comme "7h30" ou "85%".
+
+MINUTES_JOUR = 24 * 60
+DUREES = ["TTE", "TAL", "TTS"]  # Temps d'éveil, temps au lit, temps total de sommeil (minutes)
+FENETRE_GLISSANTE = "7D"
+
+def minutes_depuis_minuit(serie):
+    """Heures "23:15", "23:15:00", "7h30" (ou datetime.time) -> minutes depuis minuit, NaN si illisible."""
+    parties = serie.astype(str).str.strip().str.extract(r"^(\d{1,2})\s*[:hH]\s*(\d{2})?")
+    heures = pd.to_numeric(parties[0], errors="coerce")
+    minutes = pd.to_numeric(parties[1], errors="coerce").fillna(0)
+    return (heures * 60 + minutes).where(heures < 24)
+
+def duree_en_minutes(serie):
+    """Durée enregistrée : nombre de minutes (450) ou ancien texte ("7h30") -> minutes, NaN si illisible."""
+    nombres = pd.to_numeric(serie, errors="coerce")
+    parties = serie.astype(str).str.strip().str.extract(r"^(\d+)\s*[hH]\s*(\d{1,2})?$")
+    anciennes = pd.to_numeric(parties[0], errors="coerce") * 60 + pd.to_numeric(parties[1], errors="coerce").fillna(0)
+    return nombres.fillna(anciennes)
+
+def _colonne(df, nom):
+    return df[nom] if nom in df.columns else pd.Series(float("nan"), index=df.index)
+
+def calculer_metriques(df):
+    """
+    Copie de l'agenda avec, pour toutes les nuits :
+    - TAL : temps au lit, du coucher au lever (en passant minuit si le lever est plus tôt que le coucher) ;
+    - TTE : temps d'éveil au lit (latence + éveils nocturnes) ; TTS : TAL - TTE (jamais négatif) ;
+    - Efficacité : TTS / TAL en %, arrondie à 0,1 ;
+    - Efficacité 7j : somme des TTS / somme des TAL des nuits des 7 derniers jours (fenêtre glissante).
+    Durées en minutes. Une nuit sans heures ni durées lisibles garde les valeurs déjà enregistrées.
+    """
+    df = df.copy()
+    coucher = minutes_depuis_minuit(_colonne(df, "Heure Coucher"))
+    lever = minutes_depuis_minuit(_colonne(df, "Heure Lever"))
+    latence = en_nombres(_colonne(df, "Latence")).astype(float)  # float : pas de débordement des petits entiers (Int8)
+    eveil = en_nombres(_colonne(df, "Eveil")).astype(float)
+    anciennes = {c: duree_en_minutes(_colonne(df, c)) for c in DUREES}
+
+    tal = ((lever - coucher) % MINUTES_JOUR).fillna(anciennes["TAL"])
+    tte = (latence.fillna(0) + eveil.fillna(0)).where(latence.notna() | eveil.notna(), anciennes["TTE"])
+    tts = (tal - tte.fillna(0)).clip(lower=0).fillna(anciennes["TTS"])
+
+    efficacite = (tts * 100 / tal.where(tal > 0)).round(1).mask(tal == 0, 0.0)
+    df["TAL"], df["TTE"], df["TTS"] = tal, tte, tts
+    df["Efficacité"] = efficacite.fillna(en_nombres(_colonne(df, "Efficacité")).astype(float))
+
+    # Efficacité glissante : nuits triées par date, fenêtre de 7 jours calendaires (nuits manquantes ignorées)
+    nuits = pd.DataFrame({
+        "Jour": colonne_dates(_colonne(df, "Date").astype(str)).to_numpy(), "TTS": tts.to_numpy(), "TAL": tal.to_numpy()
+    }).dropna(subset=["Jour"]).sort_values("Jour", kind="stable")
+    glissante = pd.Series(float("nan"), index=range(len(df)))
+    if not nuits.empty:
+        cumul = nuits.set_index("Jour")[["TTS", "TAL"]].rolling(FENETRE_GLISSANTE).sum()
+        glissante.loc[nuits.index] = (cumul["TTS"] * 100 / cumul["TAL"].where(cumul["TAL"] > 0)).round(1).to_numpy()
+    df["Efficacité 7j"] = glissante.to_numpy()
+    return df
+
+def valeurs_a_stocker(metriques):
+    """Ligne de calculer_metriques -> {colonne: valeur} à écrire (minutes entières, efficacité en nombre)."""
+    valeurs = {c: int(round(metriques[c])) for c in DUREES if pd.notna(metriques[c])}
+    if pd.notna(metriques["Efficacité"]):
+        valeurs["Efficacité"] = float(metriques["Efficacité"])
+    return valeurs
+
+def format_duree(minutes):
+    """Minutes -> "7h30" pour l'affichage, "-" si la durée est inconnue."""
+    if pd.isna(minutes):
+        return "-"
+    minutes = int(round(float(minutes)))
+    return f"{minutes // 60}h{minutes % 60:02d}"
+
+def format_efficacite(valeur):
+    """Efficacité en % -> "85 %" (arrondie à l'unité) pour l'affichage, "-" si inconnue."""
+    if pd.isna(valeur):
+        return "-"
+    return f"{round(float(valeur))} %"
+
+def recalculer_historique(patient_id):
+    """
+    Recalcule TTE / TAL / TTS / Efficacité de toutes les nuits enregistrées du patient et réécrit
+    les lignes dont la valeur stockée diffère (ancien texte "7h30" / "85%", ou formule modifiée).
+    Retourne le nombre de lignes réécrites, False si une écriture échoue.
+    """
+    from connect_db import load_patient_rows, update_by_id
+
+    lignes = load_patient_rows("Sommeil", patient_id)
+    if not lignes:
+        return 0
+    df = pd.DataFrame(lignes)
+    alias = {a: c for a, c in SCHEMAS["Sommeil"].get("alias", {}).items() if a in df.columns and c not in df.columns}
+    calcule = calculer_metriques(df.rename(columns=alias))
+
+    colonnes = DUREES + ["Efficacité"]
+    differe = pd.Series(False, index=df.index)
+    for colonne in colonnes:
+        stocke = pd.to_numeric(_colonne(df, colonne), errors="coerce")
+        differe |= calcule[colonne].notna() & ~((stocke - calcule[colonne]).abs() < 0.05)
+
+    entetes = ENTETES_ONGLETS["Sommeil"]
+    anciens_noms = {nouveau: ancien for ancien, nouveau in SCHEMAS["Sommeil"].get("alias", {}).items()}
+    reecrites = 0
+    for i in differe[differe].index:
+        ligne = lignes[i]
+        if not ligne.get(COLONNE_ID):
+            continue  # Ligne sans identifiant (ancienne feuille non migrée) : pas de réécriture ciblée possible
+        nouvelles = valeurs_a_stocker(calcule.loc[i])
+        valeurs = [nouvelles.get(c, ligne.get(c, ligne.get(anciens_noms.get(c), ""))) for c in entetes]
+        if update_by_id("Sommeil", ligne[COLONNE_ID], valeurs) is False:
+            return False
+        reecrites += 1
+    return reecrites
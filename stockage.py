@@ -0,0 +1,1230 @@
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+# =========================================================
+# 1. STRUCTURE DES ONGLETS
+# =========================================================
+
+NOM_CLASSEUR = "TCC_Base_Donnees"
+
+# En-têtes connus de chaque onglet (même ordre que les listes envoyées par save_data).
+# Google Sheets lit ses en-têtes dans la ligne 1 ; le moteur SQLite s'en sert pour créer ses tables.
+ENTETES_ONGLETS = {
+    "Utilisateurs": ["Identifiant", "MotDePasse", "DateInscription"],
+    "Therapeutes": ["ID", "Identifiant", "MotDePasse"],
+    "Codes_Patients": ["Code", "Therapeute_ID", "Identifiant", "Date_Creation"],
+    "Permissions": ["Patient", "Bloques"],
+    "Outils_Autorises": ["Patient", "Outils"],
+    "Progression": ["Patient", "Modules_Actifs"],
+    "Suivi_Validation": ["Patient", "Modules_Valides", "Commentaires"],
+    "Suivi_Devoirs": ["Patient", "Donnees_Json"],
+    "Notes_Seance": ["Patient", "Donnees_Json"],
+    # Suivi du protocole en événements (remplace les 5 onglets ci-dessus, gardés pour les anciens dossiers)
+    "Evenements_Suivi": ["Patient", "Date", "Type", "Cle", "Valeur", "Auteur"],
+    "Reponses_Hebdo": ["Patient", "Date", "Questionnaire", "Score_Global", "Details"],
+    "Beck": [
+        "Patient", "Date", "Situation", "Émotion", "Intensité (Avant)",
+        "Pensée Auto", "Croyance (Avant)", "Pensée Rationnelle",
+        "Croyance (Rationnelle)", "Intensité (Après)", "Croyance (Après)"
+    ],
+    "Activites": ["Patient", "Date", "Heure", "Activité", "Plaisir (0-10)", "Maîtrise (0-10)", "Satisfaction (0-10)"],
+    "Humeur": ["Patient", "Date", "Humeur Globale (0-10)"],
+    "Sommeil": [
+        "Patient", "Date", "Sieste", "Sport", "Cafeine", "Alcool", "Medic_Sommeil",
+        "Heure Coucher", "Latence", "Eveil", "Heure Lever", "TTE", "TAL", "TTS",
+        "Forme", "Qualité", "Efficacité"
+    ],
+    "Addictions": ["Patient", "Date", "Heure", "Substance", "Type", "Intensité", "Quantité", "Unité", "Pensées"],
+    "Compulsions": ["Patient", "Date", "Heure", "Nature", "Répétitions", "Durée (min)"],
+    "SORC": [
+        "Patient", "Date", "Heure", "Situation", "Pensées", "Émotions", "Intensité Emo",
+        "Douleur Active", "Desc Douleur", "Intensité Douleur",
+        "Réponse", "Csq Court Terme", "Csq Long Terme"
+    ],
+    "Résolution_Problème": [
+        "Patient", "Date", "Problème", "Objectif", "Solution Choisie",
+        "Plan Action", "Obstacles", "Ressources", "Date Évaluation"
+    ],
+    "Balance_Decisionnelle": ["Patient", "Date", "Sujet", "Option Gagnante", "Détail Arguments", "Score"],
+    "Evitements": ["Patient", "Date", "Crainte", "Situation", "Attente", "Conséquence", "Anxiété"],
+    "Expositions": ["Patient", "Date", "Crainte", "Situation", "Type", "Details", "Score1", "Score2", "Score3", "Notes"],
+    "PHQ9": ["Patient", "Date", "Q1", "Q2", "Q3", "Q4", "Q5", "Q6", "Q7", "Q8", "Q9", "Score Total", "Impact", "Sévérité"],
+    "GAD7": ["Patient", "Date", "Q1", "Q2", "Q3", "Q4", "Q5", "Q6", "Q7", "Score Total", "Impact", "Sévérité"],
+    "ISI": ["Patient", "Date", "Q1a", "Q1b", "Q1c", "Q2", "Q3", "Q4", "Q5", "Score Total", "Sévérité"],
+    "PEG": ["Patient", "Date", "Q1", "Q2", "Q3", "Score Moyen", "Interprétation"],
+    "WSAS": ["Patient", "Date", "Q1", "Q2", "Q3", "Q4", "Q5", "Score Total", "Sévérité"],
+    "WHO5": ["Patient", "Date", "Q1", "Q2", "Q3", "Q4", "Q5", "Score Brut", "Score Pourcent"],
+}
+
+# Onglets où l'on ne fait presque qu'ajouter des lignes (agendas, questionnaires) :
+# le moteur Sheets en garde une copie et ne télécharge que les lignes nouvelles
+ONGLETS_AJOUT_SEUL = {"Sommeil", "Activites", "Addictions", "Compulsions", "Reponses_Hebdo", "Evenements_Suivi"}
+
+# Identifiants et mots de passe : jamais écrits dans les instantanés disque, toujours lus à jour
+ONGLETS_SANS_INSTANTANE = {"Utilisateurs", "Therapeutes", "Codes_Patients"}
+
+# Identifiant immuable attribué à chaque ligne ajoutée (dernière colonne de chaque onglet)
+COLONNE_ID = "ID_Ligne"
+
+def nouvel_id():
+    """Génère un identifiant de ligne court et unique."""
+    return uuid.uuid4().hex[:12]
+
+def en_record(nom_onglet, valeurs, id_ligne):
+    """Liste de valeurs (ordre de save_data) -> dictionnaire au format de lire_onglet."""
+    entetes = list(ENTETES_ONGLETS.get(nom_onglet, []))
+    entetes += [f"Colonne_{n}" for n in range(len(entetes) + 1, len(valeurs) + 1)]
+    record = {c: "" for c in entetes}
+    record.update(zip(entetes, valeurs))
+    record[COLONNE_ID] = id_ligne
+    return record
+
+def correspond(enregistrement, criteres_dict):
+    """Vérifie qu'un enregistrement respecte tous les critères (comparaison en string)."""
+    for key, val in criteres_dict.items():
+        if str(enregistrement.get(key)) != str(val):
+            return False
+    return True
+
+# =========================================================
+# 2. INTERFACE COMMUNE
+# =========================================================
+
+class MoteurStockage:
+    """
+    Contrat minimal d'un moteur de stockage.
+    Les fonctions de connect_db (save_data, load_data, delete_data_flexible) ne parlent qu'à cette interface.
+    Les méthodes lèvent des exceptions : c'est connect_db qui décide comment les afficher.
+    """
+    nom = "abstrait"
+    planificateur = None  # Planificateur des appels (quota) ; None = appels directs
+
+    def ajouter_ligne(self, nom_onglet, valeurs):
+        """
+        Ajoute une ligne (liste ordonnée comme les en-têtes) à la fin de l'onglet.
+        Retourne l'ID_Ligne attribué à la nouvelle ligne.
+        """
+        raise NotImplementedError
+
+    def ajouter_lignes(self, nom_onglet, lignes, ids=None):
+        """
+        Ajoute plusieurs lignes en une seule écriture.
+        ids : ID_Ligne déjà attribués (file d'écriture différée) ; générés sinon. Retourne la liste des ID_Ligne.
+        """
+        raise NotImplementedError
+
+    def ids_existants(self, nom_onglet, ids):
+        """Parmi ces ID_Ligne, ceux qui sont présents dans l'onglet (pour ne pas renvoyer une ligne déjà écrite)."""
+        cherches = {str(i) for i in ids}
+        return {str(r.get(COLONNE_ID)) for r in self.lire_onglet(nom_onglet)} & cherches
+
+    def chercher_id(self, nom_onglet, criteres_dict):
+        """ID_Ligne de la première ligne qui respecte les critères, None si aucune."""
+        for r in self.lire_onglet(nom_onglet):
+            if correspond(r, criteres_dict):
+                return str(r.get(COLONNE_ID, "")) or None
+        return None
+
+    def lire_onglet(self, nom_onglet):
+        """Retourne toutes les lignes de l'onglet sous forme de liste de dictionnaires."""
+        raise NotImplementedError
+
+    def supprimer_ligne(self, nom_onglet, criteres_dict):
+        """Supprime la première ligne qui respecte les critères. Retourne True si une ligne a été supprimée."""
+        raise NotImplementedError
+
+    def supprimer_par_id(self, nom_onglet, id_ligne):
+        """Supprime la ligne portant cet ID_Ligne. Retourne True si une ligne a été supprimée."""
+        raise NotImplementedError
+
+    def modifier_par_id(self, nom_onglet, id_ligne, valeurs):
+        """Remplace sur place les valeurs de la ligne portant cet ID_Ligne (l'ID ne change pas)."""
+        raise NotImplementedError
+
+    def remplacer_ou_ajouter(self, nom_onglet, colonnes_cles, valeurs, id_ligne=None):
+        """
+        Upsert : réécrit sur place la ligne dont les colonnes clés ont les mêmes valeurs que 'valeurs',
+        ou l'ajoute si elle n'existe pas. Retourne l'ID_Ligne de la ligne écrite.
+        id_ligne : ID donné à la ligne écrite (connu avant l'écriture : journal), sinon elle garde le sien.
+        Version par défaut : lecture complète puis modifier_par_id / ajouter_lignes
+        (suppression + ajout si la ligne existante doit changer d'ID).
+        """
+        records = self.lire_onglet(nom_onglet)
+        if records:
+            entetes = list(records[0].keys())
+            criteres = {c: valeurs[entetes.index(c)] for c in colonnes_cles}
+            for row in records:
+                if correspond(row, criteres) and row.get(COLONNE_ID):
+                    if id_ligne is None or str(row[COLONNE_ID]) == str(id_ligne):
+                        self.modifier_par_id(nom_onglet, row[COLONNE_ID], valeurs)
+                        return row[COLONNE_ID]
+                    self.supprimer_par_id(nom_onglet, row[COLONNE_ID])
+                    break
+        return self.ajouter_lignes(nom_onglet, [valeurs], [id_ligne] if id_ligne else None)[0]
+
+    def lire_plusieurs(self, noms_onglets, patient_id):
+        """
+        Retourne {onglet: lignes du patient} pour plusieurs onglets d'un coup.
+        Version par défaut : un lire_lignes_patient par onglet. Google Sheets le fait en une requête.
+        """
+        return {nom: self.lire_lignes_patient(nom, patient_id) for nom in noms_onglets}
+
+    def lire_lignes_patient(self, nom_onglet, patient_id):
+        """
+        Retourne uniquement les lignes d'un patient (liste vide si l'onglet n'a pas de colonne 'Patient').
+        Version par défaut : lecture complète puis filtre. Les moteurs la remplacent par une lecture indexée.
+        """
+        cible = str(patient_id).strip()
+        return [r for r in self.lire_onglet(nom_onglet) if str(r.get("Patient", "")).strip() == cible]
+
+# =========================================================
+# 3. MOTEUR GOOGLE SHEETS (PRODUCTION)
+# =========================================================
+
+class MoteurGoogleSheets(MoteurStockage):
+    """
+    Stockage historique : un onglet du classeur TCC_Base_Donnees par table.
+
+    Pour les lectures par patient et les accès par ID, on garde en mémoire un index par onglet :
+    Patient -> numéros de lignes et ID_Ligne -> numéro de ligne. Il est construit en lisant
+    les seules colonnes 'Patient' et 'ID_Ligne', puis tenu à jour à chaque ajout / suppression
+    faits par ce moteur.
+
+    Pour les onglets de ONGLETS_AJOUT_SEUL, on garde en plus une copie complète de l'onglet.
+    À chaque rafraîchissement, on ne relit que les lignes situées après la dernière ligne connue
+    (le « filigrane »). Si l'ID de cette dernière ligne a changé, des lignes ont été supprimées
+    ailleurs : on recharge tout.
+
+    Avec un MagasinInstantanes, chaque onglet téléchargé en entier est aussi gardé sur le disque.
+    Après un redémarrage, la première lecture d'un onglet est servie depuis ce fichier et l'onglet
+    est revalidé en arrière-plan (relecture incrémentale ou complète).
+    """
+    nom = "sheets"
+    DUREE_INDEX = 120  # secondes avant reconstruction (écritures faites par d'autres instances)
+    DUREE_POIGNEES = 600  # secondes avant de relire la liste des onglets du classeur
+    DUREE_RECHARGEMENT_COMPLET = 3600  # secondes avant de retélécharger une copie en entier (modifs faites ailleurs)
+
+    def __init__(self, client, nom_classeur=NOM_CLASSEUR, instantanes=None, planificateur=None):
+        self.client = client
+        self.nom_classeur = nom_classeur
+        self.instantanes = instantanes  # MagasinInstantanes ou None
+        self.planificateur = planificateur
+        self._onglets_revalides = set()  # Onglets déjà servis (ou écartés) depuis le disque
+        self.verrou = threading.RLock()
+        self._index_onglets = {}
+        self._entetes_onglets = {}
+        self._copies = {}  # onglet -> {"entetes", "lignes" (valeurs brutes), "horodatage"}
+        # Cache des poignées : (classeur, onglet) -> Worksheet ; classeur -> (Spreadsheet, horodatage)
+        self._classeurs = {}
+        self._poignees = {}
+
+    # --- Cache des poignées Spreadsheet / Worksheet ---
+
+    def _classeur(self):
+        """Ouvre le classeur une seule fois et charge toutes ses poignées d'onglets en une requête."""
+        with self.verrou:
+            entree = self._classeurs.get(self.nom_classeur)
+            if entree and time.time() - entree[1] < self.DUREE_POIGNEES:
+                return entree[0]
+
+        sheet = self.client.open(self.nom_classeur)
+        onglets = sheet.worksheets()
+        with self.verrou:
+            self._classeurs[self.nom_classeur] = (sheet, time.time())
+            for cle in [c for c in self._poignees if c[0] == self.nom_classeur]:
+                del self._poignees[cle]
+            for ws in onglets:
+                self._poignees[(self.nom_classeur, ws.title)] = ws
+        return sheet
+
+    def _oublier_poignees(self, nom_onglet=None):
+        """Vide le cache (poignée périmée : onglet renommé, supprimé, recréé...)."""
+        with self.verrou:
+            self._classeurs.pop(self.nom_classeur, None)
+            self._poignees.pop((self.nom_classeur, nom_onglet), None)
+            self._index_onglets.pop(nom_onglet, None)
+            self._entetes_onglets.pop(nom_onglet, None)
+            self._copies.pop(nom_onglet, None)
+
+    def _onglet(self, nom_onglet, creer=False):
+        sheet = self._classeur()
+        with self.verrou:
+            ws = self._poignees.get((self.nom_classeur, nom_onglet))
+        if ws is not None:
+            return ws
+
+        # Onglet absent du cache : il a peut-être été créé ailleurs, on relit la liste une fois
+        self._oublier_poignees(nom_onglet)
+        sheet = self._classeur()
+        with self.verrou:
+            ws = self._poignees.get((self.nom_classeur, nom_onglet))
+        if ws is not None:
+            return ws
+
+        if not creer:
+            import gspread
+            raise gspread.exceptions.WorksheetNotFound(nom_onglet)
+        # Création de l'onglet s'il n'existe pas
+        ws = sheet.add_worksheet(title=nom_onglet, rows=100, cols=20)
+        with self.verrou:
+            self._poignees[(self.nom_classeur, nom_onglet)] = ws
+        return ws
+
+    @staticmethod
+    def _poignee_perimee(erreur):
+        """Erreurs qui signalent une poignée obsolète (et non un problème de quota ou de réseau)."""
+        import gspread
+        if isinstance(erreur, (gspread.exceptions.WorksheetNotFound, gspread.exceptions.SpreadsheetNotFound)):
+            return True
+        if isinstance(erreur, gspread.exceptions.APIError):
+            code = getattr(getattr(erreur, "response", None), "status_code", None)
+            return code in (400, 404)
+        return False
+
+    def _executer(self, nom_onglet, action, creer=False):
+        """Exécute action(ws) ; si la poignée est périmée, on la rafraîchit et on réessaie une fois."""
+        try:
+            return action(self._onglet(nom_onglet, creer=creer))
+        except Exception as e:
+            if not self._poignee_perimee(e):
+                raise
+            self._oublier_poignees(nom_onglet)
+            return action(self._onglet(nom_onglet, creer=creer))
+
+    # --- En-têtes et colonne ID_Ligne ---
+
+    def _entetes(self, ws, nom_onglet, nb_valeurs=0):
+        """
+        Retourne les en-têtes de l'onglet (mis en cache avec les poignées).
+        Si la colonne ID_Ligne n'existe pas encore, elle est ajoutée après la dernière colonne.
+        """
+        with self.verrou:
+            entetes = self._entetes_onglets.get(nom_onglet)
+        if entetes is not None:
+            return entetes
+
+        entetes = ws.row_values(1)
+        if not entetes:
+            # Onglet neuf : on écrit les en-têtes connus, complétés de colonnes génériques (comme le moteur SQLite)
+            entetes = list(ENTETES_ONGLETS.get(nom_onglet, []))
+            entetes += [f"Colonne_{n}" for n in range(len(entetes) + 1, max(nb_valeurs, 1) + 1)]
+            entetes.append(COLONNE_ID)
+            ws.update("A1", [entetes])
+        elif COLONNE_ID not in entetes:
+            ws.update_cell(1, len(entetes) + 1, COLONNE_ID)
+            entetes = entetes + [COLONNE_ID]
+
+        with self.verrou:
+            self._entetes_onglets[nom_onglet] = entetes
+        return entetes
+
+    def _ligne_avec_id(self, entetes, valeurs, id_ligne):
+        """Place l'ID dans sa colonne (les valeurs au-delà des en-têtes sont conservées après lui)."""
+        pos = entetes.index(COLONNE_ID)
+        valeurs = list(valeurs)
+        return valeurs[:pos] + [""] * (pos - len(valeurs)) + [id_ligne] + valeurs[pos:]
+
+    # --- Index Patient -> lignes et ID -> ligne ---
+
+    def _index(self, ws, nom_onglet):
+        """
+        Retourne (ou construit) l'index de l'onglet :
+        - lignes : Patient -> numéros de lignes
+        - ids : ID_Ligne -> numéro de ligne
+        Les lignes anciennes sans ID en reçoivent un (une seule écriture pour toute la colonne).
+        """
+        with self.verrou:
+            index = self._index_onglets.get(nom_onglet)
+            if index and time.time() - index["horodatage"] < self.DUREE_INDEX:
+                return index
+
+        if nom_onglet in ONGLETS_AJOUT_SEUL:
+            self._synchroniser(ws, nom_onglet)
+            with self.verrou:
+                return self._index_onglets[nom_onglet]
+
+        entetes = self._entetes(ws, nom_onglet)
+        # Une seule requête pour les deux colonnes
+        pivot, ids_lus = ws.batch_get(self._colonnes_index(entetes))
+        return self._installer_index(ws, nom_onglet, entetes, pivot, ids_lus)
+
+    @staticmethod
+    def _colonnes_index(entetes):
+        """Plages des colonnes Patient et ID_Ligne, les seules lues pour construire l'index."""
+        from gspread.utils import rowcol_to_a1
+
+        col_pivot = entetes.index("Patient") + 1 if "Patient" in entetes else 1
+        col_id = entetes.index(COLONNE_ID) + 1
+        lettre_pivot = re.sub(r"\d", "", rowcol_to_a1(1, col_pivot))
+        lettre_id = re.sub(r"\d", "", rowcol_to_a1(1, col_id))
+        return [f"{lettre_pivot}:{lettre_pivot}", f"{lettre_id}:{lettre_id}"]
+
+    def _installer_index(self, ws, nom_onglet, entetes, pivot, ids_lus):
+        """Construit l'index à partir des colonnes lues ; [0] = en-tête, la donnée 0 est à la ligne 2."""
+        pivot = [c[0] if c else "" for c in pivot[1:]]
+        ids_lus = [c[0] if c else "" for c in ids_lus[1:]]
+        nb_lignes = max(len(pivot), len(ids_lus))
+        ids_lus += [""] * (nb_lignes - len(ids_lus))
+
+        ids_lus = self._numeroter(ws, entetes, ids_lus)
+
+        lignes = {}
+        if "Patient" in entetes:
+            for num_ligne, valeur in enumerate(pivot, start=2):
+                lignes.setdefault(str(valeur).strip(), []).append(num_ligne)
+        ids = {str(i): num_ligne for num_ligne, i in enumerate(ids_lus, start=2)}
+
+        index = {"entetes": entetes, "lignes": lignes, "ids": ids, "horodatage": time.time()}
+        with self.verrou:
+            self._index_onglets[nom_onglet] = index
+        return index
+
+    def _numeroter(self, ws, entetes, ids_lus):
+        """Donne un ID aux lignes qui n'en ont pas (une seule écriture pour toute la colonne)."""
+        from gspread.utils import rowcol_to_a1
+
+        if all(str(i).strip() for i in ids_lus):
+            return ids_lus
+        lettre_id = re.sub(r"\d", "", rowcol_to_a1(1, entetes.index(COLONNE_ID) + 1))
+        ids_lus = [str(i).strip() or nouvel_id() for i in ids_lus]
+        ws.update(f"{lettre_id}2:{lettre_id}{len(ids_lus) + 1}", [[i] for i in ids_lus])
+        return ids_lus
+
+    def _perimer_index(self, nom_onglet):
+        """L'index (et la copie) seront resynchronisés à la prochaine lecture : lignes ajoutées ailleurs."""
+        with self.verrou:
+            for cache in (self._index_onglets, self._copies):
+                if nom_onglet in cache:
+                    cache[nom_onglet]["horodatage"] = 0
+
+    def _oublier_index(self, nom_onglet):
+        """L'index (et la copie) ne sont plus fiables : lignes supprimées ou décalées ailleurs."""
+        with self.verrou:
+            self._index_onglets.pop(nom_onglet, None)
+            self._copies.pop(nom_onglet, None)
+
+    # --- Copie locale des onglets en ajout seul ---
+
+    def _index_depuis_copie(self, nom_onglet):
+        """Reconstruit en mémoire l'index d'un onglet copié (aucune requête)."""
+        copie = self._copies[nom_onglet]
+        entetes = copie["entetes"]
+        pos_id = entetes.index(COLONNE_ID)
+        lignes, ids = {}, {}
+        pos = entetes.index("Patient") if "Patient" in entetes else None
+        for num_ligne, l in enumerate(copie["lignes"], start=2):
+            if pos is not None:
+                lignes.setdefault(str(l[pos]).strip() if pos < len(l) else "", []).append(num_ligne)
+            if pos_id < len(l):
+                ids[str(l[pos_id])] = num_ligne
+        self._index_onglets[nom_onglet] = {
+            "entetes": entetes, "lignes": lignes, "ids": ids, "horodatage": copie["horodatage"]
+        }
+
+    def _installer_copie(self, nom_onglet, entetes, lignes, charge_le=None):
+        """
+        Enregistre une copie complète (toutes les lignes ont un ID) et l'index qui en découle.
+        charge_le : date du téléchargement complet d'origine (copie relue sur le disque), None si on vient de télécharger.
+        """
+        with self.verrou:
+            if charge_le is None:
+                self._entetes_onglets[nom_onglet] = entetes
+            self._copies[nom_onglet] = {
+                "entetes": entetes, "lignes": [list(l) for l in lignes],
+                "horodatage": time.time(), "charge_le": time.time() if charge_le is None else charge_le,
+            }
+            self._index_depuis_copie(nom_onglet)
+        if charge_le is None:
+            self._planifier_instantane(nom_onglet)
+
+    def _plage_increment(self, nom_onglet):
+        """Plage à relire : la dernière ligne connue (témoin) et tout ce qui suit."""
+        from gspread.utils import rowcol_to_a1
+
+        with self.verrou:
+            copie = self._copies[nom_onglet]
+            derniere_col = re.sub(r"\d", "", rowcol_to_a1(1, len(copie["entetes"])))
+            return f"A{len(copie['lignes']) + 1}:{derniere_col}"
+
+    def _etendre_copie(self, nom_onglet, bloc):
+        """
+        Applique une relecture incrémentale (bloc = témoin + lignes nouvelles).
+        Retourne False si la copie n'est plus cohérente et qu'il faut tout recharger.
+        """
+        with self.verrou:
+            copie = self._copies.get(nom_onglet)
+            if not copie:
+                return False
+            pos_id = copie["entetes"].index(COLONNE_ID)
+            attendu = copie["lignes"][-1][pos_id] if copie["lignes"] else COLONNE_ID
+            temoin = bloc[0] if bloc else []
+            if pos_id >= len(temoin) or str(temoin[pos_id]) != str(attendu):
+                return False  # La dernière ligne connue a bougé : suppression détectée
+            nouvelles = [list(l) for l in bloc[1:]]
+            if any(pos_id >= len(l) or not str(l[pos_id]).strip() for l in nouvelles):
+                return False  # Lignes sans ID (saisie manuelle...) : rechargement complet pour les numéroter
+            copie["lignes"].extend(nouvelles)
+            copie["horodatage"] = time.time()
+            self._index_depuis_copie(nom_onglet)
+        if nouvelles:
+            self._planifier_instantane(nom_onglet)
+        return True
+
+    def _synchroniser(self, ws, nom_onglet):
+        """Met la copie à jour : lignes après le filigrane seulement, rechargement complet si besoin."""
+        with self.verrou:
+            copie = self._copies.get(nom_onglet)
+            if copie and time.time() - copie["horodatage"] < self.DUREE_INDEX:
+                return
+        if copie and self._copie_recente(copie) and self._etendre_copie(nom_onglet, ws.batch_get([self._plage_increment(nom_onglet)])[0]):
+            return
+
+        entetes = self._entetes(ws, nom_onglet)
+        pos_id = entetes.index(COLONNE_ID)
+        lignes = [list(l) + [""] * (len(entetes) - len(l)) for l in ws.get_all_values()[1:]]
+        ids = self._numeroter(ws, entetes, [l[pos_id] for l in lignes])
+        for l, i in zip(lignes, ids):
+            l[pos_id] = i
+        self._installer_copie(nom_onglet, entetes, lignes)
+
+    def _copie_recente(self, copie):
+        """La relecture incrémentale ne voit pas les lignes modifiées ailleurs : rechargement complet de temps en temps."""
+        return time.time() - copie["charge_le"] < self.DUREE_RECHARGEMENT_COMPLET
+
+    def _patcher_copie(self, nom_onglet, num_ligne, ligne):
+        """Répercute sur la copie une ligne réécrite par ce moteur."""
+        with self.verrou:
+            copie = self._copies.get(nom_onglet)
+            if copie and 0 <= num_ligne - 2 < len(copie["lignes"]):
+                copie["lignes"][num_ligne - 2] = list(ligne)
+
+    def _indexer_ajout(self, nom_onglet, lignes, reponse):
+        """Ajoute au cache les lignes que Google vient d'écrire (si l'index existe déjà)."""
+        with self.verrou:
+            index = self._index_onglets.get(nom_onglet)
+            if not index:
+                return
+            try:
+                plage = reponse["updates"]["updatedRange"]  # ex: 'Beck'!A12:K14
+                premiere = int(re.search(r"![A-Z]+(\d+)", plage).group(1))
+            except Exception:
+                # Réponse inattendue : on reconstruira l'index à la prochaine lecture
+                self._oublier_index(nom_onglet)
+                return
+            copie = self._copies.get(nom_onglet)
+            if copie is not None:
+                if premiere != len(copie["lignes"]) + 2:
+                    # D'autres lignes ont été ajoutées ailleurs entre-temps : relecture incrémentale
+                    self._perimer_index(nom_onglet)
+                    return
+                copie["lignes"].extend(list(l) for l in lignes)
+            entetes = index["entetes"]
+            for num_ligne, ligne in enumerate(lignes, start=premiere):
+                index["ids"][str(ligne[entetes.index(COLONNE_ID)])] = num_ligne
+                if "Patient" in entetes:
+                    pos = entetes.index("Patient")
+                    patient = str(ligne[pos]).strip() if pos < len(ligne) else ""
+                    index["lignes"].setdefault(patient, []).append(num_ligne)
+
+    def _desindexer_ligne(self, nom_onglet, num_ligne):
+        """Retire une ligne supprimée et décale les lignes suivantes."""
+        with self.verrou:
+            index = self._index_onglets.get(nom_onglet)
+            if not index:
+                return
+            for patient, nums in index["lignes"].items():
+                index["lignes"][patient] = [n - 1 if n > num_ligne else n for n in nums if n != num_ligne]
+            index["ids"] = {i: (n - 1 if n > num_ligne else n) for i, n in index["ids"].items() if n != num_ligne}
+            copie = self._copies.get(nom_onglet)
+            if copie and 0 <= num_ligne - 2 < len(copie["lignes"]):
+                del copie["lignes"][num_ligne - 2]
+
+    def _ligne_de_id(self, ws, nom_onglet, id_ligne):
+        """
+        Numéro de ligne d'un ID, vérifié sur la cellule ID_Ligne elle-même :
+        une autre instance a pu supprimer des lignes et décaler l'onglet depuis la construction de l'index.
+        """
+        for tentative in range(2):
+            index = self._index(ws, nom_onglet)
+            num_ligne = index["ids"].get(str(id_ligne))
+            if num_ligne is None and tentative == 0:
+                # ID inconnu : peut-être ajouté par une autre instance
+                self._perimer_index(nom_onglet)
+                continue
+            if num_ligne is None:
+                return None
+            col_id = index["entetes"].index(COLONNE_ID) + 1
+            if str(ws.cell(num_ligne, col_id).value) == str(id_ligne):
+                return num_ligne
+            self._oublier_index(nom_onglet)
+        return None
+
+    # --- Instantanés disque ---
+
+    def _planifier_instantane(self, nom_onglet, contenu=None):
+        """
+        Programme l'écriture de l'instantané d'un onglet.
+        Sans contenu, c'est la copie locale (au moment de l'écriture) qui est enregistrée.
+        """
+        if self.instantanes is None or nom_onglet in ONGLETS_SANS_INSTANTANE:
+            return
+
+        def contenu_copie():
+            with self.verrou:
+                copie = self._copies.get(nom_onglet)
+                if copie is None:
+                    return None
+                return copie["entetes"], [list(l) for l in copie["lignes"]], {"charge_le": copie["charge_le"]}
+
+        self.instantanes.planifier(self.nom_classeur, nom_onglet, contenu or contenu_copie)
+
+    def _apres_ecriture(self, nom_onglet):
+        """Onglet modifié par ce moteur : instantané mis à jour depuis la copie, ou effacé s'il n'y en a pas."""
+        if self.instantanes is None:
+            return
+        with self.verrou:
+            copie = nom_onglet in self._copies
+        if copie:
+            self._planifier_instantane(nom_onglet)
+        else:
+            self.instantanes.effacer(self.nom_classeur, nom_onglet)
+
+    def _depuis_instantane(self, nom_onglet):
+        """
+        Première lecture d'un onglet dans ce processus : (entetes, lignes) lus sur le disque, ou None.
+        L'onglet est alors revalidé en arrière-plan ; les lectures suivantes passent par le chemin normal.
+        """
+        if self.instantanes is None or nom_onglet in ONGLETS_SANS_INSTANTANE:
+            return None
+        with self.verrou:
+            if nom_onglet in self._onglets_revalides or nom_onglet in self._copies or nom_onglet in self._index_onglets:
+                return None
+            self._onglets_revalides.add(nom_onglet)
+
+        contenu = self.instantanes.charger(self.nom_classeur, nom_onglet)
+        if contenu is None:
+            return None
+        entetes, lignes, meta = contenu
+        if COLONNE_ID not in entetes:
+            return None
+        if nom_onglet in ONGLETS_AJOUT_SEUL:
+            self._installer_copie(nom_onglet, entetes, lignes, charge_le=meta.get("charge_le", 0))
+        threading.Thread(target=self._revalider, args=(nom_onglet,), daemon=True).start()
+        return entetes, lignes
+
+    def _revalider(self, nom_onglet):
+        """Revalidation en arrière-plan d'un onglet servi depuis le disque (après les saisies en attente)."""
+        def revalider():
+            if nom_onglet in ONGLETS_AJOUT_SEUL:
+                # Le témoin (ID de la dernière ligne de l'instantané) dit si l'on peut se contenter des lignes nouvelles
+                self._perimer_index(nom_onglet)
+                self._executer(nom_onglet, lambda ws: self._synchroniser(ws, nom_onglet))
+            else:
+                self._executer(nom_onglet, lambda ws: self._lire_tout(ws, nom_onglet))
+
+        try:
+            if self.planificateur is None:
+                revalider()
+            else:
+                from planificateur import PRIORITE_FOND
+                self.planificateur.executer(revalider, PRIORITE_FOND)
+        except Exception:
+            pass  # La prochaine lecture passera par le réseau
+
+    @staticmethod
+    def _lignes_du_patient(entetes, lignes, patient_id):
+        """Filtre des valeurs brutes sur la colonne Patient (aucune ligne si l'onglet n'en a pas)."""
+        if "Patient" not in entetes:
+            return []
+        pos = entetes.index("Patient")
+        cible = str(patient_id).strip()
+        return [l for l in lignes if pos < len(l) and str(l[pos]).strip() == cible]
+
+    # --- Opérations ---
+
+    def ajouter_ligne(self, nom_onglet, valeurs):
+        return self.ajouter_lignes(nom_onglet, [valeurs])[0]
+
+    def ajouter_lignes(self, nom_onglet, lignes, ids=None):
+        if not lignes:
+            return []
+        ids = list(ids) if ids else [nouvel_id() for _ in lignes]
+
+        def ajouter(ws):
+            entetes = self._entetes(ws, nom_onglet, max(len(v) for v in lignes))
+            completes = [self._ligne_avec_id(entetes, v, i) for v, i in zip(lignes, ids)]
+            return completes, ws.append_rows(completes)
+
+        completes, reponse = self._executer(nom_onglet, ajouter, creer=True)
+        self._indexer_ajout(nom_onglet, completes, reponse)
+        self._apres_ecriture(nom_onglet)
+        return ids
+
+    def ids_existants(self, nom_onglet, ids):
+        # Index relu pour l'occasion : c'est justement une écriture dont on ignore l'issue
+        self._perimer_index(nom_onglet)
+        index = self._executer(nom_onglet, lambda ws: self._index(ws, nom_onglet))
+        return {str(i) for i in ids if str(i) in index["ids"]}
+
+    def lire_onglet(self, nom_onglet):
+        instantane = self._depuis_instantane(nom_onglet)
+        if instantane:
+            return self._en_records(*instantane)
+        if nom_onglet in ONGLETS_AJOUT_SEUL:
+            return self._executer(nom_onglet, lambda ws: self._lire_copie(ws, nom_onglet))
+        return self._executer(nom_onglet, lambda ws: self._lire_tout(ws, nom_onglet))
+
+    def _lire_tout(self, ws, nom_onglet):
+        """Onglet entier ; le téléchargement sert aussi à reconstruire l'index (et l'instantané)."""
+        valeurs = ws.get_all_values()
+        if not valeurs:
+            return []
+        self._indexer_valeurs(nom_onglet, valeurs[0], valeurs[1:])
+        return self._en_records(valeurs[0], valeurs[1:])
+
+    def _lire_copie(self, ws, nom_onglet, nums=None):
+        """Lignes servies depuis la copie locale (après synchronisation incrémentale)."""
+        self._synchroniser(ws, nom_onglet)
+        with self.verrou:
+            copie = self._copies[nom_onglet]
+            lignes = copie["lignes"] if nums is None else [copie["lignes"][n - 2] for n in nums]
+            return self._en_records(copie["entetes"], lignes)
+
+    def lire_lignes_patient(self, nom_onglet, patient_id):
+        instantane = self._depuis_instantane(nom_onglet)
+        if instantane:
+            return self._en_records(instantane[0], self._lignes_du_patient(*instantane, patient_id))
+        return self._executer(nom_onglet, lambda ws: self._lire_lignes_patient(ws, nom_onglet, patient_id))
+
+    @staticmethod
+    def _plages_lignes(nums, entetes):
+        """Regroupe des numéros de lignes triés en plages contiguës (ex: A2:K4, A9:K9)."""
+        from gspread.utils import rowcol_to_a1
+
+        derniere_col = re.sub(r"\d", "", rowcol_to_a1(1, len(entetes)))
+        plages, debut, fin = [], nums[0], nums[0]
+        for n in nums[1:]:
+            if n == fin + 1:
+                fin = n
+            else:
+                plages.append(f"A{debut}:{derniere_col}{fin}")
+                debut = fin = n
+        plages.append(f"A{debut}:{derniere_col}{fin}")
+        return plages
+
+    @staticmethod
+    def _en_records(entetes, lignes):
+        """Même format que get_all_records() : cellules complétées et nombres convertis."""
+        from gspread.utils import numericise_all
+
+        records = []
+        for ligne in lignes:
+            ligne = list(ligne) + [""] * (len(entetes) - len(ligne))
+            records.append(dict(zip(entetes, numericise_all(ligne))))
+        return records
+
+    def _lire_lignes_patient(self, ws, nom_onglet, patient_id):
+        index = self._index(ws, nom_onglet)
+        entetes = index["entetes"]
+        nums = sorted(index["lignes"].get(str(patient_id).strip(), []))
+        if not nums:
+            return []
+        if nom_onglet in ONGLETS_AJOUT_SEUL:
+            return self._lire_copie(ws, nom_onglet, nums)
+
+        # Lignes contiguës regroupées en plages : une seule requête pour toutes les plages
+        return self._en_records(entetes, [l for bloc in ws.batch_get(self._plages_lignes(nums, entetes)) for l in bloc])
+
+    def _indexer_valeurs(self, nom_onglet, entetes, lignes):
+        """Construit l'index d'un onglet à partir de son contenu complet (déjà téléchargé)."""
+        if COLONNE_ID not in entetes:
+            return
+        pos_id = entetes.index(COLONNE_ID)
+        ids = [str(l[pos_id]).strip() if pos_id < len(l) else "" for l in lignes]
+        if "" in ids:
+            return  # Lignes sans ID : _index() se chargera de les numéroter
+        if nom_onglet in ONGLETS_AJOUT_SEUL:
+            self._installer_copie(nom_onglet, entetes, lignes)
+            return
+
+        index_lignes = {}
+        if "Patient" in entetes:
+            pos = entetes.index("Patient")
+            for num_ligne, l in enumerate(lignes, start=2):
+                index_lignes.setdefault(str(l[pos]).strip() if pos < len(l) else "", []).append(num_ligne)
+        index = {
+            "entetes": entetes, "lignes": index_lignes,
+            "ids": {i: n for n, i in enumerate(ids, start=2)}, "horodatage": time.time()
+        }
+        with self.verrou:
+            self._entetes_onglets[nom_onglet] = entetes
+            self._index_onglets[nom_onglet] = index
+        charge_le = time.time()
+        self._planifier_instantane(nom_onglet, lambda: (entetes, lignes, {"charge_le": charge_le}))
+
+    def _numeroter_valeurs(self, nom_onglet, entetes, lignes):
+        """
+        Onglet téléchargé en entier dont des lignes n'ont pas d'ID (saisie à la main, ancienne feuille) :
+        la colonne ID_Ligne est complétée une fois, pour que les lectures suivantes passent par l'index.
+        Retourne (en-têtes, lignes) avec leurs ID.
+        """
+        ws = self._onglet(nom_onglet)
+        if COLONNE_ID not in entetes:
+            with self.verrou:
+                self._entetes_onglets.pop(nom_onglet, None)
+            entetes = self._entetes(ws, nom_onglet)
+        pos_id = entetes.index(COLONNE_ID)
+        lignes = [list(l) + [""] * (len(entetes) - len(l)) for l in lignes]
+        ids = self._numeroter(ws, entetes, [l[pos_id] for l in lignes])
+        for l, i in zip(lignes, ids):
+            l[pos_id] = i
+        return entetes, lignes
+
+    def lire_plusieurs(self, noms_onglets, patient_id):
+        # Onglets lus pour la première fois depuis le démarrage : servis depuis le disque
+        resultat, restants = {}, []
+        for nom in noms_onglets:
+            instantane = self._depuis_instantane(nom)
+            if instantane:
+                resultat[nom] = self._en_records(instantane[0], self._lignes_du_patient(*instantane, patient_id))
+            else:
+                restants.append(nom)
+        if not restants:
+            return resultat
+
+        try:
+            resultat.update(self._lire_plusieurs(restants, patient_id))
+        except Exception as e:
+            if not self._poignee_perimee(e):
+                raise
+            self._oublier_poignees()
+            resultat.update(self._lire_plusieurs(restants, patient_id))
+        return resultat
+
+    def _lire_plusieurs(self, noms_onglets, patient_id):
+        sheet = self._classeur()
+        cible = str(patient_id).strip()
+        resultat = {nom: [] for nom in noms_onglets}
+
+        # Onglet indexé : seulement les lignes du patient. Index expiré : ses colonnes Patient et ID_Ligne
+        # sont relues dans la même requête, puis les lignes du patient dans une seconde (une pour tout l'appel).
+        # Onglet jamais lu : l'onglet entier (qui sert aussi à l'indexer).
+        demandes = []  # (onglet, en-têtes / None si onglet entier / "increment" / "index", plage)
+        entetes_index = {}  # onglet -> en-têtes connus, pour les index à reconstruire
+        for nom in noms_onglets:
+            with self.verrou:
+                existe = (self.nom_classeur, nom) in self._poignees
+                index = self._index_onglets.get(nom)
+                copie = self._copies.get(nom)
+                entetes_connus = self._entetes_onglets.get(nom)
+            if not existe:
+                continue  # Un onglet inexistant ferait échouer toute la requête groupée
+            prefixe = "'" + nom.replace("'", "''") + "'"
+            a_jour = index and time.time() - index["horodatage"] < self.DUREE_INDEX
+            if copie is not None and self._copie_recente(copie):
+                # Onglet copié : rien à demander s'il est à jour, sinon seulement les lignes nouvelles
+                if not a_jour:
+                    demandes.append((nom, "increment", f"{prefixe}!{self._plage_increment(nom)}"))
+            elif a_jour:
+                nums = sorted(index["lignes"].get(cible, []))
+                if nums:
+                    for plage in self._plages_lignes(nums, index["entetes"]):
+                        demandes.append((nom, index["entetes"], f"{prefixe}!{plage}"))
+            elif entetes_connus is not None and nom not in ONGLETS_AJOUT_SEUL:
+                entetes_index[nom] = entetes_connus
+                for plage in self._colonnes_index(entetes_connus):
+                    demandes.append((nom, "index", f"{prefixe}!{plage}"))
+            else:
+                demandes.append((nom, None, prefixe))
+
+        if demandes:
+            # Une seule requête values:batchGet pour tous les onglets
+            reponse = sheet.values_batch_get([d[2] for d in demandes])
+            blocs = [b.get("values", []) for b in reponse.get("valueRanges", [])]
+        else:
+            blocs = []
+
+        a_recharger = []
+        colonnes_lues = {}  # onglet -> [colonne Patient, colonne ID_Ligne]
+        for (nom, entetes, _), valeurs in zip(demandes, blocs):
+            if entetes == "increment":
+                if not self._etendre_copie(nom, valeurs):
+                    a_recharger.append(nom)
+                continue
+            if entetes == "index":
+                colonnes_lues.setdefault(nom, []).append(valeurs)
+                continue
+            if entetes is None:
+                if not valeurs:
+                    continue
+                entetes, valeurs = valeurs[0], valeurs[1:]
+                pos_id = entetes.index(COLONNE_ID) if COLONNE_ID in entetes else None
+                if pos_id is None or any(pos_id >= len(l) or not str(l[pos_id]).strip() for l in valeurs):
+                    entetes, valeurs = self._numeroter_valeurs(nom, entetes, valeurs)
+                self._indexer_valeurs(nom, entetes, valeurs)
+                valeurs = self._lignes_du_patient(entetes, valeurs, cible)
+            if nom in self._copies:
+                continue  # Servi depuis la copie ci-dessous
+            resultat[nom].extend(self._en_records(entetes, valeurs))
+
+        # Index reconstruits : lignes du patient de tous ces onglets en une seconde requête
+        secondes = []  # (onglet, en-têtes, plage)
+        for nom, (pivot, ids_lus) in colonnes_lues.items():
+            with self.verrou:
+                ws = self._poignees.get((self.nom_classeur, nom))
+            index = self._installer_index(ws, nom, entetes_index[nom], pivot, ids_lus)
+            prefixe = "'" + nom.replace("'", "''") + "'"
+            nums = sorted(index["lignes"].get(cible, []))
+            if nums:
+                for plage in self._plages_lignes(nums, index["entetes"]):
+                    secondes.append((nom, index["entetes"], f"{prefixe}!{plage}"))
+        if secondes:
+            reponse = sheet.values_batch_get([d[2] for d in secondes])
+            for (nom, entetes, _), bloc in zip(secondes, reponse.get("valueRanges", [])):
+                resultat[nom].extend(self._en_records(entetes, bloc.get("values", [])))
+
+        # Onglets copiés : servis depuis la mémoire
+        for nom in noms_onglets:
+            with self.verrou:
+                copie = self._copies.get(nom)
+                index = self._index_onglets.get(nom)
+                if copie is None or nom in a_recharger or not index:
+                    continue
+                nums = sorted(index["lignes"].get(cible, []))
+                resultat[nom] = self._en_records(copie["entetes"], [copie["lignes"][n - 2] for n in nums])
+
+        # Suppression détectée pendant la relecture incrémentale : rechargement complet (cas rare)
+        for nom in a_recharger:
+            self._oublier_index(nom)
+            resultat[nom] = self.lire_lignes_patient(nom, patient_id)
+        return resultat
+
+    def supprimer_ligne(self, nom_onglet, criteres_dict):
+        supprime = self._executer(nom_onglet, lambda ws: self._supprimer_ligne(ws, nom_onglet, criteres_dict))
+        if supprime:
+            self._apres_ecriture(nom_onglet)
+        return supprime
+
+    def _supprimer_ligne(self, ws, nom_onglet, criteres_dict):
+        # On récupère tout pour chercher l'index
+        records = ws.get_all_records()
+
+        # i commence à 0, mais dans GSheet ligne 1 = Headers.
+        # Donc la donnée 0 est à la ligne 2.
+        for i, row in enumerate(records):
+            if correspond(row, criteres_dict):
+                ws.delete_rows(i + 2)
+                self._desindexer_ligne(nom_onglet, i + 2)
+                return True
+        return False
+
+    def _chercher_cle(self, ws, nom_onglet, criteres):
+        """
+        Retourne (numéro de ligne, ID_Ligne) de la première ligne qui respecte les critères, ou (None, None).
+        Si 'Patient' fait partie des clés, seules les lignes du patient (index en cache) sont relues,
+        en une requête qui sert aussi de vérification de l'index.
+        """
+        from gspread.utils import rowcol_to_a1
+
+        for tentative in range(2):
+            index = self._index(ws, nom_onglet)
+            entetes = index["entetes"]
+            if "Patient" in criteres and "Patient" in entetes:
+                nums = sorted(index["lignes"].get(str(criteres["Patient"]).strip(), []))
+                derniere_col = re.sub(r"\d", "", rowcol_to_a1(1, len(entetes)))
+                blocs = ws.batch_get([f"A{n}:{derniere_col}{n}" for n in nums]) if nums else []
+                candidates = [(n, bloc[0] if bloc else []) for n, bloc in zip(nums, blocs)]
+            else:
+                candidates = list(enumerate(ws.get_all_values()[1:], start=2))
+
+            for num_ligne, ligne in candidates:
+                row = dict(zip(entetes, ligne))
+                if correspond(row, criteres):
+                    return num_ligne, row.get(COLONNE_ID) or None
+
+            # Rien trouvé : l'index a peut-être été périmé par une autre instance, on le reconstruit une fois
+            self._oublier_index(nom_onglet)
+        return None, None
+
+    def chercher_id(self, nom_onglet, criteres_dict):
+        return self._executer(nom_onglet, lambda ws: self._chercher_cle(ws, nom_onglet, criteres_dict))[1]
+
+    def supprimer_par_id(self, nom_onglet, id_ligne):
+        def supprimer(ws):
+            num_ligne = self._ligne_de_id(ws, nom_onglet, id_ligne)
+            if num_ligne is None:
+                return False
+            ws.delete_rows(num_ligne)
+            self._desindexer_ligne(nom_onglet, num_ligne)
+            return True
+
+        supprime = self._executer(nom_onglet, supprimer)
+        if supprime:
+            self._apres_ecriture(nom_onglet)
+        return supprime
+
+    def modifier_par_id(self, nom_onglet, id_ligne, valeurs):
+        from gspread.utils import rowcol_to_a1
+
+        def modifier(ws):
+            num_ligne = self._ligne_de_id(ws, nom_onglet, id_ligne)
+            if num_ligne is None:
+                return False
+            entetes = self._entetes(ws, nom_onglet)
+            ligne = self._ligne_avec_id(entetes, valeurs, id_ligne)
+            ligne += [""] * (len(entetes) - len(ligne))  # On efface aussi les anciennes cellules en trop
+            ws.update(f"A{num_ligne}:{rowcol_to_a1(num_ligne, len(ligne))}", [ligne])
+            self._patcher_copie(nom_onglet, num_ligne, ligne)
+
+            # Le patient de la ligne a pu changer : on tient l'index à jour
+            with self.verrou:
+                index = self._index_onglets.get(nom_onglet)
+                if index and "Patient" in entetes:
+                    for nums in index["lignes"].values():
+                        if num_ligne in nums:
+                            nums.remove(num_ligne)
+                    patient = str(ligne[entetes.index("Patient")]).strip()
+                    index["lignes"].setdefault(patient, []).append(num_ligne)
+            return True
+
+        modifie = self._executer(nom_onglet, modifier)
+        if modifie:
+            self._apres_ecriture(nom_onglet)
+        return modifie
+
+    def remplacer_ou_ajouter(self, nom_onglet, colonnes_cles, valeurs, id_ligne=None):
+        from gspread.utils import rowcol_to_a1
+        id_impose = id_ligne
+
+        def remplacer(ws):
+            entetes = self._entetes(ws, nom_onglet, len(valeurs))
+            criteres = {c: valeurs[entetes.index(c)] for c in colonnes_cles}
+            num_ligne, ancien_id = self._chercher_cle(ws, nom_onglet, criteres)
+            if num_ligne is None:
+                return None
+            id_ligne = id_impose or ancien_id or nouvel_id()
+            if id_ligne != ancien_id:
+                with self.verrou:
+                    index = self._index_onglets.get(nom_onglet)
+                    if index:
+                        index["ids"].pop(ancien_id, None)
+                        index["ids"][id_ligne] = num_ligne
+            ligne = self._ligne_avec_id(entetes, valeurs, id_ligne)
+            ligne += [""] * (len(entetes) - len(ligne))
+            # Une seule écriture : la ligne existante est réécrite (les clés, donc l'index, ne changent pas)
+            ws.update(f"A{num_ligne}:{rowcol_to_a1(num_ligne, len(ligne))}", [ligne])
+            self._patcher_copie(nom_onglet, num_ligne, ligne)
+            return id_ligne
+
+        id_ecrit = self._executer(nom_onglet, remplacer, creer=True)
+        if id_ecrit is None:
+            return self.ajouter_lignes(nom_onglet, [valeurs], [id_impose] if id_impose else None)[0]
+        self._apres_ecriture(nom_onglet)
+        return id_ecrit
+
+# =========================================================
+# 4. MOTEUR SQLITE (LOCAL / HORS-LIGNE / TESTS)
+# =========================================================
+
+def _quote(identifiant):
+    """Protège un nom de table ou de colonne (accents, espaces, parenthèses...)."""
+    return '"' + str(identifiant).replace('"', '""') + '"'
+
+def _valeur_sqlite(valeur):
+    """Convertit une valeur Python/numpy en type accepté par sqlite3."""
+    if valeur is None or isinstance(valeur, (str, int, float)):
+        return valeur
+    if hasattr(valeur, "item"):  # numpy.int64, numpy.float64...
+        return valeur.item()
+    return str(valeur)
+
+class MoteurSQLite(MoteurStockage):
+    """
+    Une table par onglet, colonnes = en-têtes de l'onglet + ID_Ligne, index sur 'Patient' et 'ID_Ligne'.
+    Les colonnes n'ont pas de type déclaré : SQLite conserve le type de chaque valeur
+    (comme une cellule Google Sheets).
+    """
+    nom = "sqlite"
+
+    def __init__(self, chemin="tcc_local.db"):
+        self.chemin = chemin
+        # Streamlit exécute chaque session dans son propre thread : connexion partagée + verrou
+        self.conn = sqlite3.connect(chemin, check_same_thread=False)
+        self.verrou = threading.RLock()
+        self._colonnes = {}
+
+    def _colonnes_table(self, nom_onglet, creer=False):
+        """Retourne les colonnes de la table (None si elle n'existe pas et creer=False)."""
+        if nom_onglet in self._colonnes:
+            return self._colonnes[nom_onglet]
+
+        table = _quote(nom_onglet)
+        cur = self.conn.execute(f"PRAGMA table_info({table})")
+        colonnes = [r[1] for r in cur.fetchall()]
+        if not colonnes:
+            if not creer:
+                return None
+            colonnes = list(ENTETES_ONGLETS.get(nom_onglet, []))
+            if not colonnes:
+                colonnes = ["Colonne_1"]
+            colonnes.append(COLONNE_ID)
+            cols_sql = ", ".join(_quote(c) for c in colonnes)
+            self.conn.execute(f"CREATE TABLE {table} ({cols_sql})")
+
+        if COLONNE_ID not in colonnes:
+            # Table créée avant les ID : on ajoute la colonne et on numérote les lignes existantes
+            self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {_quote(COLONNE_ID)}")
+            for (rowid,) in self.conn.execute(f"SELECT rowid FROM {table}").fetchall():
+                self.conn.execute(f"UPDATE {table} SET {_quote(COLONNE_ID)} = ? WHERE rowid = ?", (nouvel_id(), rowid))
+            colonnes.append(COLONNE_ID)
+
+        self.conn.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {_quote('idx_' + nom_onglet + '_id')} "
+            f"ON {table} ({_quote(COLONNE_ID)})"
+        )
+        if "Patient" in colonnes:
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {_quote('idx_' + nom_onglet + '_patient')} "
+                f"ON {table} ({_quote('Patient')})"
+            )
+        self.conn.commit()
+        self._colonnes[nom_onglet] = colonnes
+        return colonnes
+
+    def _colonnes_donnees(self, nom_onglet, nb_valeurs):
+        """Colonnes qui reçoivent une liste de valeurs (sans ID_Ligne), élargies si la liste est plus longue."""
+        colonnes = self._colonnes[nom_onglet]
+        donnees = [c for c in colonnes if c != COLONNE_ID]
+        while len(donnees) < nb_valeurs:
+            nouvelle = f"Colonne_{len(colonnes) + 1}"
+            self.conn.execute(f"ALTER TABLE {_quote(nom_onglet)} ADD COLUMN {_quote(nouvelle)}")
+            colonnes.append(nouvelle)
+            donnees.append(nouvelle)
+        return donnees[:nb_valeurs]
+
+    def _en_dicts(self, colonnes, lignes):
+        # get_all_records() renvoie "" pour une cellule vide : on garde le même contrat
+        return [{c: ("" if v is None else v) for c, v in zip(colonnes, ligne)} for ligne in lignes]
+
+    def ajouter_ligne(self, nom_onglet, valeurs):
+        return self.ajouter_lignes(nom_onglet, [valeurs])[0]
+
+    def ajouter_lignes(self, nom_onglet, lignes, ids=None):
+        ids = list(ids) if ids else [nouvel_id() for _ in lignes]
+        with self.verrou:
+            self._colonnes_table(nom_onglet, creer=True)
+            for valeurs, id_ligne in zip(lignes, ids):
+                colonnes = self._colonnes_donnees(nom_onglet, len(valeurs)) + [COLONNE_ID]
+                valeurs = [_valeur_sqlite(v) for v in valeurs] + [id_ligne]
+                cols_sql = ", ".join(_quote(c) for c in colonnes)
+                marques = ", ".join("?" for _ in valeurs)
+                self.conn.execute(f"INSERT INTO {_quote(nom_onglet)} ({cols_sql}) VALUES ({marques})", valeurs)
+            self.conn.commit()  # Une seule transaction pour tout le lot
+        return ids
+
+    def ids_existants(self, nom_onglet, ids):
+        ids = [str(i) for i in ids]
+        with self.verrou:
+            if not ids or self._colonnes_table(nom_onglet) is None:
+                return set()
+            marques = ", ".join("?" for _ in ids)
+            cur = self.conn.execute(
+                f"SELECT {_quote(COLONNE_ID)} FROM {_quote(nom_onglet)} WHERE {_quote(COLONNE_ID)} IN ({marques})", ids
+            )
+            return {str(r[0]) for r in cur.fetchall()}
+
+    def lire_onglet(self, nom_onglet):
+        with self.verrou:
+            colonnes = self._colonnes_table(nom_onglet)
+            if colonnes is None:
+                return []
+            cur = self.conn.execute(f"SELECT * FROM {_quote(nom_onglet)} ORDER BY rowid")
+            return self._en_dicts(colonnes, cur.fetchall())
+
+    def lire_lignes_patient(self, nom_onglet, patient_id):
+        with self.verrou:
+            colonnes = self._colonnes_table(nom_onglet)
+            if colonnes is None or "Patient" not in colonnes:
+                return []
+            # Requête servie par l'index idx_<onglet>_patient
+            cur = self.conn.execute(
+                f"SELECT * FROM {_quote(nom_onglet)} WHERE {_quote('Patient')} = ? ORDER BY rowid",
+                (str(patient_id).strip(),)
+            )
+            return self._en_dicts(colonnes, cur.fetchall())
+
+    def supprimer_ligne(self, nom_onglet, criteres_dict):
+        with self.verrou:
+            colonnes = self._colonnes_table(nom_onglet)
+            if colonnes is None:
+                return False
+
+            conditions, params = [], []
+            for key, val in criteres_dict.items():
+                if key not in colonnes:
+                    # Même logique que str(row.get(key)) côté Sheets
+                    if str(None) != str(val):
+                        return False
+                    continue
+                conditions.append(f"CAST({_quote(key)} AS TEXT) = ?")
+                params.append(str(val))
+
+            where = " AND ".join(conditions) if conditions else "1"
+            cur = self.conn.execute(
+                f"DELETE FROM {_quote(nom_onglet)} WHERE rowid = "
+                f"(SELECT rowid FROM {_quote(nom_onglet)} WHERE {where} ORDER BY rowid LIMIT 1)",
+                params
+            )
+            self.conn.commit()
+            return cur.rowcount > 0
+
+    def supprimer_par_id(self, nom_onglet, id_ligne):
+        with self.verrou:
+            if self._colonnes_table(nom_onglet) is None:
+                return False
+            cur = self.conn.execute(
+                f"DELETE FROM {_quote(nom_onglet)} WHERE {_quote(COLONNE_ID)} = ?", (str(id_ligne),)
+            )
+            self.conn.commit()
+            return cur.rowcount > 0
+
+    def modifier_par_id(self, nom_onglet, id_ligne, valeurs):
+        with self.verrou:
+            if self._colonnes_table(nom_onglet) is None:
+                return False
+            colonnes = [c for c in self._colonnes[nom_onglet] if c != COLONNE_ID]
+            colonnes = self._colonnes_donnees(nom_onglet, max(len(valeurs), len(colonnes)))
+            # Les colonnes non fournies sont vidées, comme une ligne réécrite côté Sheets
+            valeurs = [_valeur_sqlite(v) for v in valeurs] + [None] * (len(colonnes) - len(valeurs))
+            affectations = ", ".join(f"{_quote(c)} = ?" for c in colonnes)
+            cur = self.conn.execute(
+                f"UPDATE {_quote(nom_onglet)} SET {affectations} WHERE {_quote(COLONNE_ID)} = ?",
+                valeurs + [str(id_ligne)]
+            )
+            self.conn.commit()
+            return cur.rowcount > 0
+
+    def remplacer_ou_ajouter(self, nom_onglet, colonnes_cles, valeurs, id_ligne=None):
+        with self.verrou:
+            self._colonnes_table(nom_onglet, creer=True)
+            colonnes = self._colonnes_donnees(nom_onglet, len(valeurs))
+            conditions = " AND ".join(f"CAST({_quote(c)} AS TEXT) = ?" for c in colonnes_cles)
+            params = [str(valeurs[colonnes.index(c)]) for c in colonnes_cles]
+            trouve = self.conn.execute(
+                f"SELECT {_quote(COLONNE_ID)} FROM {_quote(nom_onglet)} WHERE {conditions} ORDER BY rowid LIMIT 1",
+                params
+            ).fetchone()
+            if trouve:
+                if id_ligne and str(trouve[0]) != str(id_ligne):
+                    # La ligne prend l'ID connu d'avance (validé avec la réécriture, par modifier_par_id)
+                    self.conn.execute(
+                        f"UPDATE {_quote(nom_onglet)} SET {_quote(COLONNE_ID)} = ? WHERE {_quote(COLONNE_ID)} = ?",
+                        (str(id_ligne), str(trouve[0]))
+                    )
+                    trouve = (str(id_ligne),)
+                self.modifier_par_id(nom_onglet, trouve[0], valeurs)
+                return trouve[0]
+            return self.ajouter_lignes(nom_onglet, [valeurs], [id_ligne] if id_ligne else None)[0]
@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 import time
-import secrets
+import hmac
 from datetime import datetime
 from protocole_config import PROTOCOLE_BARLOW
 import os
@@ -26,12 +26,6 @@ st.markdown("""
 # 0. SÉCURITÉ & UTILITAIRES
 # =========================================================
 
-def generer_code_securise(prefix="PAT", length=6):
-    """Génère un code aléatoire sécurisé (ex: PAT-X9J2M)"""
-    chars = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789" 
-    suffix = ''.join(secrets.choice(chars) for _ in range(length))
-    return f"{prefix}-{suffix}"
-
 # --- INITIALISATION SESSION ---
 if "authentifie" not in st.session_state: st.session_state.authentifie = False
 if "user_type" not in st.session_state: st.session_state.user_type = None 
@@ -41,19 +35,15 @@ if "user_id" not in st.session_state: st.session_state.user_id = ""
 # 1. FONCTIONS DE BASE DE DONNÉES (OPTIMISÉES AVEC CACHE)
 # =========================================================
 
-@st.cache_data(ttl=600)
 def verifier_therapeute(identifiant, mot_de_passe):
+    # Recherche dans l'index des comptes (pas de relecture de l'onglet à chaque connexion)
     try:
-        from connect_db import load_data
-        data = load_data("Therapeutes")
-        if data:
-            df = pd.DataFrame(data)
-            df["Identifiant"] = df["Identifiant"].astype(str).str.strip()
-            df["MotDePasse"] = df["MotDePasse"].astype(str).str.strip()
-            user_clean = str(identifiant).strip()
-            pwd_clean = str(mot_de_passe).strip()
-            user_row = df[(df["Identifiant"] == user_clean) & (df["MotDePasse"] == pwd_clean)]
-            if not user_row.empty: return user_row.iloc[0]["ID"] 
+        from connect_db import chercher_therapeute
+        compte = chercher_therapeute(identifiant)
+        if compte:
+            attendu = str(compte.get("MotDePasse", "")).strip()
+            if hmac.compare_digest(attendu.encode(), str(mot_de_passe).strip().encode()):
+                return compte.get("ID")
     except: pass
     return None
 
@@ -68,28 +58,50 @@ def recuperer_mes_patients(therapeute_id):
     except: pass
     return pd.DataFrame()
 
-# Cache de 2 min pour les données cliniques
-@st.cache_data(ttl=120)
+# Onglets affichés dans la vue thérapeute (chargés ensemble au premier affichage)
+ONGLETS_DOSSIER = [
+    "Activites", "Humeur", "Sommeil", "Addictions", "Compulsions", "Beck",
+    "PHQ9", "GAD7", "ISI", "PEG", "WHO5", "WSAS",
+    "Resolution_Probleme", "Exposition", "Balance_Decisionnelle", "SORC"
+]
+
+# Pas de cache Streamlit ici : connect_db garde les lignes en cache (commun à toutes les sessions)
+# et le corrige à chaque écriture, une saisie du patient est donc visible tout de suite.
+def charger_dossier_patient(patient_id):
+    """
+    Tout le dossier du patient en un seul aller-retour ({onglet: DataFrame}).
+    Gardé dans la session tant que le cache des lectures n'a pas changé pour ces onglets :
+    les sections du dossier ne relancent pas chacune un load_many des 16 onglets.
+    """
+    try:
+        from connect_db import load_many, get_read_cache
+        cle = str(patient_id).strip()
+        memo = st.session_state.get("dossier_patient")
+        if memo and memo["patient"] == cle and memo["versions"] == get_read_cache().versions(ONGLETS_DOSSIER, cle):
+            return memo["dfs"]
+        # Seules les lignes du patient sont transférées (filtre fait par le moteur de stockage)
+        dfs = load_many(ONGLETS_DOSSIER, patient_id, erreurs=True)
+        st.session_state["dossier_patient"] = {
+            "patient": cle, "versions": get_read_cache().versions(ONGLETS_DOSSIER, cle), "dfs": dfs
+        }
+        return dfs
+    except: pass
+    return {}
+
 def charger_donnees_specifiques(nom_onglet, patient_id):
+    if nom_onglet in ONGLETS_DOSSIER:
+        df = charger_dossier_patient(patient_id).get(nom_onglet)
+        return df.copy() if df is not None else pd.DataFrame()  # Copie : le dossier gardé reste intact
     try:
-        from connect_db import load_data
-        data = load_data(nom_onglet)
-        if data:
-            df = pd.DataFrame(data)
-            if "Patient" in df.columns:
-                return df[df["Patient"] == patient_id]
+        from connect_db import load_many
+        return load_many([nom_onglet], patient_id)[nom_onglet]
     except: pass
     return pd.DataFrame()
 
-@st.cache_data(ttl=300)
 def verifier_code_patient(code):
     try:
-        from connect_db import load_data
-        data = load_data("Codes_Patients")
-        if data:
-            df = pd.DataFrame(data)
-            if "Code" in df.columns:
-                if code.upper() in df["Code"].astype(str).str.upper().values: return True
+        from connect_db import chercher_code_patient
+        return chercher_code_patient(code) is not None
     except: pass
     return False
 
@@ -117,100 +129,60 @@ MAP_OUTILS = {
     "📊 WSAS (Handicap)": "wsas"
 }
 
-@st.cache_data(ttl=300)
+# Les fonctions ci-dessous lisent / écrivent le suivi du patient sous forme d'événements
+# (onglet Evenements_Suivi, voir evenements.py) : chaque sauvegarde n'ajoute que ce qui a changé.
+
+def _auteur():
+    return str(st.session_state.get("user_id", ""))
+
 def charger_outils_autorises(patient_id):
     """
-    Récupère la liste des outils EXPLICITEMENT autorisés pour un patient.
-    Par défaut (si pas de ligne), retourne une liste vide [].
+    Récupère les outils EXPLICITEMENT autorisés pour un patient (frozenset, résolu une fois par session).
+    Par défaut (aucun outil autorisé), retourne un ensemble vide.
     """
     try:
-        from connect_db import load_data
-        # On utilise une nouvelle table 'Outils_Autorises' (à créer dans GSheets : Patient | Outils)
-        data = load_data("Outils_Autorises")
-        if data:
-            df = pd.DataFrame(data)
-            row = df[df["Patient"] == patient_id]
-            if not row.empty:
-                # La colonne s'appelle 'Outils' et contient "sommeil,beck,phq9"
-                outils_str = str(row.iloc[0]["Outils"])
-                return [x.strip() for x in outils_str.split(",") if x.strip()]
+        from permissions import outils_autorises
+        return outils_autorises(patient_id)
     except: pass
-    return [] # Tout est bloqué par défaut
+    return frozenset() # Tout est bloqué par défaut
 
 def sauvegarder_outils_autorises(patient_id, liste_cles):
-    """Enregistre la nouvelle liste d'outils autorisés."""
+    """Enregistre la nouvelle liste d'outils autorisés (un événement par outil ajouté / retiré)."""
     try:
-        from connect_db import save_data, delete_data_flexible
-        
-        # 1. Nettoyage
-        delete_data_flexible("Outils_Autorises", {"Patient": patient_id})
-        
-        # 2. Sauvegarde
-        chaine_outils = ",".join(liste_cles)
-        save_data("Outils_Autorises", [patient_id, chaine_outils])
+        from evenements import enregistrer_etat
+        from permissions import invalider_permissions
+        ok = enregistrer_etat(patient_id, {"outils": list(liste_cles)}, _auteur())
         
-        # 3. Mise à jour du cache
-        charger_outils_autorises.clear()
-        return True
+        # Les sessions du patient refont la résolution de ses accès
+        invalider_permissions(patient_id)
+        return ok
     except Exception as e:
         st.error(f"Erreur sauvegarde outils : {e}")
         return False
     
-# --- GESTION COMBINÉE : VALIDATION + COMMENTAIRES (Onglet Suivi_Validation) ---
-@st.cache_data(ttl=60)
+# --- GESTION COMBINÉE : VALIDATION + COMMENTAIRES ---
 def charger_suivi_global(patient_id):
     """
     Récupère à la fois la liste des modules validés (Vert) 
-    ET les commentaires du thérapeute depuis l'onglet 'Suivi_Validation'.
+    ET les commentaires du thérapeute.
     Retourne : (liste_modules_valides, dictionnaire_commentaires)
     """
     try:
-        from connect_db import load_data
-        data = load_data("Suivi_Validation") 
-        if data:
-            df = pd.DataFrame(data)
-            row = df[df["Patient"] == patient_id]
-            if not row.empty:
-                # 1. Récupération des modules validés
-                valides_str = str(row.iloc[0].get("Modules_Valides", ""))
-                liste_valides = [x.strip() for x in valides_str.split(",") if x.strip()]
-                
-                # 2. Récupération des commentaires (JSON stocké dans la colonne 'Commentaires')
-                commentaires_json = row.iloc[0].get("Commentaires", "{}")
-                # Petit nettoyage si la cellule est vide ou nan
-                if not commentaires_json or commentaires_json == "nan" or commentaires_json == "None":
-                    dict_notes = {}
-                else:
-                    try:
-                        dict_notes = json.loads(str(commentaires_json))
-                    except:
-                        dict_notes = {}
-                
-                return liste_valides, dict_notes
+        from evenements import etat_patient
+        etat = etat_patient(patient_id)
+        return etat["valides"], etat["commentaires"]
     except Exception as e:
         print(f"Erreur chargement suivi: {e}")
         pass
     return [], {}
 
 def sauvegarder_suivi_global(patient_id, liste_modules, dict_notes):
-    """Enregistre tout (Validation + Notes) dans l'onglet Suivi_Validation."""
+    """Enregistre tout (Validation + Notes) : seuls les modules et commentaires modifiés sont ajoutés."""
     try:
-        from connect_db import save_data, delete_data_flexible
-        
-        # 1. Supprimer l'ancienne ligne
-        delete_data_flexible("Suivi_Validation", {"Patient": patient_id})
-        
-        # 2. Préparer les données
-        chaine_valides = ",".join(liste_modules)
-        json_notes = json.dumps(dict_notes)
-        
-        # 3. Sauvegarder : [Patient, Modules_Valides, Commentaires]
-        # Assure-toi que ton Google Sheet a bien ces 3 colonnes dans cet ordre
-        save_data("Suivi_Validation", [patient_id, chaine_valides, json_notes])
-        
-        # 4. Vider le cache pour rechargement immédiat
-        charger_suivi_global.clear() # Important pour voir le changement tout de suite
-        return True
+        from evenements import enregistrer_etat
+        return enregistrer_etat(
+            patient_id, {"valides": list(liste_modules), "commentaires": dict(dict_notes)}, _auteur()
+        )
     except Exception as e:
         st.error(f"Erreur sauvegarde globale : {e}")
         return False
@@ -222,29 +194,17 @@ def sauvegarder_suivi_global(patient_id, liste_modules, dict_notes):
 def charger_progression(patient_id):
     """Récupère la liste des modules débloqués pour un patient"""
     try:
-        from connect_db import load_data
-        data = load_data("Progression")
-        if data:
-            df = pd.DataFrame(data)
-            row = df[df["Patient"] == patient_id]
-            if not row.empty:
-                modules_str = str(row.iloc[0]["Modules_Actifs"])
-                # Retourne une liste propre : ['intro', 'module1']
-                return [x.strip() for x in modules_str.split(",") if x.strip()]
+        from evenements import etat_patient
+        # Retourne une liste propre : ['intro', 'module1']
+        return etat_patient(patient_id)["progression"]
     except: pass
     return ["intro"] # Par défaut, seulement l'intro est débloquée
 
 def sauvegarder_progression(patient_id, liste_modules):
-    """Enregistre les modules débloqués"""
+    """Enregistre les modules débloqués (événements module_debloque / module_bloque)"""
     try:
-        from connect_db import save_data, delete_data_flexible
-        # 1. On nettoie l'ancienne progression
-        delete_data_flexible("Progression", {"Patient": patient_id})
-        
-        # 2. On enregistre la nouvelle
-        chaine_modules = ",".join(liste_modules)
-        save_data("Progression", [patient_id, chaine_modules])
-        return True
+        from evenements import enregistrer_etat
+        return enregistrer_etat(patient_id, {"progression": list(liste_modules)}, _auteur())
     except Exception as e:
         st.error(f"Erreur sauvegarde progression : {e}")
         return False
@@ -252,27 +212,17 @@ def sauvegarder_progression(patient_id, liste_modules):
 def charger_etat_devoirs(patient_id):
     """Charge la liste des devoirs EXCLUS (décochés) par le thérapeute."""
     try:
-        from connect_db import load_data
-        data = load_data("Suivi_Devoirs")
-        if data:
-            df = pd.DataFrame(data)
-            row = df[df["Patient"] == patient_id]
-            if not row.empty:
-                # On stocke sous forme JSON : {"module1": [0], "module2": [1]} (indices décochés)
-                json_str = row.iloc[0]["Donnees_Json"]
-                return json.loads(json_str)
+        from evenements import etat_patient
+        # Format : {"module1": [0], "module2": [1]} (indices décochés)
+        return etat_patient(patient_id)["devoirs"]
     except: pass
     return {}
 
 def sauvegarder_etat_devoirs(patient_id, dict_devoirs_exclus):
-    """Sauvegarde l'état des devoirs."""
+    """Sauvegarde l'état des devoirs (un événement par module modifié)."""
     try:
-        from connect_db import save_data, delete_data_flexible
-        delete_data_flexible("Suivi_Devoirs", {"Patient": patient_id})
-        
-        json_str = json.dumps(dict_devoirs_exclus)
-        save_data("Suivi_Devoirs", [patient_id, json_str])
-        return True
+        from evenements import enregistrer_etat
+        return enregistrer_etat(patient_id, {"devoirs": dict(dict_devoirs_exclus)}, _auteur())
     except Exception as e:
         st.error(f"Erreur sauvegarde devoirs : {e}")
         return False
@@ -281,28 +231,17 @@ def sauvegarder_etat_devoirs(patient_id, dict_devoirs_exclus):
 def charger_notes_seance(patient_id):
     """Charge les notes textuelles du thérapeute pour chaque module."""
     try:
-        from connect_db import load_data
-        # On utilise une table 'Notes_Seance' (à créer ou simuler)
-        data = load_data("Notes_Seance")
-        if data:
-            df = pd.DataFrame(data)
-            row = df[df["Patient"] == patient_id]
-            if not row.empty:
-                # Format JSON : {"module1": "Patient va bien...", "module2": "..."}
-                json_str = row.iloc[0]["Donnees_Json"]
-                return json.loads(json_str)
+        from evenements import etat_patient
+        # Format : {"module1": "Patient va bien...", "module2": "..."}
+        return etat_patient(patient_id)["notes"]
     except: pass
     return {}
 
 def sauvegarder_notes_seance(patient_id, dict_notes):
-    """Sauvegarde les notes."""
+    """Sauvegarde les notes (un événement par module modifié)."""
     try:
-        from connect_db import save_data, delete_data_flexible
-        delete_data_flexible("Notes_Seance", {"Patient": patient_id})
-        
-        json_str = json.dumps(dict_notes)
-        save_data("Notes_Seance", [patient_id, json_str])
-        return True
+        from evenements import enregistrer_etat
+        return enregistrer_etat(patient_id, {"notes": dict(dict_notes)}, _auteur())
     except Exception as e:
         st.error(f"Erreur sauvegarde notes : {e}")
         return False
@@ -329,14 +268,10 @@ if not st.session_state.authentifie:
                     
                     final_id = clean_code 
                     try:
-                        from connect_db import load_data
-                        data_p = load_data("Codes_Patients")
-                        if data_p:
-                            df_p = pd.DataFrame(data_p)
-                            match = df_p[df_p["Code"].astype(str).str.upper() == clean_code]
-                            if not match.empty:
-                                c_cible = "Identifiant" if "Identifiant" in df_p.columns else "Commentaire"
-                                final_id = match.iloc[0][c_cible]
+                        from connect_db import chercher_code_patient
+                        compte = chercher_code_patient(clean_code)
+                        if compte:
+                            final_id = compte.get("Identifiant", compte.get("Commentaire", clean_code))
                     except: pass
 
                     st.session_state.user_id = final_id 
@@ -387,30 +322,62 @@ else:
             else:
                 st.session_state.liste_patients_cache = []
 
+        def ajouter_patients_crees(lignes):
+            """Les nouveaux dossiers rejoignent la liste en place (pas de rechargement de l'onglet)."""
+            for ligne in lignes:
+                if ligne["Identifiant"] not in st.session_state.liste_patients_cache:
+                    st.session_state.liste_patients_cache.append(ligne["Identifiant"])
+            recuperer_mes_patients.clear()  # Pour les prochaines sessions de ce thérapeute
+
         # 1. CRÉATION PATIENT (Code simplifié pour ne pas alourdir)
         with st.expander("➕ Nouveau Patient"):
             c_gen1, c_gen2 = st.columns([1, 2])
             with c_gen1: 
-                # Calcul rapide de l'ID suivant sans appel DB si possible
-                nb_pats = len(st.session_state.liste_patients_cache)
-                prochain_id = f"PAT-{nb_pats+1:03d}"
+                # Numéro suivant d'après l'index des comptes (en mémoire, pas d'appel DB)
+                try:
+                    from connect_db import get_account_index
+                    from comptes import nouveaux_dossiers
+                    prochain_id = nouveaux_dossiers(1, get_account_index().cles("Codes_Patients", "identifiant"))[0]
+                except Exception:
+                    prochain_id = f"PAT-{len(st.session_state.liste_patients_cache)+1:03d}"
                 id_dossier = st.text_input("Dossier", value=prochain_id)
             with c_gen2:
                 st.write(" ")
                 if st.button("Générer accès"):
-                    ac_code = generer_code_securise("TCC")
                     try:
-                        from connect_db import save_data
-                        save_data("Codes_Patients", [ac_code, st.session_state.user_id, id_dossier, str(datetime.now().date())])
-                        st.success(f"Créé : {id_dossier} -> Code : {ac_code}")
-                        # On force le rechargement de la liste au prochain tour
-                        if "liste_patients_cache" in st.session_state:
-                            del st.session_state.liste_patients_cache
-                        recuperer_mes_patients.clear()
-                        time.sleep(1)
-                        st.rerun()
+                        from connect_db import creer_patients
+                        crees = creer_patients(st.session_state.user_id, 1, identifiants=[id_dossier.strip()])
+                        if crees:
+                            st.success(f"Créé : {crees[0]['Identifiant']} -> Code : {crees[0]['Code']}")
+                            ajouter_patients_crees(crees)
+                    except Exception as e: st.error(e)
+
+            # Création en lot : un seul appel pour tout un groupe, liste des codes à télécharger
+            st.markdown("**Création en lot**")
+            c_lot1, c_lot2 = st.columns([1, 2])
+            with c_lot1:
+                nb_lot = st.number_input("Nombre de patients", min_value=1, max_value=500, value=10, step=1)
+            with c_lot2:
+                st.write(" ")
+                if st.button(f"Créer {int(nb_lot)} dossiers"):
+                    try:
+                        from connect_db import creer_patients
+                        crees = creer_patients(st.session_state.user_id, int(nb_lot))
+                        if crees:
+                            ajouter_patients_crees(crees)
+                            st.session_state.dernier_lot_patients = crees
                     except Exception as e: st.error(e)
 
+            if st.session_state.get("dernier_lot_patients"):
+                lot = pd.DataFrame(st.session_state.dernier_lot_patients)[["Identifiant", "Code", "Date_Creation"]]
+                st.success(f"{len(lot)} dossiers créés ({lot['Identifiant'].iloc[0]} → {lot['Identifiant'].iloc[-1]}).")
+                st.download_button(
+                    "📥 Télécharger la liste des codes (CSV)",
+                    lot.to_csv(index=False).encode("utf-8"),
+                    file_name=f"codes_patients_{datetime.now():%Y%m%d_%H%M}.csv",
+                    mime="text/csv",
+                )
+
         # 2. SÉLECTION PATIENT
         st.subheader("📂 Dossiers Patients")
         
@@ -428,8 +395,7 @@ else:
                     st.caption("Par défaut, tout est masqué. Cochez les outils pour les rendre accessibles.")
                     
                     # On crée la liste des noms lisibles déjà activés
-                    INV_MAP = {v: k for k, v in MAP_OUTILS.items()}
-                    default_options = [INV_MAP[k] for k in outils_autorises if k in INV_MAP]
+                    default_options = [nom for nom, cle in MAP_OUTILS.items() if cle in outils_autorises]
                     
                     choix_ouverts = st.multiselect(
                         "Outils accessibles :",
@@ -613,8 +579,8 @@ else:
                                         if data['taches_domicile']:
                                             sauvegarder_etat_devoirs(patient_sel, devoirs_exclus_memoire)
                                         
-                                        if code_mod not in charger_progression(patient_sel): # Vérif légère
-                                            sauvegarder_progression(patient_sel, progression_patient)
+                                        # N'ajoute un événement que si le module n'était pas déjà débloqué
+                                        sauvegarder_progression(patient_sel, progression_patient)
                                             
                                         sauvegarder_suivi_global(patient_sel, modules_valides_db, notes_seance_db)
                                         
@@ -636,6 +602,19 @@ else:
                                         else: st.warning(f"Manque : {nom_fichier}")
                                 else: st.caption("Aucun document.")
 
+                # --- HISTORIQUE DES ACTIONS (ÉVÉNEMENTS DU SUIVI) ---
+                with st.expander("🕓 Historique des actions sur le dossier", expanded=False):
+                    try:
+                        from evenements import historique_patient
+                        histo = historique_patient(patient_sel)
+                    except:
+                        histo = []
+                    if histo:
+                        df_histo = pd.DataFrame(histo)[["Date", "Type", "Cle", "Valeur", "Auteur"]]
+                        st.dataframe(df_histo.iloc[::-1], use_container_width=True, hide_index=True)
+                    else:
+                        st.caption("Aucune action enregistrée.")
+
                 # --- FONCTION POUR AJOUTER LE CADENAS DANS LE TITRE ---
                 def T(titre, cle_technique):
                     # Si l'outil N'EST PAS dans la liste des autorisés, on met un cadenas
@@ -908,15 +887,10 @@ else:
             # 1. Récupération ID Affichage
             display_id = st.session_state.user_id 
             try:
-                from connect_db import load_data
-                infos = load_data("Codes_Patients")
-                if infos:
-                    df_infos = pd.DataFrame(infos)
-                    code_actuel = str(st.session_state.user_id).strip().upper()
-                    match = df_infos[df_infos["Identifiant"].astype(str).str.strip().str.upper() == code_actuel]
-                    if not match.empty:
-                        col_id = "Identifiant" if "Identifiant" in df_infos.columns else "Commentaire"
-                        display_id = match.iloc[0][col_id]
+                from connect_db import chercher_patient
+                compte = chercher_patient(st.session_state.user_id)
+                if compte:
+                    display_id = compte.get("Identifiant", compte.get("Commentaire", display_id))
             except: pass
             
             # 2. Chargement des permissions (au cas où)
@@ -1,5 +1,6 @@
 from fpdf import FPDF
 import pandas as pd
+from schemas import en_nombres
 from datetime import datetime
 
 class PDF(FPDF):
@@ -36,6 +37,23 @@ class PDF(FPDF):
             self.ln()
         self.ln(5)
 
+def moyennes_hebdo(nom_onglet, df, colonnes, nb_semaines=4):
+    """
+    Moyennes des dernières semaines, calculées sur les lignes du rapport (agréger + résumer, voir agregats.py) :
+    mêmes données que le reste du PDF. None si aucune ligne datée.
+    """
+    from agregats import agreger, resumer
+
+    jours = agreger(nom_onglet, df.to_dict("records")).reset_index()
+    if jours.empty:
+        return None
+    jours["Semaine"] = jours["Jour"] - pd.to_timedelta(jours["Jour"].dt.weekday, unit="D")
+    semaines = resumer(jours, ["Semaine"], colonnes).sort_values("Semaine", kind="stable").tail(nb_semaines)
+    tableau = pd.DataFrame({"Semaine du": semaines["Semaine"].dt.strftime("%d/%m/%Y")})
+    for col in colonnes:
+        tableau[col] = semaines[col].map(lambda v: "-" if pd.isna(v) else f"{v:.1f}")
+    return tableau
+
 def generer_pdf(data_dict, patient_id):
     pdf = PDF()
     pdf.add_page()
@@ -80,12 +98,16 @@ def generer_pdf(data_dict, patient_id):
     pdf.chapter_title("2. Synthèse du Sommeil")
     df_s = data_dict.get('sommeil')
     if not df_s.empty:
-        eff_moy = pd.to_numeric(df_s["Efficacité"].astype(str).str.replace('%',''), errors='coerce').mean()
+        eff_moy = en_nombres(df_s["Efficacité"]).mean()
         pdf.chapter_body_text(f"Nombre de nuits enregistrées : {len(df_s)}")
         pdf.chapter_body_text(f"Efficacité moyenne du sommeil : {eff_moy:.1f}%")
         # Petit tableau des 5 dernières nuits
         cols = ["Date", "Heure Coucher", "Heure Lever", "Efficacité"]
         pdf.add_table_simple(df_s.tail(5), cols)
+        semaines = moyennes_hebdo("Sommeil", df_s, ["Efficacité", "Forme", "Qualité"])
+        if semaines is not None:
+            pdf.chapter_body_text("Moyennes par semaine :")
+            pdf.add_table_simple(semaines, list(semaines.columns))
     else:
         pdf.chapter_body_text("Pas de données de sommeil.")
 
@@ -96,6 +118,10 @@ def generer_pdf(data_dict, patient_id):
         pdf.chapter_body_text(f"Nombre d'activités notées : {len(df_a)}")
         cols = ["Date", "Heure", "Activité", "Plaisir (0-10)"]
         pdf.add_table_simple(df_a.tail(7), cols)
+        semaines = moyennes_hebdo("Activites", df_a, ["Plaisir (0-10)", "Maîtrise (0-10)"])
+        if semaines is not None:
+            pdf.chapter_body_text("Moyennes par semaine :")
+            pdf.add_table_simple(semaines, list(semaines.columns))
     else:
         pdf.chapter_body_text("Pas d'activités enregistrées.")
 
@@ -1,7 +1,136 @@
+import hashlib
+import threading
+from collections import OrderedDict
 import streamlit as st
 import pandas as pd
 import altair as alt
 from datetime import datetime, timedelta
+from schemas import en_nombres, colonne_dates, colonne_date_heure
+from agregats import AGREGATS, agreger, avec_moyennes, resumer
+from sommeil import DUREES, format_duree, format_efficacite
+
+
+# ==============================================================================
+# 0. PÉRIODES D'ANALYSE (index de dates trié + recherche dichotomique)
+# ==============================================================================
+# Chaque agenda est indexé une fois par sa date (DatetimeIndex trié) ; une période
+# n'est plus un masque recalculé ligne à ligne, mais deux searchsorted et une tranche.
+
+PERIODE_PERSO = "Période personnalisée"
+
+def indexer_par_date(df, colonne):
+    """Lignes à date valide, indexées par la colonne (DatetimeIndex trié, la colonne reste disponible)."""
+    df = df.dropna(subset=[colonne])
+    df = df.set_axis(pd.DatetimeIndex(df[colonne]).rename(None), axis=0)
+    return df if df.index.is_monotonic_increasing else df.sort_index(kind="stable")
+
+def bornes_periode(vue, date_ref):
+    """(début, fin exclue, titre) de la vue autour de date_ref, None pour tout l'historique."""
+    if vue == PERIODE_PERSO:
+        plage = list(date_ref) if isinstance(date_ref, (list, tuple)) else [date_ref]  # (début,) pendant la saisie
+        plage = [d for d in plage if d is not None]
+        if not plage:
+            return None  # Plage effacée : tout l'historique
+        debut, fin = plage[0], plage[-1]
+        return pd.Timestamp(debut), pd.Timestamp(fin) + pd.Timedelta(days=1), f"du {debut.strftime('%d/%m')} au {fin.strftime('%d/%m/%Y')}"
+    jour = pd.Timestamp(date_ref)
+    if vue == "Journée":
+        return jour, jour + pd.Timedelta(days=1), f"du {date_ref.strftime('%d/%m/%Y')}"
+    if vue == "Semaine":
+        debut = jour - pd.Timedelta(days=jour.weekday())
+        return debut, debut + pd.Timedelta(days=7), f"Semaine du {debut.strftime('%d/%m')}"
+    if vue == "Mois":
+        debut = jour.replace(day=1)
+        return debut, debut + pd.offsets.MonthBegin(1), f"Mois de {date_ref.strftime('%m/%Y')}"
+    return None
+
+def trancher_periode(df, bornes):
+    """Lignes de df (indexé par indexer_par_date) dans [début, fin) : O(log n) + la tranche."""
+    if bornes is None:
+        return df
+    i, j = df.index.searchsorted([bornes[0], bornes[1]])
+    return df.iloc[i:j]
+
+def _jours_agreges(nom_onglet, df, periode=None):
+    """Agrégats quotidiens (agregats.py) des lignes reçues, sur la période : mêmes données que le tableau affiché."""
+    jours = avec_moyennes(agreger(nom_onglet, df), AGREGATS[nom_onglet]["colonnes"])
+    return trancher_periode(indexer_par_date(jours, "Jour"), periode).reset_index(drop=True)
+
+def choisir_periode(vues, cle):
+    """
+    Sélecteurs « Vue » et « Date référence » ; retourne (vue, bornes de la période, brut).
+    brut : sur une période restreinte, l'utilisateur peut demander tous les points (sans réduction).
+    """
+    st.subheader("📅 Période d'analyse")
+    c1, c2 = st.columns([1, 2])
+    with c1:
+        vue = st.selectbox("Vue :", vues + [PERIODE_PERSO], key=f"vue_{cle}")
+    with c2:
+        if vue == PERIODE_PERSO:
+            date_ref = st.date_input("Du / au :", (datetime.now() - timedelta(days=30), datetime.now()), key=f"plage_{cle}")
+        else:
+            date_ref = st.date_input("Date référence :", datetime.now(), key=f"date_{cle}")
+    periode = bornes_periode(vue, date_ref)
+    brut = periode is not None and st.checkbox("Afficher tous les points", key=f"brut_{cle}")
+    return vue, periode, brut
+
+# ==============================================================================
+# 0 bis. RÉDUCTION DES POINTS (LTTB)
+# ==============================================================================
+# Altair envoie chaque point au navigateur. Au-delà d'environ un point par pixel, les points
+# supplémentaires ne se voient plus : les longues séries sont réduites côté serveur par
+# « largest triangle three buckets », qui garde les pics et les creux de la courbe.
+
+MAX_POINTS = 600  # ≈ largeur utile d'un graphique en pixels
+
+def _lttb(xs, ys, n):
+    """Positions des n points gardés (xs, ys : valeurs triées par x, sans trou)."""
+    taille = len(xs)
+    if n >= taille or n < 3:
+        return list(range(taille))
+    # n - 2 paquets entre le premier et le dernier point (toujours gardés)
+    bords = [1 + (taille - 2) * k // (n - 2) for k in range(n - 1)]
+    gardes, a = [0], 0
+    for i in range(n - 2):
+        debut, fin = bords[i], bords[i + 1]
+        suivant = slice(fin, bords[i + 2] if i + 2 < len(bords) else taille)
+        moy_x, moy_y = xs[suivant].mean(), ys[suivant].mean()
+        # Aire du triangle (point gardé précédent, candidat, moyenne du paquet suivant)
+        aires = abs((xs[a] - moy_x) * (ys[debut:fin] - ys[a]) - (xs[a] - xs[debut:fin]) * (moy_y - ys[a]))
+        a = debut + int(aires.argmax())
+        gardes.append(a)
+    gardes.append(taille - 1)
+    return gardes
+
+def reduire_points(df, x, y, brut=False, par=None, max_points=MAX_POINTS):
+    """
+    Lignes de df suffisantes pour tracer y (colonne ou liste de colonnes) en fonction de x.
+    Chaque colonne y garde sa propre forme (union des points gardés) ; par : une série par valeur
+    de cette colonne (format long). brut=True (ou peu de points) : df tel quel.
+    """
+    if brut or len(df) <= max_points:
+        return df
+    if par is not None:
+        return pd.concat([reduire_points(g, x, y, par=None, max_points=max_points)
+                          for _, g in df.groupby(par, observed=True)])
+
+    colonnes = [y] if isinstance(y, str) else list(y)
+    d = df.sort_values(x, kind="stable")
+    abscisses = d[x]
+    if pd.api.types.is_datetime64_any_dtype(abscisses):
+        abscisses = abscisses.astype("int64")
+    abscisses = abscisses.astype(float).to_numpy()
+
+    gardes = set()
+    for colonne in colonnes:
+        valeurs = en_nombres(d[colonne]).astype(float).to_numpy()
+        valides = (valeurs == valeurs).nonzero()[0]  # NaN exclus
+        if len(valides) <= max_points:
+            gardes.update(valides)
+            continue
+        positions = _lttb(abscisses[valides], valeurs[valides], max_points)
+        gardes.update(valides[p] for p in positions)
+    return d.iloc[sorted(gardes)]
 
 
 # ==============================================================================
@@ -25,55 +154,43 @@ def afficher_activites(df_activites, df_humeur, current_user_id):
         st.divider()
 
         # --- B. FILTRES ---
-        st.subheader("📅 Période d'analyse")
-        c1, c2 = st.columns([1, 2])
-        with c1:
-            vue = st.selectbox("Vue :", ["Tout l'historique", "Journée", "Semaine", "Mois"], key="vue_act")
-        with c2:
-            date_ref = st.date_input("Date référence :", datetime.now(), key="date_act")
+        vue, periode, brut = choisir_periode(["Tout l'historique", "Journée", "Semaine", "Mois"], "act")
 
         # --- C. PRÉPARATION DONNÉES ---
-        df_filtre = df_activites.copy()
         cols_num = ["Plaisir (0-10)", "Maîtrise (0-10)", "Satisfaction (0-10)"]
-        for c in cols_num: 
-            if c in df_filtre.columns:
-                df_filtre[c] = pd.to_numeric(df_filtre[c], errors='coerce')
-        
-        df_filtre["Date_Obj"] = pd.to_datetime(df_filtre["Date"], errors='coerce')
-        # Construction Datetime
-        try:
-            df_filtre["Datetime_Full"] = pd.to_datetime(
-                df_filtre["Date"].astype(str) + " " + df_filtre["Heure"].astype(str), 
-                errors='coerce'
-            )
-        except:
-            df_filtre["Datetime_Full"] = df_filtre["Date_Obj"]
-
-        df_filtre = df_filtre.dropna(subset=["Datetime_Full", "Activité"])
-
-        # Logique Filtre
-        titre_graphique = "Historique complet"
-        format_axe_x = '%d/%m'
-        titre_axe_x = "Date"
-
-        if vue == "Journée":
-            df_filtre = df_filtre[df_filtre['Datetime_Full'].dt.date == date_ref]
-            titre_graphique = f"du {date_ref.strftime('%d/%m/%Y')}"
-            format_axe_x = '%H:%M'
-            titre_axe_x = "Heure"
-        elif vue == "Semaine":
-            start = date_ref - timedelta(days=date_ref.weekday())
-            end = start + timedelta(days=6)
-            df_filtre = df_filtre[(df_filtre['Datetime_Full'].dt.date >= start) & (df_filtre['Datetime_Full'].dt.date <= end)]
-            titre_graphique = f"Semaine du {start.strftime('%d/%m')}"
-        elif vue == "Mois":
-            df_filtre = df_filtre[(df_filtre['Datetime_Full'].dt.month == date_ref.month) & (df_filtre['Datetime_Full'].dt.year == date_ref.year)]
-            titre_graphique = f"Mois de {date_ref.strftime('%m/%Y')}"
-
-        if not df_filtre.empty:
+        titre_graphique = periode[2] if periode else "Historique complet"
+        format_axe_x = '%H:%M' if vue == "Journée" else '%d/%m'
+        titre_axe_x = "Heure" if vue == "Journée" else "Date"
+
+        # Hors vue « Journée », les moyennes sont calculées sur les agrégats quotidiens des lignes reçues
+        if vue != "Journée":
+            jours = _jours_agreges("Activites", df_activites.dropna(subset=["Activité"]), periode)
+            a_des_donnees = not jours.empty
+            df_grp = resumer(jours, ["Activité"], cols_num)[["Activité"] + cols_num]
+            df_evol_raw = resumer(jours, ["Jour"], cols_num).rename(columns={"Jour": "Date_Obj"})[["Date_Obj"] + cols_num]
+        else:
+            df_filtre = df_activites.copy()
+            for c in cols_num: 
+                if c in df_filtre.columns:
+                    df_filtre[c] = en_nombres(df_filtre[c])
+            
+            df_filtre["Date_Obj"] = colonne_dates(df_filtre["Date"])
+            # Construction Datetime
+            try:
+                df_filtre["Datetime_Full"] = colonne_date_heure(df_filtre["Date"], df_filtre["Heure"])
+            except:
+                df_filtre["Datetime_Full"] = df_filtre["Date_Obj"]
+
+            # Logique Filtre
+            df_filtre = indexer_par_date(df_filtre.dropna(subset=["Activité"]), "Datetime_Full")
+            df_filtre = trancher_periode(df_filtre, periode)
+            a_des_donnees = not df_filtre.empty
+            df_grp = df_filtre.groupby("Activité")[cols_num].mean().reset_index()
+            df_evol_raw = df_filtre
+
+        if a_des_donnees:
             # 1. MOYENNES (Bar Chart)
             st.subheader(f"📊 Moyennes {titre_graphique}")
-            df_grp = df_filtre.groupby("Activité")[cols_num].mean().reset_index()
             df_long = df_grp.melt(id_vars=["Activité"], value_vars=cols_num, var_name="Critère", value_name="Note")
             
             c_bar = alt.Chart(df_long).mark_bar().encode(
@@ -85,16 +202,11 @@ def afficher_activites(df_activites, df_humeur, current_user_id):
 
             # 2. ÉVOLUTION (Line Chart)
             st.subheader(f"📈 Évolution {titre_graphique}")
-            if vue != "Journée":
-                df_evol_raw = df_filtre.groupby("Date_Obj")[cols_num].mean().reset_index()
-                x_def = alt.X('Date_Obj:T', title=titre_axe_x, axis=alt.Axis(format=format_axe_x))
-                col_x = 'Date_Obj'
-            else:
-                df_evol_raw = df_filtre
-                x_def = alt.X('Datetime_Full:T', title=titre_axe_x, axis=alt.Axis(format=format_axe_x))
-                col_x = 'Datetime_Full'
+            col_x = 'Datetime_Full' if vue == "Journée" else 'Date_Obj'
+            x_def = alt.X(f'{col_x}:T', title=titre_axe_x, axis=alt.Axis(format=format_axe_x))
 
             df_evol = df_evol_raw.melt(id_vars=[col_x], value_vars=cols_num, var_name="Critère", value_name="Note")
+            df_evol = reduire_points(df_evol, col_x, "Note", brut=brut, par="Critère")
             
             c_line = alt.Chart(df_evol).mark_line(point=True).encode(
                 x=x_def,
@@ -112,18 +224,12 @@ def afficher_activites(df_activites, df_humeur, current_user_id):
         st.subheader(f"🌈 Humeur {titre_graphique}")
         if not df_humeur.empty:
             df_h = df_humeur.copy()
-            df_h["Date_Obj"] = pd.to_datetime(df_h["Date"], errors='coerce')
+            df_h["Date_Obj"] = colonne_dates(df_h["Date"])
             if "Humeur Globale (0-10)" in df_h.columns:
-                df_h["Humeur Globale (0-10)"] = pd.to_numeric(df_h["Humeur Globale (0-10)"], errors='coerce')
-                df_h = df_h.dropna(subset=["Date_Obj"]).sort_values("Date_Obj")
-
-                # Filtre Humeur
-                if vue == "Semaine":
-                    df_h = df_h[(df_h['Date_Obj'].dt.date >= start) & (df_h['Date_Obj'].dt.date <= end)]
-                elif vue == "Mois":
-                    df_h = df_h[(df_h['Date_Obj'].dt.month == date_ref.month) & (df_h['Date_Obj'].dt.year == date_ref.year)]
-                elif vue == "Journée":
-                    df_h = df_h[df_h['Date_Obj'].dt.date == date_ref]
+                df_h["Humeur Globale (0-10)"] = en_nombres(df_h["Humeur Globale (0-10)"])
+                # Filtre Humeur (même période que les activités)
+                df_h = trancher_periode(indexer_par_date(df_h, "Date_Obj"), periode)
+                df_h = reduire_points(df_h, "Date_Obj", "Humeur Globale (0-10)", brut=brut)
 
                 if not df_h.empty:
                     c_hum = alt.Chart(df_h).mark_line(point=True, color="#FFA500").encode(
@@ -146,47 +252,38 @@ def afficher_activites(df_activites, df_humeur, current_user_id):
 def afficher_sommeil(df_sommeil, current_user_id):
     if not df_sommeil.empty:
         # A. TABLEAU
-        df_display = df_sommeil.copy()
+        df_display = df_sommeil.drop(columns=["ID_Ligne"], errors="ignore")  # Colonne technique masquée
         if "Patient" in df_display.columns:
             df_display["Patient"] = str(current_user_id)
+        # Durées stockées en minutes, efficacités en % : affichées "7h30" / "85 %"
+        for col in DUREES:
+            if col in df_display.columns:
+                df_display[col] = df_display[col].map(format_duree)
+        for col in ["Efficacité", "Efficacité 7j"]:
+            if col in df_display.columns:
+                df_display[col] = df_display[col].map(format_efficacite)
         
         st.dataframe(df_display, use_container_width=True, hide_index=True)
         st.divider()
 
         # B. ANALYSE
-        df_chart = df_sommeil.copy()
-        df_chart["Date_Obj"] = pd.to_datetime(df_chart["Date"], errors='coerce')
-        
         cols_num = ["Efficacité", "Forme", "Qualité"]
-        for c in cols_num:
-            if c in df_chart.columns:
-                df_chart[c] = pd.to_numeric(df_chart[c].astype(str).str.replace('%', ''), errors='coerce')
-        
-        df_chart = df_chart.dropna(subset=["Date_Obj"])
 
         # Filtres
-        st.subheader("📅 Période d'analyse")
-        c1, c2 = st.columns([1, 2])
-        with c1: vue = st.selectbox("Vue :", ["Tout l'historique", "Semaine", "Mois"], key="vue_som")
-        with c2: date_ref = st.date_input("Date référence :", datetime.now(), key="date_som")
-
-        titre = "Historique"
-        if vue == "Semaine":
-            start = date_ref - timedelta(days=date_ref.weekday())
-            end = start + timedelta(days=6)
-            df_chart = df_chart[(df_chart['Date_Obj'].dt.date >= start) & (df_chart['Date_Obj'].dt.date <= end)]
-            titre = f"Semaine du {start.strftime('%d/%m')}"
-        elif vue == "Mois":
-            df_chart = df_chart[(df_chart['Date_Obj'].dt.month == date_ref.month) & (df_chart['Date_Obj'].dt.year == date_ref.year)]
-            titre = f"Mois de {date_ref.strftime('%m/%Y')}"
-
-        if not df_chart.empty:
+        vue, periode, brut = choisir_periode(["Tout l'historique", "Semaine", "Mois"], "som")
+        titre = periode[2] if periode else "Historique"
+
+        # Moyennes par nuit : agrégats quotidiens (agregats.py) des lignes reçues
+        df_plot = _jours_agreges("Sommeil", df_sommeil, periode)
+        df_plot = df_plot.rename(columns={"Jour": "Date_Obj"})[["Date_Obj"] + cols_num]
+
+        if not df_plot.empty:
             # KPI
-            df_plot = df_chart.groupby("Date_Obj")[cols_num].mean().reset_index()
             k1, k2, k3 = st.columns(3)
             k1.metric("Efficacité Moy.", f"{df_plot['Efficacité'].mean():.1f} %")
             k2.metric("Forme Moy.", f"{df_plot['Forme'].mean():.1f} / 5")
             k3.metric("Qualité Moy.", f"{df_plot['Qualité'].mean():.1f} / 5")
+            df_plot = reduire_points(df_plot, "Date_Obj", cols_num, brut=brut)  # Après les moyennes : calculées sur tout
             
             st.divider()
             
@@ -240,38 +337,24 @@ def afficher_conso(df_conso, current_user_id):
         df_chart = df_display.copy()
         # Date complete
         try:
-            df_chart['Full_Date'] = pd.to_datetime(df_chart['Date'].astype(str) + ' ' + df_chart['Heure'].astype(str), errors='coerce')
+            df_chart['Full_Date'] = colonne_date_heure(df_chart['Date'], df_chart['Heure'])
         except:
-            df_chart['Full_Date'] = pd.to_datetime(df_chart['Date'], errors='coerce')
-        df_chart = df_chart.dropna(subset=['Full_Date'])
+            df_chart['Full_Date'] = colonne_dates(df_chart['Date'])
+        df_chart = indexer_par_date(df_chart, 'Full_Date')
 
         # Filtres Temps
-        st.subheader("📅 Période d'analyse")
-        c1, c2 = st.columns([1, 2])
-        with c1: vue = st.selectbox("Vue :", ["Tout", "Journée", "Semaine", "Mois"], key="vue_conso")
-        with c2: date_ref = st.date_input("Date référence :", datetime.now(), key="date_conso")
-
-        format_x = '%d/%m'
-        titre_x = "Date"
-        
-        if vue == "Journée":
-            df_chart = df_chart[df_chart['Full_Date'].dt.date == date_ref]
-            format_x = '%H:%M'
-            titre_x = "Heure"
-        elif vue == "Semaine":
-            start = date_ref - timedelta(days=date_ref.weekday())
-            end = start + timedelta(days=6)
-            df_chart = df_chart[(df_chart['Full_Date'].dt.date >= start) & (df_chart['Full_Date'].dt.date <= end)]
-        elif vue == "Mois":
-            df_chart = df_chart[(df_chart['Full_Date'].dt.month == date_ref.month) & (df_chart['Full_Date'].dt.year == date_ref.year)]
+        vue, periode, brut = choisir_periode(["Tout", "Journée", "Semaine", "Mois"], "conso")
+        format_x = '%H:%M' if vue == "Journée" else '%d/%m'
+        titre_x = "Heure" if vue == "Journée" else "Date"
+        df_chart = trancher_periode(df_chart, periode)
 
         # 1. ENVIES
         df_envie = df_chart[df_chart["Type"].astype(str).str.contains("ENVIE", na=False)]
         if not df_envie.empty:
             st.subheader("⚡ Envies (Craving)")
-            df_envie["Intensité"] = pd.to_numeric(df_envie["Intensité"], errors='coerce')
+            df_envie["Intensité"] = en_nombres(df_envie["Intensité"])
             
-            c_env = alt.Chart(df_envie).mark_line(point=True, color="#9B59B6").encode(
+            c_env = alt.Chart(reduire_points(df_envie, 'Full_Date', "Intensité", brut=brut)).mark_line(point=True, color="#9B59B6").encode(
                 x=alt.X('Full_Date:T', axis=alt.Axis(format=format_x), title=titre_x),
                 y=alt.Y('Intensité:Q', scale=alt.Scale(domain=[0, 10])),
                 tooltip=['Date', 'Heure', 'Substance', 'Intensité']
@@ -282,13 +365,22 @@ def afficher_conso(df_conso, current_user_id):
         df_cons = df_chart[df_chart["Type"].astype(str).str.contains("CONSOMMÉ", na=False)]
         if not df_cons.empty:
             st.subheader("🍷 Consommations")
-            df_cons["Quantité"] = pd.to_numeric(df_cons["Quantité"], errors='coerce')
-            
-            c_con = alt.Chart(df_cons).mark_bar(color="#E74C3C").encode(
-                x=alt.X('Full_Date:T', axis=alt.Axis(format=format_x), title=titre_x),
-                y='Quantité:Q',
-                tooltip=['Date', 'Heure', 'Substance', 'Quantité', 'Unité']
-            ).interactive()
+            # Hors vue « Journée » : total par jour et par substance (agrégats quotidiens des lignes affichées)
+            if vue != "Journée":
+                df_jour = resumer(_jours_agreges("Addictions", df_cons), ["Jour", "Substance"], ["Quantité"])
+                c_con = alt.Chart(df_jour).mark_bar(color="#E74C3C").encode(
+                    x=alt.X('Jour:T', axis=alt.Axis(format=format_x), title=titre_x),
+                    y=alt.Y('Quantité_somme:Q', title="Quantité (total du jour)"),
+                    tooltip=[alt.Tooltip('Jour:T', format='%d/%m/%Y', title="Date"), 'Substance', alt.Tooltip('Quantité_somme:Q', title="Total")]
+                ).interactive()
+            else:
+                df_cons["Quantité"] = en_nombres(df_cons["Quantité"])
+                
+                c_con = alt.Chart(df_cons).mark_bar(color="#E74C3C").encode(
+                    x=alt.X('Full_Date:T', axis=alt.Axis(format=format_x), title=titre_x),
+                    y='Quantité:Q',
+                    tooltip=['Date', 'Heure', 'Substance', 'Quantité', 'Unité']
+                ).interactive()
             st.altair_chart(c_con, use_container_width=True)
         
         if df_envie.empty and df_cons.empty:
@@ -307,33 +399,16 @@ def afficher_compulsions(df_comp, current_user_id):
         if "Heure" not in df_display.columns: df_display["Heure"] = "00:00"
         
         # Numérique
-        df_display["Répétitions"] = pd.to_numeric(df_display["Répétitions"], errors='coerce').fillna(0)
-        df_display["Durée (min)"] = pd.to_numeric(df_display["Durée (min)"], errors='coerce').fillna(0)
-        df_display["Date_Obj"] = pd.to_datetime(df_display["Date"], errors='coerce')
-        df_display["Datetime_Full"] = pd.to_datetime(
-            df_display["Date"].astype(str) + " " + df_display["Heure"].astype(str), errors='coerce'
-        )
+        df_display["Répétitions"] = en_nombres(df_display["Répétitions"]).fillna(0)
+        df_display["Durée (min)"] = en_nombres(df_display["Durée (min)"]).fillna(0)
+        df_display["Date_Obj"] = colonne_dates(df_display["Date"])
+        df_display["Datetime_Full"] = colonne_date_heure(df_display["Date"], df_display["Heure"])
 
         # Filtres
-        st.subheader("📅 Période d'analyse")
-        c1, c2 = st.columns([1, 2])
-        with c1: vue = st.selectbox("Vue :", ["Tout", "Journée", "Semaine", "Mois"], key="vue_comp")
-        with c2: date_ref = st.date_input("Date référence :", datetime.now(), key="date_comp")
-
-        format_x = '%d/%m'
-        titre_x = "Date"
-        df_filter = df_display.dropna(subset=["Datetime_Full"])
-
-        if vue == "Journée":
-            df_filter = df_filter[df_filter['Datetime_Full'].dt.date == date_ref]
-            format_x = '%H:%M'
-            titre_x = "Heure"
-        elif vue == "Semaine":
-            start = date_ref - timedelta(days=date_ref.weekday())
-            end = start + timedelta(days=6)
-            df_filter = df_filter[(df_filter['Datetime_Full'].dt.date >= start) & (df_filter['Datetime_Full'].dt.date <= end)]
-        elif vue == "Mois":
-            df_filter = df_filter[(df_filter['Datetime_Full'].dt.month == date_ref.month) & (df_filter['Datetime_Full'].dt.year == date_ref.year)]
+        vue, periode, brut = choisir_periode(["Tout", "Journée", "Semaine", "Mois"], "comp")
+        format_x = '%H:%M' if vue == "Journée" else '%d/%m'
+        titre_x = "Heure" if vue == "Journée" else "Date"
+        df_filter = trancher_periode(indexer_par_date(df_display, "Datetime_Full"), periode)
 
         if not df_filter.empty:
             # KPI
@@ -344,7 +419,7 @@ def afficher_compulsions(df_comp, current_user_id):
 
             # Graphique
             st.subheader("📈 Évolution")
-            base = alt.Chart(df_filter).encode(x=alt.X('Datetime_Full:T', axis=alt.Axis(format=format_x), title=titre_x))
+            base = alt.Chart(reduire_points(df_filter, "Datetime_Full", ["Répétitions", "Durée (min)"], brut=brut)).encode(x=alt.X('Datetime_Full:T', axis=alt.Axis(format=format_x), title=titre_x))
             
             l_rep = base.mark_line(point=True, color="#e74c3c").encode(
                 y=alt.Y('Répétitions:Q', axis=alt.Axis(titleColor="#e74c3c")),
@@ -382,293 +457,191 @@ def afficher_tableau_simple(df, colonnes_utiles=None):
         st.info("Aucune donnée.")
 
 # ==============================================================================
-# 6. VISUEL PHQ-9
+# 6. ÉCHELLES CLINIQUES (PHQ-9, GAD-7, ISI, PEG, WSAS, WHO-5)
 # ==============================================================================
-def afficher_phq9(df_phq, current_user_id):
-    if not df_phq.empty:
-        # A. TABLEAU
-        df_display = df_phq.copy()
-        if "Patient" in df_display.columns:
-            df_display["Patient"] = str(current_user_id)
-        
-        st.dataframe(
-            df_display.sort_values(by="Date", ascending=False),
-            use_container_width=True,
-            hide_index=True
-        )
-        st.divider()
-
-        # B. GRAPHIQUE
-        df_chart = df_phq.copy()
-        df_chart["Date_Obj"] = pd.to_datetime(df_chart["Date"], errors='coerce')
-        
-        # Nettoyage Score
-        if "Score Total" in df_chart.columns:
-            df_chart["Score Total"] = pd.to_numeric(df_chart["Score Total"], errors='coerce')
-            df_chart = df_chart.dropna(subset=["Date_Obj", "Score Total"])
+# Un seul moteur pour toutes les échelles : chacune n'est qu'une entrée du registre.
+# Ajouter une échelle = ajouter une entrée (et un afficher_xxx d'une ligne si une page l'importe).
+#
+# Clés d'une entrée :
+#   nom, titre, couleur        : libellé, titre du graphique, couleur de la courbe
+#   colonne, domaine           : colonne du score et bornes de l'axe
+#   infobulle                  : colonnes affichées au survol (celles absentes sont ignorées)
+#   bandes                     : (début, fin, libellé, couleur) -> zones de sévérité en fond + interprétation
+#   seuils                     : (valeur, couleur) -> ligne pointillée horizontale
+#   aide, notes                : titre de l'encadré d'interprétation, lignes ajoutées après les bandes
+
+ECHELLES = {
+    "PHQ9": {
+        "nom": "PHQ-9", "titre": "📉 Évolution du Score (0-27)", "couleur": "#E74C3C",
+        "colonne": "Score Total", "domaine": (0, 27), "infobulle": ["Date", "Score Total", "Sévérité"],
+        "bandes": [
+            (0, 4, "Dépression minimale", "#2ECC71"), (5, 9, "Dépression légère", "#F1C40F"),
+            (10, 14, "Dépression modérée", "#E67E22"), (15, 19, "Dépression modérément sévère", "#E74C3C"),
+            (20, 27, "Dépression sévère", "#8E0000"),
+        ],
+        "aide": "ℹ️ Interprétation des scores",
+    },
+    "GAD7": {
+        "nom": "GAD-7", "titre": "📉 Niveau d'Anxiété (0-21)", "couleur": "#1ABC9C",
+        "colonne": "Score Total", "domaine": (0, 21), "infobulle": ["Date", "Score Total", "Sévérité"],
+        "bandes": [
+            (0, 4, "Anxiété minimale", "#2ECC71"), (5, 9, "Anxiété légère", "#F1C40F"),
+            (10, 14, "Anxiété modérée", "#E67E22"), (15, 21, "Anxiété sévère", "#E74C3C"),
+        ],
+        "aide": "ℹ️ Interprétation des scores GAD-7",
+    },
+    "ISI": {
+        "nom": "ISI", "titre": "📉 Sévérité de l'Insomnie (0-28)", "couleur": "#4B0082",
+        "colonne": "Score Total", "domaine": (0, 28), "infobulle": ["Date", "Score Total", "Sévérité"],
+        "bandes": [
+            (0, 7, "Absence d'insomnie", "#2ECC71"), (8, 14, "Insomnie sub-clinique (légère)", "#F1C40F"),
+            (15, 21, "Insomnie clinique (modérée)", "#E67E22"), (22, 28, "Insomnie clinique (sévère)", "#E74C3C"),
+        ],
+        "aide": "ℹ️ Interprétation des scores ISI",
+    },
+    "PEG": {
+        "nom": "PEG", "titre": "📉 Impact de la Douleur (0-10)", "couleur": "#D35400",
+        "colonne": "Score Moyen", "domaine": (0, 10), "titre_axe": "Score (Moyenne)", "format": ".1f",
+        "infobulle": ["Date", "Score Moyen", "Interprétation"],
+        "aide": "ℹ️ À propos du score PEG",
+        "notes": [
+            "Le score est la **moyenne** des 3 questions (sur 10).",
+            "Plus le score est élevé, plus l'impact de la douleur sur la vie est important.",
+            "Une diminution de **30%** (ou environ 2-3 points) est souvent considérée comme une amélioration clinique significative.",
+        ],
+    },
+    "WSAS": {
+        "nom": "WSAS", "titre": "📉 Impact sur la vie quotidienne (0-40)", "couleur": "#8E44AD",
+        "colonne": "Score Total", "domaine": (0, 40), "infobulle": ["Date", "Score Total", "Sévérité"],
+        "bandes": [
+            (0, 9, "Impact faible (Sub-clinique)", "#2ECC71"), (10, 20, "Impact fonctionnel significatif", "#E67E22"),
+            (21, 40, "Impact fonctionnel sévère", "#E74C3C"),
+        ],
+        "aide": "ℹ️ Interprétation WSAS",
+    },
+    "WHO5": {
+        "nom": "WHO-5", "titre": "🌿 Indice de Bien-être (0-100)", "couleur": "#27AE60", "epaisseur": 3,
+        "colonne": "Score Pourcent", "domaine": (0, 100), "titre_axe": "Bien-être (%)",
+        "infobulle": ["Date", "Score Pourcent"],
+        "seuils": [(50, "red")],  # Dépistage dépression
+        "aide": "ℹ️ Interprétation WHO-5",
+        "notes": [
+            "**100 :** Bien-être maximal possible.",
+            "**< 50 :** Score faible, suggère un risque de dépression.",
+            "**≤ 28 :** Score très faible, probabilité élevée de dépression.",
+            "*Une augmentation de 10 points est considérée comme une amélioration significative.*",
+        ],
+    },
+}
+
+# Graphiques déjà construits : (échelle, empreinte des données) -> graphique Altair.
+# Passer d'une échelle à l'autre (ou un simple rerun) ne reconstruit rien si les données n'ont pas changé.
+MAX_GRAPHIQUES = 64
+_GRAPHIQUES = OrderedDict()
+_VERROU_GRAPHIQUES = threading.Lock()
+
+def _empreinte(df, colonnes):
+    """Empreinte des colonnes utilisées par le graphique (change dès qu'une valeur change)."""
+    valeurs = pd.util.hash_pandas_object(df[colonnes], index=False).values
+    return hashlib.sha1(valeurs.tobytes()).hexdigest()
+
+def _preparer_echelle(df, config, infobulle):
+    """Dates et scores convertis en une passe, lignes inexploitables retirées, triées par date."""
+    colonne = config["colonne"]
+    df_chart = df[infobulle].assign(
+        Date_Obj=colonne_dates(df["Date"]),
+        **{colonne: en_nombres(df[colonne])}
+    )
+    return reduire_points(df_chart.dropna(subset=["Date_Obj", colonne]).sort_values("Date_Obj"), "Date_Obj", colonne)
+
+def _construire_graphique(df_chart, config, infobulle):
+    colonne = config["colonne"]
+    bas, haut = config["domaine"]
+    tooltip = [alt.Tooltip(c, format=config["format"]) if c == colonne and "format" in config else c for c in infobulle]
+
+    courbe = alt.Chart(df_chart).mark_line(point=True, color=config["couleur"], strokeWidth=config.get("epaisseur", 2)).encode(
+        x=alt.X('Date_Obj:T', axis=alt.Axis(format='%d/%m'), title="Date"),
+        y=alt.Y(f'{colonne}:Q', scale=alt.Scale(domain=[bas, haut]), title=config.get("titre_axe", colonne)),
+        tooltip=tooltip
+    )
+    couches = []
+    bandes = config.get("bandes", [])
+    if bandes:
+        # Chaque zone va de son début au début de la suivante (pas de trou entre 4 et 5)
+        zones = pd.DataFrame([
+            {"debut": debut, "fin": bandes[i + 1][0] if i + 1 < len(bandes) else haut, "Zone": libelle, "couleur": couleur}
+            for i, (debut, _, libelle, couleur) in enumerate(bandes)
+        ])
+        couches.append(alt.Chart(zones).mark_rect(opacity=0.08).encode(
+            y='debut:Q', y2='fin:Q', color=alt.Color('couleur:N', scale=None), tooltip=['Zone']
+        ))
+    for valeur, couleur in config.get("seuils", []):
+        couches.append(alt.Chart(pd.DataFrame({'y': [valeur]})).mark_rule(color=couleur, strokeDash=[5, 5]).encode(y='y'))
+    return alt.layer(*couches, courbe).interactive()
+
+def graphique_echelle(df, nom_echelle):
+    """Graphique Altair de l'échelle (mémorisé selon les données), None si aucun score exploitable."""
+    config = ECHELLES[nom_echelle]
+    infobulle = [c for c in dict.fromkeys(["Date", config["colonne"]] + config["infobulle"]) if c in df.columns]
+    cle = (nom_echelle, _empreinte(df, infobulle))
+    with _VERROU_GRAPHIQUES:
+        if cle in _GRAPHIQUES:
+            _GRAPHIQUES.move_to_end(cle)
+            return _GRAPHIQUES[cle]
+
+    df_chart = _preparer_echelle(df, config, infobulle)
+    graphique = _construire_graphique(df_chart, config, infobulle) if not df_chart.empty else None
+    with _VERROU_GRAPHIQUES:
+        _GRAPHIQUES[cle] = graphique
+        while len(_GRAPHIQUES) > MAX_GRAPHIQUES:
+            _GRAPHIQUES.popitem(last=False)
+    return graphique
+
+def afficher_echelle(nom_echelle, df, current_user_id):
+    """Tableau des passations, courbe du score et encadré d'interprétation d'une échelle du registre."""
+    config = ECHELLES[nom_echelle]
+    if df.empty:
+        st.info(f"Aucune donnée {config['nom']}.")
+        return
+
+    # A. TABLEAU
+    df_display = df.assign(Patient=str(current_user_id)) if "Patient" in df.columns else df
+    st.dataframe(
+        df_display.sort_values(by="Date", ascending=False),
+        use_container_width=True,
+        hide_index=True
+    )
+    st.divider()
+
+    # B. GRAPHIQUE
+    if config["colonne"] not in df.columns or "Date" not in df.columns:
+        st.warning("Données de score manquantes.")
+        return
+
+    st.subheader(config["titre"])
+    graphique = graphique_echelle(df, nom_echelle)
+    if graphique is not None:
+        st.altair_chart(graphique, use_container_width=True)
+
+    lignes = [f"* **{debut}-{fin} :** {libelle}" for debut, fin, libelle, _ in config.get("bandes", [])]
+    lignes += [f"* {note}" for note in config.get("notes", [])]
+    with st.expander(config["aide"]):
+        st.markdown("\n".join(lignes))
 
-            st.subheader("📉 Évolution du Score (0-27)")
-            
-            # Graphique avec zones de sévérité (Optionnel, ici simple ligne)
-            c_phq = alt.Chart(df_chart).mark_line(point=True, color="#E74C3C").encode(
-                x=alt.X('Date_Obj:T', axis=alt.Axis(format='%d/%m'), title="Date"),
-                y=alt.Y('Score Total:Q', scale=alt.Scale(domain=[0, 27])),
-                tooltip=['Date', 'Score Total', 'Sévérité']
-            ).interactive()
-            
-            st.altair_chart(c_phq, use_container_width=True)
-            
-            with st.expander("ℹ️ Interprétation des scores"):
-                st.markdown("""
-                * **0-4 :** Dépression minimale 
-                * **5-9 :** Dépression légère
-                * **10-14 :** Dépression modérée
-                * **15-19 :** Dépression modérément sévère
-                * **20-27 :** Dépression sévère
-                """)
-        else:
-            st.warning("Colonne 'Score Total' manquante.")
-    else:
-        st.info("Aucune donnée PHQ-9.")
+def afficher_phq9(df_phq, current_user_id):
+    afficher_echelle("PHQ9", df_phq, current_user_id)
 
-# ==============================================================================
-# 7. VISUEL GAD-7 (ANXIÉTÉ)
-# ==============================================================================
 def afficher_gad7(df_gad, current_user_id):
-    if not df_gad.empty:
-        # A. TABLEAU
-        df_display = df_gad.copy()
-        if "Patient" in df_display.columns:
-            df_display["Patient"] = str(current_user_id)
-        
-        st.dataframe(
-            df_display.sort_values(by="Date", ascending=False),
-            use_container_width=True,
-            hide_index=True
-        )
-        st.divider()
-
-        # B. GRAPHIQUE
-        df_chart = df_gad.copy()
-        df_chart["Date_Obj"] = pd.to_datetime(df_chart["Date"], errors='coerce')
-        
-        if "Score Total" in df_chart.columns:
-            df_chart["Score Total"] = pd.to_numeric(df_chart["Score Total"], errors='coerce')
-            df_chart = df_chart.dropna(subset=["Date_Obj", "Score Total"])
+    afficher_echelle("GAD7", df_gad, current_user_id)
 
-            st.subheader("📉 Niveau d'Anxiété (0-21)")
-            
-            # Graphique (Couleur Teal pour l'anxiété)
-            c_gad = alt.Chart(df_chart).mark_line(point=True, color="#1ABC9C").encode(
-                x=alt.X('Date_Obj:T', axis=alt.Axis(format='%d/%m'), title="Date"),
-                y=alt.Y('Score Total:Q', scale=alt.Scale(domain=[0, 21])),
-                tooltip=['Date', 'Score Total', 'Sévérité']
-            ).interactive()
-            
-            st.altair_chart(c_gad, use_container_width=True)
-            
-            with st.expander("ℹ️ Interprétation des scores GAD-7"):
-                st.markdown("""
-                * **0-4 :** Anxiété minimale
-                * **5-9 :** Anxiété légère
-                * **10-14 :** Anxiété modérée
-                * **15-21 :** Anxiété sévère
-                """)
-        else:
-            st.warning("Données de score manquantes.")
-    else:
-        st.info("Aucune donnée GAD-7.")
-
-# ==============================================================================
-# 8. VISUEL ISI (INSOMNIE)
-# ==============================================================================
 def afficher_isi(df_isi, current_user_id):
-    if not df_isi.empty:
-        # A. TABLEAU
-        df_display = df_isi.copy()
-        if "Patient" in df_display.columns:
-            df_display["Patient"] = str(current_user_id)
-        
-        st.dataframe(
-            df_display.sort_values(by="Date", ascending=False),
-            use_container_width=True,
-            hide_index=True
-        )
-        st.divider()
+    afficher_echelle("ISI", df_isi, current_user_id)
 
-        # B. GRAPHIQUE
-        df_chart = df_isi.copy()
-        df_chart["Date_Obj"] = pd.to_datetime(df_chart["Date"], errors='coerce')
-        
-        if "Score Total" in df_chart.columns:
-            df_chart["Score Total"] = pd.to_numeric(df_chart["Score Total"], errors='coerce')
-            df_chart = df_chart.dropna(subset=["Date_Obj", "Score Total"])
-
-            st.subheader("📉 Sévérité de l'Insomnie (0-28)")
-            
-            # Graphique (Couleur Indigo)
-            c_isi = alt.Chart(df_chart).mark_line(point=True, color="#4B0082").encode(
-                x=alt.X('Date_Obj:T', axis=alt.Axis(format='%d/%m'), title="Date"),
-                y=alt.Y('Score Total:Q', scale=alt.Scale(domain=[0, 28])),
-                tooltip=['Date', 'Score Total', 'Sévérité']
-            ).interactive()
-            
-            st.altair_chart(c_isi, use_container_width=True)
-            
-            with st.expander("ℹ️ Interprétation des scores ISI"):
-                st.markdown("""
-                * **0-7 :** Absence d'insomnie
-                * **8-14 :** Insomnie sub-clinique (légère)
-                * **15-21 :** Insomnie clinique (modérée)
-                * **22-28 :** Insomnie clinique (sévère)
-                """)
-        else:
-            st.warning("Données de score manquantes.")
-    else:
-        st.info("Aucune donnée ISI.")
-
-# ==============================================================================
-# 9. VISUEL PEG (DOULEUR)
-# ==============================================================================
 def afficher_peg(df_peg, current_user_id):
-    if not df_peg.empty:
-        # A. TABLEAU
-        df_display = df_peg.copy()
-        if "Patient" in df_display.columns:
-            df_display["Patient"] = str(current_user_id)
-        
-        st.dataframe(
-            df_display.sort_values(by="Date", ascending=False),
-            use_container_width=True,
-            hide_index=True
-        )
-        st.divider()
-
-        # B. GRAPHIQUE
-        df_chart = df_peg.copy()
-        df_chart["Date_Obj"] = pd.to_datetime(df_chart["Date"], errors='coerce')
-        
-        if "Score Moyen" in df_chart.columns:
-            df_chart["Score Moyen"] = pd.to_numeric(df_chart["Score Moyen"], errors='coerce')
-            df_chart = df_chart.dropna(subset=["Date_Obj", "Score Moyen"])
+    afficher_echelle("PEG", df_peg, current_user_id)
 
-            st.subheader("📉 Impact de la Douleur (0-10)")
-            
-            # Graphique (Couleur Orange/Rouge)
-            c_peg = alt.Chart(df_chart).mark_line(point=True, color="#D35400").encode(
-                x=alt.X('Date_Obj:T', axis=alt.Axis(format='%d/%m'), title="Date"),
-                y=alt.Y('Score Moyen:Q', scale=alt.Scale(domain=[0, 10]), title="Score (Moyenne)"),
-                tooltip=['Date', alt.Tooltip('Score Moyen', format='.1f'), 'Interprétation']
-            ).interactive()
-            
-            st.altair_chart(c_peg, use_container_width=True)
-            
-            with st.expander("ℹ️ À propos du score PEG"):
-                st.markdown("""
-                * Le score est la **moyenne** des 3 questions (sur 10).
-                * Plus le score est élevé, plus l'impact de la douleur sur la vie est important.
-                * Une diminution de **30%** (ou environ 2-3 points) est souvent considérée comme une amélioration clinique significative.
-                """)
-        else:
-            st.warning("Données de score manquantes.")
-    else:
-        st.info("Aucune donnée PEG.")
-
-# ==============================================================================
-# 10. VISUEL WSAS (IMPACT FONCTIONNEL)
-# ==============================================================================
 def afficher_wsas(df_wsas, current_user_id):
-    if not df_wsas.empty:
-        # A. TABLEAU
-        df_display = df_wsas.copy()
-        if "Patient" in df_display.columns:
-            df_display["Patient"] = str(current_user_id)
-        
-        st.dataframe(
-            df_display.sort_values(by="Date", ascending=False),
-            use_container_width=True,
-            hide_index=True
-        )
-        st.divider()
+    afficher_echelle("WSAS", df_wsas, current_user_id)
 
-        # B. GRAPHIQUE
-        df_chart = df_wsas.copy()
-        df_chart["Date_Obj"] = pd.to_datetime(df_chart["Date"], errors='coerce')
-        
-        if "Score Total" in df_chart.columns:
-            df_chart["Score Total"] = pd.to_numeric(df_chart["Score Total"], errors='coerce')
-            df_chart = df_chart.dropna(subset=["Date_Obj", "Score Total"])
-
-            st.subheader("📉 Impact sur la vie quotidienne (0-40)")
-            
-            # Graphique (Couleur Violet)
-            c_wsas = alt.Chart(df_chart).mark_line(point=True, color="#8E44AD").encode(
-                x=alt.X('Date_Obj:T', axis=alt.Axis(format='%d/%m'), title="Date"),
-                y=alt.Y('Score Total:Q', scale=alt.Scale(domain=[0, 40])),
-                tooltip=['Date', 'Score Total', 'Sévérité']
-            ).interactive()
-            
-            st.altair_chart(c_wsas, use_container_width=True)
-            
-            with st.expander("ℹ️ Interprétation WSAS"):
-                st.markdown("""
-                * **0-9 :** Impact faible (Sub-clinique)
-                * **10-20 :** Impact fonctionnel significatif
-                * **21-40 :** Impact fonctionnel sévère
-                """)
-        else:
-            st.warning("Données de score manquantes.")
-    else:
-        st.info("Aucune donnée WSAS.")
-
-# ==============================================================================
-# 11. VISUEL WHO-5 (BIEN-ÊTRE)
-# ==============================================================================
 def afficher_who5(df_who, current_user_id):
-    if not df_who.empty:
-        # A. TABLEAU
-        df_display = df_who.copy()
-        if "Patient" in df_display.columns:
-            df_display["Patient"] = str(current_user_id)
-        
-        st.dataframe(
-            df_display.sort_values(by="Date", ascending=False),
-            use_container_width=True,
-            hide_index=True
-        )
-        st.divider()
-
-        # B. GRAPHIQUE
-        df_chart = df_who.copy()
-        df_chart["Date_Obj"] = pd.to_datetime(df_chart["Date"], errors='coerce')
-        
-        if "Score Pourcent" in df_chart.columns:
-            df_chart["Score Pourcent"] = pd.to_numeric(df_chart["Score Pourcent"], errors='coerce')
-            df_chart = df_chart.dropna(subset=["Date_Obj", "Score Pourcent"])
-
-            st.subheader("🌿 Indice de Bien-être (0-100)")
-            
-            # Ligne principale (Bien-être)
-            base = alt.Chart(df_chart).encode(x=alt.X('Date_Obj:T', axis=alt.Axis(format='%d/%m'), title="Date"))
-            
-            line = base.mark_line(point=True, color="#27AE60", strokeWidth=3).encode(
-                y=alt.Y('Score Pourcent:Q', scale=alt.Scale(domain=[0, 100]), title="Bien-être (%)"),
-                tooltip=['Date', 'Score Pourcent']
-            )
-            
-            # Ligne de seuil (50) - Dépistage dépression
-            threshold = alt.Chart(pd.DataFrame({'y': [50]})).mark_rule(color='red', strokeDash=[5, 5]).encode(y='y')
-            
-            st.altair_chart((line + threshold).interactive(), use_container_width=True)
-            
-            with st.expander("ℹ️ Interprétation WHO-5"):
-                st.markdown("""
-                * **100 :** Bien-être maximal possible.
-                * **< 50 :** Score faible, suggère un risque de dépression.
-                * **≤ 28 :** Score très faible, probabilité élevée de dépression.
-                * *Une augmentation de 10 points est considérée comme une amélioration significative.*
-                """)
-        else:
-            st.warning("Données de score manquantes.")
-    else:
-        st.info("Aucune donnée WHO-5.")
\ No newline at end of file
+    afficher_echelle("WHO5", df_who, current_user_id)